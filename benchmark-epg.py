@@ -0,0 +1,314 @@
+"""Benchmark offline de las etapas calientes del merger (parseo, merge, mappings y serialización).
+
+Usa los XML del repo (dish.xml, mvshub.xml, openepg.xml, nxt-plus.xml) y, para ver cómo escala,
+versiones sintéticas con los canales y programas replicados N veces (IDs con sufijo "~k").
+Cada etapa corre en un subproceso propio para que el pico de RSS no arrastre el de etapas anteriores;
+las etapas que necesitan datos previos (p. ej. serializar necesita el merge) los preparan sin medirlos.
+
+Uso:
+    python benchmark-epg.py                          # escalas 1, 10 y 100
+    python benchmark-epg.py --escalas 1,10 --repeticiones 3
+    python benchmark-epg.py --comparar benchmark-anterior.json
+    python benchmark-epg.py --backends etree,lxml      # mismo benchmark con cada backend XML
+
+Los resultados se guardan como JSON (--salida) para poder comparar ejecuciones. Con varios backends
+(ver xml_backend.py) los resultados van por backend y la tabla muestra la diferencia contra el primero.
+La escala 100 construye el documento completo en memoria y necesita varios GB de RAM; si el
+subproceso falla, la etapa queda registrada con su error y el resto sigue.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from xmltv_writer import XMLTVWriter
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+ARCHIVOS_REPO = ['dish.xml', 'mvshub.xml', 'openepg.xml', 'nxt-plus.xml']
+ETAPAS = ['parseo', 'merge', 'mappings', 'serializacion']
+ESCALAS_POR_DEFECTO = '1,10,100'
+
+
+def cargar_merger():
+    """Importa epg-merger.py (el guion no es importable por nombre)."""
+    sys.path.insert(0, DIRECTORIO)
+    spec = importlib.util.spec_from_file_location('epg_merger', os.path.join(DIRECTORIO, 'epg-merger.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def rss_pico_mb():
+    """Pico de RSS del proceso actual en MB (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+# --- Datos sintéticos ---------------------------------------------------------------------------
+
+def generar_escalado(origen, destino, factor):
+    """Escribe `destino` con los canales y programas de `origen` repetidos `factor` veces.
+
+    La réplica 0 conserva los IDs originales; la réplica k usa "<id>~k" en channel@id y programme@channel,
+    así el merge las trata como canales distintos (mismo volumen que tendría un feed N veces mayor).
+    """
+    tmp = destino + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        with XMLTVWriter(f, estilo='etree', indent=None) as writer:
+            for k in range(factor):
+                contexto = ET.iterparse(origen, events=('start', 'end'))
+                _, root = next(contexto)
+                for evento, elem in contexto:
+                    if evento != 'end' or elem.tag not in ('channel', 'programme'):
+                        continue
+                    if k:
+                        atributo = 'id' if elem.tag == 'channel' else 'channel'
+                        elem.set(atributo, f"{elem.get(atributo)}~{k}")
+                    writer.write(elem)
+                    root.remove(elem)
+    os.replace(tmp, destino)
+
+
+def preparar_datos(escala, directorio_datos):
+    """Rutas de los archivos para una escala (1 = los del repo); genera los sintéticos si faltan."""
+    if escala == 1:
+        return [os.path.join(DIRECTORIO, nombre) for nombre in ARCHIVOS_REPO]
+    rutas = []
+    for nombre in ARCHIVOS_REPO:
+        origen = os.path.join(DIRECTORIO, nombre)
+        destino = os.path.join(directorio_datos, f"x{escala}-{nombre}")
+        if not os.path.exists(destino) or os.path.getmtime(destino) < os.path.getmtime(origen):
+            print(f"Generando {destino}...")
+            generar_escalado(origen, destino, escala)
+        rutas.append(destino)
+    return rutas
+
+
+# --- Etapas (se ejecutan dentro del subproceso) --------------------------------------------------
+
+def _merge(m, archivos, mapping):
+    # En el benchmark cada "URL" es una ruta local: se lee directo del disco y sin filtros por URL
+    m.local_filename_for = lambda url: url
+    return m.merge_epg_feeds(archivos, mapping)
+
+
+def ejecutar_etapa(etapa, archivos):
+    """Corre una etapa y devuelve sus métricas. Lo que la etapa necesita de antes no se cronometra."""
+    # Sin cachés ni ventana: cada ejecución parsea todo y el resultado no depende de la fecha
+    os.environ['EPG_CACHE_DIR'] = ''
+    os.environ['EPG_FEED_CACHE_DIR'] = ''
+    os.environ['EPG_VENTANA_ATRAS'] = ''
+    os.environ['EPG_VENTANA_ADELANTE'] = ''
+    m = cargar_merger()
+    import xml_backend
+    from channel_mapping import ChannelMapping
+
+    with open(os.path.join(DIRECTORIO, 'mappings.json'), 'r', encoding='utf-8') as f:
+        mappings = json.load(f)
+
+    programas = 0
+    rss_antes = rss_pico_mb()
+    if etapa == 'parseo':
+        inicio = time.perf_counter()
+        for ruta in archivos:
+            with open(ruta, 'rb') as f:
+                _, progs = m.recolectar_feed(f, None)
+            programas += len(progs)
+        duracion = time.perf_counter() - inicio
+    elif etapa == 'merge':
+        inicio = time.perf_counter()
+        tv = _merge(m, archivos, ChannelMapping(mappings))
+        duracion = time.perf_counter() - inicio
+        programas = len(tv.findall('programme'))
+    elif etapa == 'mappings':
+        tv = _merge(m, archivos, ChannelMapping())
+        rss_antes = rss_pico_mb()
+        mapping = ChannelMapping(mappings)
+        inicio = time.perf_counter()
+        for channel in tv.iter('channel'):
+            mapping.canal(channel)
+        for programme in tv.iter('programme'):
+            mapping.programa(programme)
+            programas += 1
+        duracion = time.perf_counter() - inicio
+    elif etapa == 'serializacion':
+        tv = _merge(m, archivos, ChannelMapping(mappings))
+        rss_antes = rss_pico_mb()
+        programas = len(tv.findall('programme'))
+        with tempfile.TemporaryDirectory() as tmp:
+            inicio = time.perf_counter()
+            m.write_xmltv(tv, os.path.join(tmp, 'mxepg.xml'))
+            duracion = time.perf_counter() - inicio
+    else:
+        raise ValueError(f"Etapa desconocida: {etapa}")
+
+    rss_despues = rss_pico_mb()
+    return {
+        'segundos': round(duracion, 4),
+        'programas': programas,
+        'programas_por_segundo': round(programas / duracion, 1) if duracion > 0 else None,
+        'rss_pico_mb': round(rss_despues, 1),
+        'rss_incremento_mb': round(rss_despues - rss_antes, 1),
+        'backend': xml_backend.NOMBRE,  # El que se usó de verdad (auto -> lxml o etree)
+    }
+
+
+def medir_en_subproceso(etapa, archivos, backend='auto'):
+    """Lanza `etapa` en un intérprete nuevo (con EPG_XML_BACKEND=backend) y devuelve sus métricas (o el error)."""
+    comando = [sys.executable, os.path.abspath(__file__), '--etapa', etapa, '--archivos', *archivos]
+    entorno = dict(os.environ, EPG_XML_BACKEND=backend)
+    proceso = subprocess.run(comando, capture_output=True, text=True, cwd=DIRECTORIO, env=entorno)
+    if proceso.returncode != 0:
+        return {'error': proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else 'fallo'}
+    # La última línea es el JSON de métricas; el resto son los print del merger
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+# --- Informe ------------------------------------------------------------------------------------
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=DIRECTORIO).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def mediana(valores):
+    valores = sorted(valores)
+    mitad = len(valores) // 2
+    return valores[mitad] if len(valores) % 2 else (valores[mitad - 1] + valores[mitad]) / 2
+
+
+def resumir(repeticiones):
+    """Combina las repeticiones de una etapa: mediana de tiempos y máximo de RSS."""
+    validas = [r for r in repeticiones if 'error' not in r]
+    if not validas:
+        return repeticiones[0]
+    segundos = mediana([r['segundos'] for r in validas])
+    programas = validas[0]['programas']
+    return {
+        'segundos': round(segundos, 4),
+        'segundos_min': min(r['segundos'] for r in validas),
+        'programas': programas,
+        'programas_por_segundo': round(programas / segundos, 1) if segundos > 0 else None,
+        'rss_pico_mb': max(r['rss_pico_mb'] for r in validas),
+        'rss_incremento_mb': max(r['rss_incremento_mb'] for r in validas),
+        'repeticiones': len(validas),
+        'backend': validas[0].get('backend'),
+    }
+
+
+def _variacion(r, previo):
+    if previo and 'segundos' in previo and previo['segundos'] and 'segundos' in r:
+        return f"{(r['segundos'] / previo['segundos'] - 1) * 100:+.1f}%"
+    return ''
+
+
+def imprimir_tabla(resultados, anterior=None):
+    """resultados: {backend: {escala: {etapa: métricas}}}. Compara con la ejecución anterior (mismo
+    backend) y, si hay varios backends, con el primero."""
+    backends = list(resultados)
+    base = backends[0]
+    columna_backends = f"  vs {base}" if len(backends) > 1 else ''
+    print(f"\n{'backend':<7} {'escala':>6} {'etapa':<14} {'seg':>9} {'prog/s':>11} {'RSS pico':>9} {'+RSS':>7}"
+          f"  vs anterior{columna_backends}")
+    for backend, por_escala in resultados.items():
+        for escala, etapas in por_escala.items():
+            for etapa, r in etapas.items():
+                if 'error' in r:
+                    print(f"{backend:<7} {escala:>6} {etapa:<14} ERROR: {r['error']}")
+                    continue
+                previo = (((anterior or {}).get(backend) or {}).get(escala) or {}).get(etapa)
+                comparacion = f"{_variacion(r, previo):>11}"
+                if backend != base:
+                    comparacion += f"  {_variacion(r, resultados[base].get(escala, {}).get(etapa)):>8}"
+                print(f"{backend:<7} {escala:>6} {etapa:<14} {r['segundos']:>9.3f} "
+                      f"{r['programas_por_segundo'] or 0:>11.0f} {r['rss_pico_mb']:>8.1f}M "
+                      f"{r['rss_incremento_mb']:>6.1f}M  {comparacion}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline del merger EPG.")
+    parser.add_argument('--escalas', default=ESCALAS_POR_DEFECTO,
+                        help=f"Factores de escala separados por coma (por defecto {ESCALAS_POR_DEFECTO}; 1 = archivos del repo).")
+    parser.add_argument('--etapas', default=','.join(ETAPAS),
+                        help=f"Etapas a medir (por defecto {','.join(ETAPAS)}).")
+    parser.add_argument('--repeticiones', type=int, default=1,
+                        help="Ejecuciones por etapa; se informa la mediana del tiempo.")
+    parser.add_argument('--datos', default=os.path.join(tempfile.gettempdir(), 'epg-benchmark'),
+                        help="Directorio para los XML sintéticos (se reutilizan entre ejecuciones).")
+    parser.add_argument('--salida', default=None,
+                        help="JSON de resultados (por defecto benchmark-<fecha>.json).")
+    parser.add_argument('--comparar', default=None, help="JSON de una ejecución anterior para comparar tiempos.")
+    parser.add_argument('--backends', default=os.environ.get('EPG_XML_BACKEND', 'auto'),
+                        help="Backends XML a medir separados por coma: auto, lxml, etree (por defecto "
+                             "EPG_XML_BACKEND o auto).")
+    # Uso interno: ejecutar una sola etapa e imprimir sus métricas
+    parser.add_argument('--etapa', help=argparse.SUPPRESS)
+    parser.add_argument('--archivos', nargs='*', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.etapa:
+        print(json.dumps(ejecutar_etapa(args.etapa, args.archivos)))
+        return
+
+    escalas = [int(e) for e in args.escalas.split(',') if e.strip()]
+    etapas = [e.strip() for e in args.etapas.split(',') if e.strip()]
+    desconocidas = set(etapas) - set(ETAPAS)
+    if desconocidas:
+        raise SystemExit(f"Etapas desconocidas: {sorted(desconocidas)} (usa {ETAPAS})")
+    backends = [b.strip().lower() for b in args.backends.split(',') if b.strip()]
+    if set(backends) - {'auto', 'lxml', 'etree'}:
+        raise SystemExit(f"Backends desconocidos: {backends} (usa auto, lxml o etree)")
+    os.makedirs(args.datos, exist_ok=True)
+
+    resultados = {backend: {} for backend in backends}
+    for escala in escalas:
+        archivos = preparar_datos(escala, args.datos)
+        tamaño = sum(os.path.getsize(r) for r in archivos)
+        print(f"Escala x{escala}: {len(archivos)} archivos, {tamaño / (1024 * 1024):.1f} MB")
+        for backend in backends:
+            resultados[backend][str(escala)] = {}
+            for etapa in etapas:
+                medidas = [medir_en_subproceso(etapa, archivos, backend) for _ in range(max(1, args.repeticiones))]
+                resultados[backend][str(escala)][etapa] = resumir(medidas)
+                print(f"  - [{backend}] {etapa}: {resultados[backend][str(escala)][etapa]}")
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            datos_anteriores = json.load(f)
+        anterior = datos_anteriores.get('resultados')
+        if 'backends' not in datos_anteriores:
+            # JSON de antes de medir por backend: se compara con el primero de esta ejecución
+            anterior = {backends[0]: anterior}
+    imprimir_tabla(resultados, anterior)
+
+    salida = args.salida or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump({
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit_actual(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'archivos': ARCHIVOS_REPO,
+            'backends': backends,
+            'resultados': resultados,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
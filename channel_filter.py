@@ -0,0 +1,174 @@
+"""Motor de filtrado de canales: compila una vez las reglas de una fuente y responde `id in filtro` en O(1).
+
+Sintaxis de reglas (cada entrada de la lista de FILTERS):
+- "12712"                    -> ID exacto (búsqueda en un set)
+- "I*.schedulesdirect.org"   -> glob (*, ?, [..]); "Sky Sports *" con un solo * final se trata como prefijo
+- "re:^Sky Sports \\d+$"      -> expresión regular (debe cubrir el ID completo)
+- "!regla"                   -> exclusión: cualquiera de las formas anteriores precedida de "!"
+
+Un ID pasa si coincide con alguna regla de inclusión (o no hay ninguna, solo exclusiones) y con
+ninguna de exclusión. Una lista vacía equivale a no filtrar.
+
+Las reglas por URL viven en filtros.json (ver cargar_filtros), compartido por epg-merger.py y los
+scripts que generan esas fuentes (fetchdish-28hrs.py filtra su propia lista antes de escribir dish.xml).
+"""
+import fnmatch
+import json
+import re
+
+ARCHIVO_FILTROS = 'filtros.json'
+
+_GLOB_CHARS = ('*', '?', '[')
+
+
+def _es_glob(regla):
+    return any(c in regla for c in _GLOB_CHARS)
+
+
+class _Reglas:
+    """Reglas de un mismo signo (inclusión o exclusión) compiladas."""
+
+    def __init__(self):
+        self.exactos = set()
+        self.prefijos = []
+        self.patrones = []  # (regla original, regex fuente ya convertida de glob)
+
+    def agregar(self, regla):
+        if regla.startswith('re:'):
+            patron = regla[3:]
+            try:
+                re.compile(patron)
+            except re.error as e:
+                raise ValueError(f"Regex inválida {regla!r}: {e}") from None
+            self.patrones.append((regla, patron))
+        elif _es_glob(regla):
+            cuerpo = regla[:-1]
+            if regla.endswith('*') and not _es_glob(cuerpo):
+                self.prefijos.append(cuerpo)
+            else:
+                self.patrones.append((regla, fnmatch.translate(regla)))
+        else:
+            self.exactos.add(regla)
+
+    def compilar(self):
+        self.exactos = frozenset(self.exactos)
+        self.prefijos = tuple(self.prefijos)
+        # Una sola regex con alternativas: un fullmatch por ID en lugar de uno por patrón
+        self.regex = re.compile('|'.join(f'(?:{p})' for _, p in self.patrones)) if self.patrones else None
+
+    def __bool__(self):
+        return bool(self.exactos or self.prefijos or self.regex)
+
+    def coincide(self, channel_id):
+        if channel_id in self.exactos:
+            return True
+        if self.prefijos and channel_id.startswith(self.prefijos):
+            return True
+        return self.regex is not None and self.regex.fullmatch(channel_id) is not None
+
+
+class ChannelFilter:
+    """Filtro compilado de una fuente.
+
+    - `channel_id in filtro` -> True si el canal se conserva (None nunca pasa).
+    - bool(filtro) -> False si no hay reglas (no filtrar).
+    - advertencias: problemas detectados al validar las reglas (comas dentro de un ID, duplicados...).
+    - sin_coincidencia(): reglas que no coincidieron con ningún canal visto desde la compilación.
+    """
+
+    def __init__(self, reglas, nombre=''):
+        self.nombre = nombre
+        self.reglas = tuple(reglas or ())
+        self.advertencias = []
+        self._incluir = _Reglas()
+        self._excluir = _Reglas()
+        self._cache = {}        # id -> bool, solo para IDs resueltos por prefijo/patrón
+        self._vistos = set()    # IDs que pasaron el filtro
+        vistas = set()
+        for regla in self.reglas:
+            if not isinstance(regla, str) or not regla.strip() or regla.strip() == '!':
+                raise ValueError(f"Regla vacía o no textual en el filtro de {nombre}: {regla!r}")
+            if regla != regla.strip():
+                self.advertencias.append(f"Regla con espacios al inicio/fin: {regla!r}")
+            if ',' in regla and not regla.startswith(('re:', '!re:')):
+                self.advertencias.append(f"Regla con coma (¿dos IDs pegados por una coma mal puesta?): {regla!r}")
+            if regla in vistas:
+                self.advertencias.append(f"Regla duplicada: {regla!r}")
+            vistas.add(regla)
+            if regla.startswith('!'):
+                self._excluir.agregar(regla[1:])
+            else:
+                self._incluir.agregar(regla)
+        self._incluir.compilar()
+        self._excluir.compilar()
+        self._solo_exactos = not (self._incluir.prefijos or self._incluir.regex or self._excluir)
+
+    def __bool__(self):
+        return bool(self._incluir or self._excluir)
+
+    def __contains__(self, channel_id):
+        if channel_id is None:
+            return False
+        if self._solo_exactos:
+            # Camino rápido (caso habitual): una búsqueda en un set
+            if channel_id in self._incluir.exactos:
+                self._vistos.add(channel_id)
+                return True
+            return False
+        resultado = self._cache.get(channel_id)
+        if resultado is None:
+            incluido = self._incluir.coincide(channel_id) if self._incluir else True
+            resultado = incluido and not self._excluir.coincide(channel_id)
+            self._cache[channel_id] = resultado
+        if resultado:
+            self._vistos.add(channel_id)
+        return resultado
+
+    def marcar_vistos(self, channel_ids):
+        """Registra IDs conservados sin pasar por el filtro (p. ej. resultados recargados de caché)."""
+        self._vistos.update(channel_ids)
+
+    def sin_coincidencia(self):
+        """Reglas de inclusión que no coincidieron con ningún canal conservado."""
+        pendientes = sorted(self._incluir.exactos - self._vistos)
+        for prefijo in self._incluir.prefijos:
+            if not any(v.startswith(prefijo) for v in self._vistos):
+                pendientes.append(prefijo + '*')
+        for regla, patron in self._incluir.patrones:
+            regex = re.compile(patron)
+            if not any(regex.fullmatch(v) for v in self._vistos):
+                pendientes.append(regla)
+        return pendientes
+
+    def describir(self):
+        """Resumen corto para logs."""
+        return (f"{len(self._incluir.exactos)} IDs, {len(self._incluir.prefijos)} prefijos, "
+                f"{len(self._incluir.patrones)} patrones, "
+                f"{len(self._excluir.exactos) + len(self._excluir.prefijos) + len(self._excluir.patrones)} exclusiones")
+
+
+def _regla_de(entrada):
+    """Regla de una entrada de filtros.json: la cadena tal cual o el "id" de {"id": ..., "nota": ...}."""
+    if isinstance(entrada, dict) and isinstance(entrada.get('id'), str):
+        return entrada['id']
+    return entrada
+
+
+def cargar_filtros(archivo_filtros=ARCHIVO_FILTROS):
+    """Lee filtros.json: {url: [reglas]} y devuelve las reglas como cadenas. Cada regla puede ser una
+    cadena o un objeto {"id": regla, "nota": "nombre del canal"}; la nota es solo documentación.
+    Si falta o no es válido avisa y devuelve {} (sin filtrar)."""
+    try:
+        with open(archivo_filtros, 'r', encoding='utf-8') as f:
+            filtros = json.load(f)
+    except FileNotFoundError:
+        print(f"Advertencia: No se encontró {archivo_filtros}. No se filtrará ningún canal.")
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"Error: {archivo_filtros} no es un JSON válido ({e}). No se filtrará ningún canal.")
+        return {}
+    if not isinstance(filtros, dict) or not all(isinstance(reglas, list) for reglas in filtros.values()):
+        print(f"Error: {archivo_filtros} debe ser un objeto {{url: [reglas]}}. No se filtrará ningún canal.")
+        return {}
+    # Las entradas que no son cadena ni {"id": ...} llegan tal cual a ChannelFilter, que las rechaza
+    return {url: [_regla_de(entrada) for entrada in reglas] for url, reglas in filtros.items()}
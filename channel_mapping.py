@@ -0,0 +1,95 @@
+"""Tabla de mappings de canales aplicada en línea durante el merge.
+
+Cada entrada de mappings.json se indexa por el ID del canal tal como llega en su feed:
+- "306": "Maria Vision"                          -> solo cambia el display-name (formato original)
+- "306": {"name": "Maria Vision"}                -> igual, en forma de objeto
+- "I123.json.schedulesdirect.org": {"id": "306"} -> remapea el ID del canal y el channel de sus programas
+- "306": {"id": "maria.mx", "name": "Maria Vision"} -> ambas cosas
+- "306": {"group": "Religiosos"}                 -> grupo del canal para la salida fragmentada (shards.py)
+
+Si varios IDs de origen apuntan al mismo "id" destino, los canales se fusionan en uno solo: se conserva
+el primero que llega (mismo criterio que el merge por ID) y los programas de todos quedan en el destino,
+donde la resolución de solapes elimina los repetidos.
+"""
+
+CLAVES_VALIDAS = ('id', 'name', 'group')
+
+
+class ChannelMapping:
+    """Mappings compilados. canal() y programa() modifican el elemento en sitio y devuelven el ID final."""
+
+    def __init__(self, mappings=None):
+        self.nombres = {}   # id origen -> display-name deseado
+        self.ids = {}       # id origen -> id destino (solo si cambia)
+        self.grupos = {}    # id final -> grupo
+        self.advertencias = []
+        for origen, valor in (mappings or {}).items():
+            if isinstance(valor, str):
+                self.nombres[origen] = valor
+            elif isinstance(valor, dict):
+                desconocidas = sorted(set(valor) - set(CLAVES_VALIDAS))
+                if desconocidas:
+                    self.advertencias.append(f"Claves desconocidas en el mapping de {origen}: {desconocidas}")
+                if valor.get('name'):
+                    self.nombres[origen] = valor['name']
+                if valor.get('id') and valor['id'] != origen:
+                    self.ids[origen] = valor['id']
+                if valor.get('group'):
+                    self.grupos[valor.get('id') or origen] = valor['group']
+            else:
+                self.advertencias.append(f"Mapping no válido para {origen}: {valor!r}")
+        # Un destino que es a su vez origen remapeado dejaría el resultado dependiendo del orden
+        for origen, destino in self.ids.items():
+            if destino in self.ids:
+                self.advertencias.append(f"Mapping encadenado {origen} -> {destino} -> {self.ids[destino]}: "
+                                         f"se usa {destino}")
+        self.renombrados = 0
+        self.remapeados = 0
+        self.fusionados = 0
+        self.sin_mapping = 0
+        self.programas_remapeados = 0
+
+    def __bool__(self):
+        return bool(self.nombres or self.ids)
+
+    def id_final(self, channel_id):
+        """ID con el que quedará un canal tras el mapping (sin tocar el elemento ni los contadores)."""
+        return self.ids.get(channel_id, channel_id)
+
+    def canal(self, channel):
+        """Aplica el mapping a un <channel> y devuelve su ID final. Solo para canales que se conservan:
+        los contadores del resumen cuentan cada llamada (usar id_final() para decidir antes)."""
+        channel_id = channel.get('id')
+        if channel_id is None:
+            return None
+        nombre = self.nombres.get(channel_id)
+        destino = self.ids.get(channel_id)
+        if nombre is None and destino is None:
+            self.sin_mapping += 1
+            return channel_id
+        if nombre is not None:
+            # Dejar un solo display-name con el nombre deseado
+            for dn in channel.findall('display-name'):
+                channel.remove(dn)
+            # makeelement: vale tanto para elementos de ElementTree como de lxml (ver xml_backend.py)
+            display_name = channel.makeelement('display-name', {})
+            display_name.text = nombre
+            channel.append(display_name)
+            self.renombrados += 1
+        if destino is not None:
+            channel.set('id', destino)
+            self.remapeados += 1
+            return destino
+        return channel_id
+
+    def programa(self, programme):
+        """Reescribe programme@channel si su canal fue remapeado."""
+        destino = self.ids.get(programme.get('channel'))
+        if destino is not None:
+            programme.set('channel', destino)
+            self.programas_remapeados += 1
+
+    def resumen(self):
+        return (f"Mappings: {self.renombrados} canales renombrados, {self.remapeados} IDs remapeados, "
+                f"{self.fusionados} alias fusionados, {self.programas_remapeados} programas reasignados, "
+                f"{self.sin_mapping} canales sin mapping.")
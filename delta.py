@@ -0,0 +1,301 @@
+"""Delta entre dos guías XMLTV consecutivas, a nivel de canal y programa.
+
+Cada canal se identifica por su id y cada programa por channel + start; de cada uno se guarda una
+huella (SHA-256 del contenido normalizado, sin depender de la sangría ni del orden de atributos).
+Comparando las huellas de la guía nueva con las de la anterior salen los añadidos, eliminados y
+modificados, y solo esos viajan en el delta (con su XML), junto con un resumen por fuente.
+
+- El merger (--delta) guarda las huellas de su última salida en <base>.delta-estado.json y escribe
+  <base>.delta.json junto al XML completo. Si no hay estado (o no corresponde al XML que hay en disco)
+  las huellas se sacan del XML anterior antes de sobrescribirlo.
+- Un consumidor con la guía anterior aplica el delta con aplicar(); 'base' y 'version' del delta son
+  huellas de la guía completa, así que se puede comprobar que el parche corresponde a su copia y que
+  el resultado es la guía nueva (mismo contenido; los programas quedan por canal e inicio).
+
+Uso desde la línea de comandos (sirve para cualquier XMLTV: dish.xml, mvshub.xml...):
+    python delta.py calcular anterior.xml nuevo.xml cambios.json
+    python delta.py aplicar anterior.xml cambios.json resultado.xml
+"""
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import xml_backend
+from feed_parser import abrir_descomprimido
+from xmltv_time import parse_xmltv_time
+from xmltv_writer import XMLTVWriter
+
+FORMATO = 1
+SIN_FUENTE = 'desconocida'
+
+
+def clave(elem):
+    """'id' para un <channel>, 'channel|start' para un <programme>."""
+    if elem.tag == 'channel':
+        return elem.get('id')
+    return f"{elem.get('channel')}|{elem.get('start')}"
+
+
+def _canonico(elem, h):
+    h.update(elem.tag.encode('utf-8'))
+    for nombre, valor in sorted(elem.items()):
+        h.update(f"\0{nombre}={valor}".encode('utf-8'))
+    h.update(b'\1' + (elem.text or '').strip().encode('utf-8'))
+    for hijo in elem:
+        h.update(b'\2')
+        _canonico(hijo, h)
+        h.update(b'\3' + (hijo.tail or '').strip().encode('utf-8'))
+
+
+def huella(elem):
+    """Huella del contenido: igual para el mismo elemento con otra sangría u orden de atributos."""
+    h = hashlib.sha256()
+    _canonico(elem, h)
+    return h.hexdigest()[:16]
+
+
+def _xml(elem):
+    """XML del elemento sin su tail (el formato lo pone el escritor al aplicar)."""
+    tail, elem.tail = elem.tail, None
+    try:
+        return xml_backend.tostring(elem)
+    finally:
+        elem.tail = tail
+
+
+def version(estado):
+    """Huella de una guía completa a partir de las huellas de sus elementos."""
+    h = hashlib.sha256()
+    for tipo in ('canales', 'programas'):
+        for k in sorted(estado[tipo]):
+            h.update(f"{tipo}\0{k}\0{estado[tipo][k][0]}\n".encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def _elementos_archivo(ruta):
+    """(attrib de <tv>, generador de <channel>/<programme>) de un XMLTV en disco (también .gz), en streaming."""
+    f = open(ruta, 'rb')
+    try:
+        contexto = xml_backend.iterparse(abrir_descomprimido(f), events=('start', 'end'))
+        _, root = next(contexto)
+    except BaseException:
+        f.close()
+        raise
+
+    def elementos():
+        with f:
+            for evento, elem in contexto:
+                if evento == 'end' and elem.tag in ('channel', 'programme'):
+                    yield elem
+                    root.remove(elem)
+    return dict(root.attrib), elementos()
+
+
+def huellas(elementos, fuentes=None, con_xml=False):
+    """Estado {'canales': {clave: [huella, fuente]}, 'programas': {...}} de una guía.
+
+    fuentes: {clave: url} opcional (ver merge_epg_feeds). Con con_xml=True devuelve además
+    {clave: xml} de cada elemento, para poder incluir en el delta los que cambien.
+    """
+    fuentes = fuentes or {}
+    estado = {'canales': {}, 'programas': {}}
+    xml = {}
+    for elem in elementos:
+        if elem.tag not in ('channel', 'programme'):
+            continue
+        k = clave(elem)
+        estado['canales' if elem.tag == 'channel' else 'programas'][k] = [huella(elem), fuentes.get(k)]
+        if con_xml:
+            xml[(elem.tag, k)] = _xml(elem)
+    estado['version'] = version(estado)
+    return (estado, xml) if con_xml else estado
+
+
+def huellas_archivo(ruta):
+    """Estado de un XMLTV en disco, o None si no existe o no se puede leer."""
+    try:
+        _, elementos = _elementos_archivo(ruta)
+        return huellas(elementos)
+    except (OSError, *xml_backend.ParseError, StopIteration):
+        return None
+
+
+def _sha256_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def cargar_estado(ruta_estado, ruta_xml):
+    """Huellas de la salida anterior: las del estado guardado si corresponde al XML que hay en disco,
+    si no las del propio XML (fuentes desconocidas). None si no hay salida anterior."""
+    if not os.path.exists(ruta_xml):
+        return None
+    try:
+        with open(ruta_estado, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+        if estado.get('formato') == FORMATO and estado.get('archivo_sha256') == _sha256_archivo(ruta_xml):
+            lista = estado.pop('fuentes')
+            for tipo in ('canales', 'programas'):
+                for entrada in estado[tipo].values():
+                    entrada[1] = lista[entrada[1]] if entrada[1] is not None else None
+            return estado
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        pass
+    return huellas_archivo(ruta_xml)
+
+
+def calcular(anterior, nuevo, xml_nuevo, attrib=None):
+    """Delta entre dos estados. xml_nuevo: {(tag, clave): xml} de la guía nueva (ver huellas)."""
+    delta = {
+        'formato': FORMATO,
+        'generado': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'base': anterior['version'],
+        'version': nuevo['version'],
+        'attrib': attrib or {},
+        'resumen': {},
+        'por_fuente': {},
+        'orden_canales': list(nuevo['canales']),
+    }
+    for tipo, tag in (('canales', 'channel'), ('programas', 'programme')):
+        antes, ahora = anterior[tipo], nuevo[tipo]
+        cambios = {'añadidos': {}, 'modificados': {}, 'eliminados': []}
+        sin_cambios = 0
+        for k, (h, fuente) in ahora.items():
+            if k not in antes:
+                cambios['añadidos'][k] = xml_nuevo[(tag, k)]
+            elif antes[k][0] != h:
+                cambios['modificados'][k] = xml_nuevo[(tag, k)]
+            else:
+                sin_cambios += 1
+                continue
+            _contar(delta, fuente, 'añadidos' if k not in antes else 'modificados')
+        for k, (_, fuente) in antes.items():
+            if k not in ahora:
+                cambios['eliminados'].append(k)
+                _contar(delta, fuente, 'eliminados')
+        delta[tipo] = cambios
+        delta['resumen'][tipo] = {'añadidos': len(cambios['añadidos']), 'modificados': len(cambios['modificados']),
+                                  'eliminados': len(cambios['eliminados']), 'sin_cambios': sin_cambios}
+    return delta
+
+
+def _contar(delta, fuente, tipo):
+    conteo = delta['por_fuente'].setdefault(fuente or SIN_FUENTE, {'añadidos': 0, 'modificados': 0, 'eliminados': 0})
+    conteo[tipo] += 1
+
+
+def _escribir_json(ruta, datos, **opciones):
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False, **opciones)
+    os.replace(tmp, ruta)
+
+
+def escribir(anterior, elementos, ruta_xml, ruta_delta, ruta_estado, fuentes=None, attrib=None):
+    """Calcula el delta de `elementos` (lo que se acaba de escribir en ruta_xml) contra `anterior`,
+    escribe ruta_delta (si hay anterior; si no, borra uno viejo) y el nuevo estado. Devuelve el delta o None."""
+    nuevo, xml_nuevo = huellas(elementos, fuentes, con_xml=True)
+    delta = None
+    if anterior is not None:
+        delta = calcular(anterior, nuevo, xml_nuevo, attrib)
+        _escribir_json(ruta_delta, delta, separators=(',', ':'))
+    elif os.path.exists(ruta_delta):
+        os.remove(ruta_delta)  # Uno viejo ya no corresponde a esta salida
+    # En el estado cada fuente va como índice de una lista (las URLs repetidas ocupan mucho)
+    indices = {}
+    for tipo in ('canales', 'programas'):
+        for entrada in nuevo[tipo].values():
+            if entrada[1] is not None:
+                entrada[1] = indices.setdefault(entrada[1], len(indices))
+    nuevo['fuentes'] = list(indices)
+    nuevo['formato'] = FORMATO
+    nuevo['archivo_sha256'] = _sha256_archivo(ruta_xml)
+    _escribir_json(ruta_estado, nuevo, separators=(',', ':'))
+    return delta
+
+
+def aplicar(ruta_anterior, delta, ruta_salida, comprobar=True):
+    """Escribe en ruta_salida la guía anterior con el delta aplicado. Con comprobar=True falla con
+    ValueError si la guía anterior no es la base del delta o el resultado no es su versión."""
+    _, elementos = _elementos_archivo(ruta_anterior)
+    canales, programas = {}, {}
+    for elem in elementos:
+        (canales if elem.tag == 'channel' else programas)[clave(elem)] = elem
+    if comprobar:
+        base = huellas(list(canales.values()) + list(programas.values()))['version']
+        if base != delta['base']:
+            raise ValueError(f"La guía {ruta_anterior} (versión {base}) no es la base del delta ({delta['base']})")
+
+    for actuales, cambios in ((canales, delta['canales']), (programas, delta['programas'])):
+        for k in cambios['eliminados']:
+            actuales.pop(k, None)
+        for k, xml in {**cambios['añadidos'], **cambios['modificados']}.items():
+            actuales[k] = xml_backend.fromstring(xml)
+
+    orden = {channel_id: i for i, channel_id in enumerate(delta['orden_canales'])}
+
+    def orden_programa(k):
+        channel_id, _, start = k.rpartition('|')
+        return (orden.get(channel_id, len(orden)), channel_id, parse_xmltv_time(start) or 0)
+
+    resultado = [canales[c] for c in delta['orden_canales'] if c in canales]
+    resultado += [programas[k] for k in sorted(programas, key=orden_programa)]
+    if comprobar and huellas(resultado)['version'] != delta['version']:
+        raise ValueError("El resultado de aplicar el delta no coincide con la versión esperada")
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        with XMLTVWriter(f, delta.get('attrib'), limpiar=True) as writer:
+            for elem in resultado:
+                writer.write(elem)
+    return len(resultado)
+
+
+def resumen(delta):
+    """Una línea por tipo y por fuente, para los logs."""
+    lineas = []
+    for tipo, conteo in delta['resumen'].items():
+        lineas.append(f"Delta {tipo}: +{conteo['añadidos']} ~{conteo['modificados']} -{conteo['eliminados']} "
+                      f"(sin cambios: {conteo['sin_cambios']})")
+    for fuente, conteo in delta['por_fuente'].items():
+        lineas.append(f"  - {fuente}: +{conteo['añadidos']} ~{conteo['modificados']} -{conteo['eliminados']}")
+    return '\n'.join(lineas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delta entre guías XMLTV consecutivas.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p = sub.add_parser('calcular', help="Delta de anterior.xml a nuevo.xml.")
+    p.add_argument('anterior')
+    p.add_argument('nuevo')
+    p.add_argument('delta')
+    p = sub.add_parser('aplicar', help="Aplicar un delta a la guía anterior.")
+    p.add_argument('anterior')
+    p.add_argument('delta')
+    p.add_argument('salida')
+    args = parser.parse_args(argv)
+
+    if args.comando == 'calcular':
+        anterior = huellas_archivo(args.anterior)
+        if anterior is None:
+            raise SystemExit(f"No se pudo leer {args.anterior}")
+        attrib, elementos = _elementos_archivo(args.nuevo)
+        nuevo, xml_nuevo = huellas(elementos, con_xml=True)
+        delta = calcular(anterior, nuevo, xml_nuevo, attrib)
+        _escribir_json(args.delta, delta, separators=(',', ':'))
+        print(resumen(delta))
+    else:
+        with open(args.delta, 'r', encoding='utf-8') as f:
+            delta = json.load(f)
+        try:
+            total = aplicar(args.anterior, delta, args.salida)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"{args.salida}: {total} elementos (versión {delta['version']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,33 @@
 import requests
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import argparse
+import gzip
+import io
 import os
+import time
 import json
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 
+from channel_filter import ARCHIVO_FILTROS, ChannelFilter, cargar_filtros
+from channel_mapping import ChannelMapping
+import delta as delta_guia
+from epg_server import IndiceGuia, ServidorGuia
+from epg_store import EPGStore
+from feed_cache import FeedCache
+from feed_parser import parsear_serializado, recolectar_feed
+from http_cache import HTTPCache
+import orden
+import registros
+from perfil import EscrituraMedida, FiltroMedido, Perfil, base_informe
+from shards import MODOS as MODOS_SHARDS, escribir_shards
+import xml_backend
+from xmltv_time import (en_ventana, format_xmltv_time, horas_ventana_env, offset_de, parse_xmltv_time,
+                        ventana_desde_ahora)
+from xmltv_writer import XMLTVWriter
+
 # Array de URLs de ejemplo (reemplaza con tus URLs reales)
 EPG_URLS = [
     'https://raw.githubusercontent.com/matthuisman/i.mjh.nz/refs/heads/master/Plex/mx.xml',
@@ -15,387 +38,743 @@ EPG_URLS = [
     'https://raw.githubusercontent.com/Dingolobo/test/refs/heads/main/openepg.xml'
 ]
 
-# Diccionario de filtros: clave = URL, valor = lista de IDs de canales permitidos.
-# Si una URL no está en este diccionario, NO se aplica filtrado (se incluyen todos los canales y programas).
+# Filtros de canales por URL, en filtros.json (compartido con fetchdish-28hrs.py, que aplica su
+# entrada antes de escribir dish.xml): clave = URL, valor = lista de reglas de canales permitidos.
+# Si una URL no está en el archivo, NO se aplica filtrado (se incluyen todos los canales y programas).
 # Para agregar un filtro nuevo:
-# 1. Agrega la URL como clave en este diccionario.
+# 1. Agrega la URL como clave en filtros.json.
 # 2. Proporciona una lista de IDs de canales que quieres mantener (solo esos canales y sus programas se incluirán).
 #    - Obtén los IDs inspeccionando el XML de esa URL (busca <channel id="...">).
 #    - Ejemplo: Si quieres filtrar solo canales con IDs específicos, lista solo esos.
 #    - Si la lista está vacía [], se incluirán todos (equivalente a no filtrar).
-# Filtros actuales:
-FILTERS = {
-    # Filtro para mx.xml: solo estos IDs
-    'https://raw.githubusercontent.com/matthuisman/i.mjh.nz/refs/heads/master/Plex/mx.xml': [
-        "608049aefa2b8ae93c2c3a63-688d3402a6fe30698ab42007", #ITV deportes
-        "608049aefa2b8ae93c2c3a63-63f0ca427b78030ed9990309", #Curiosity
-        "608049aefa2b8ae93c2c3a63-66633339ebeb02ee8bd1597c"  #fifa+
-    ],
-    # Filtro para guiacanales.xml: solo estos IDs
-    'https://raw.githubusercontent.com/luisms123/tdt/master/guiacanales.xml': [
-        "Sky Sports 1",  # sky sports 1
-        "Sky Sports 16",   # sky sports 16
-        "Sky Sports 24",  #sky sports 24
-        "4 de Monterrey",
-        "Canal De Las Estrellas -1 Hora",
-        "Canal De Las Estrellas -2 Hora"
-    ],
-    # Filtro para acidjesuz
-    'https://raw.githubusercontent.com/acidjesuz/EPGTalk/master/guide.xml': [
-        "I108.18101.schedulesdirect.org",
-        "I111.89542.schedulesdirect.org",
-        "I112.72801.schedulesdirect.org",
-        "I129.20742.schedulesdirect.org",
-        "I16.83162.schedulesdirect.org",
-        "I191.58780.schedulesdirect.org",
-        "I193.58646.schedulesdirect.org",
-        "I205.95679.schedulesdirect.org",
-        "I207.19736.schedulesdirect.org",
-        "I208.16288.schedulesdirect.org",
-        "I210.74016.schedulesdirect.org",
-        "I23.111165.schedulesdirect.org",
-        "I235.55980.schedulesdirect.org",
-        "I272.79318.schedulesdirect.org",
-        "I273.64230.schedulesdirect.org",
-        "I278.95630.schedulesdirect.org",
-        "I304.16574.schedulesdirect.org",
-        "I305.40704.schedulesdirect.org",
-        "I337.60179.schedulesdirect.org",
-        "I353.71799.schedulesdirect.org",
-        "I361.17672.schedulesdirect.org",
-        "I373.16298.schedulesdirect.org",
-        "I374.16423.schedulesdirect.org",
-        "I376.19737.schedulesdirect.org",
-        "I377.68317.schedulesdirect.org",
-        "I378.80804.schedulesdirect.org",
-        "I381.80805.schedulesdirect.org",
-        "I414.111249.schedulesdirect.org",
-        "I425.113876.schedulesdirect.org",
-        "I438.98718.schedulesdirect.org",
-        "I448.67632.schedulesdirect.org",
-        "I488.99621.schedulesdirect.org",
-        "I513.59155.schedulesdirect.org",
-        "I551.33629.schedulesdirect.org",
-        "I554.75785.schedulesdirect.org",
-        "I560.109786.schedulesdirect.org",
-        "I561.50798.schedulesdirect.org",
-        "I562.82446.schedulesdirect.org",
-        "I575.50367.schedulesdirect.org",
-        "I681.19246.schedulesdirect.org",
-        "I684.16189.schedulesdirect.org",
-        "I687.15211.schedulesdirect.org",
-        "I689.73070.schedulesdirect.org",
-        "I699.37232.schedulesdirect.org",
-        "I711.63109.schedulesdirect.org",
-        "I718.65129.schedulesdirect.org",
-        "I739.84425.schedulesdirect.org",
-        "I754.11118.schedulesdirect.org",
-        "I298.30392.schedulesdirect.org",
-        "I299.79923.schedulesdirect.org",
-        "I300.47374.schedulesdirect.org"
-    ],
-    # Filtro para dish
-    'https://raw.githubusercontent.com/Dingolobo/test/refs/heads/main/dish.xml': [
-        "12712",
-        "15178",
-        "15192",
-        "15232",
-        "15296",
-        "15384",
-        "15688",
-        "15969",
-        "16141",
-        "16213",
-        "16435",
-        "16464",
-        "16707",
-        "16794",
-        "16795",
-        "16799",
-        "16800",
-        "17484",
-        "18169",
-        "18329",
-        "18955",
-        "19158",
-        "19234",
-        "19384",
-        "19385",
-        "20548",
-        "24519",
-        "25615",
-        "25788",
-        "25793",
-        "27741",
-        "27773",
-        "29017",
-        "32749",
-        "34344",
-        "34412",
-        "34710",
-        "34863",
-        "34879",
-        "37747",
-        "40137",
-        "45831",
-        "45955",
-        "46442",
-        "46608",
-        "47403",
-        "48293",
-        "50577",
-        "52762",
-        "56036",
-        "56727",
-        "57580",
-        "59582",
-        "60295",
-        "60801",
-        "61033",
-        "61311",
-        "61404",
-        "61719",
-        "62043",
-        "64835",
-        "65940",
-        "66419",
-        "66488",
-        "67787",
-        "68119",
-        "68134",
-        "68140",
-        "71621",
-        "72625",
-        "74420",
-        "74450",
-        "75537",
-        "77783",
-        "78763",
-        "79042",
-        "79968",
-        "80199",
-        "82970",
-        "83458",
-        "84532",
-        "87915",
-        "88305",
-        "88533",
-        "89128",
-        "89260",
-        "89610",
-        "90209",
-        "90653",
-        "90682",
-        "90917",
-        "91029",
-        "92197",
-        "95687",
-        "96445",
-        "97501",
-        "98192",
-        "100602,"
-        "101111",
-        "101734",
-        "102301",
-        "106112",
-        "107366",
-        "109817",
-        "109982",
-        "115713",
-        "118698",
-        "119198",
-        "120767",
-        "121144",
-        "123193",
-        "123604",
-        "124934",
-        "140026",
-        "141773",
-        "144778",
-        "148503",
-        "186893"
-    ]
-    
-    # Para agregar otra URL y filtro:
-    # 'https://ejemplo.com/otra-epg.xml': ["id1", "id2", "id3"]
-}
+#    - Cada regla puede ir sola ("12712") o con una nota: {"id": "12712", "nota": "MTVL"}.
+# 3. Además de IDs exactos se admiten (ver channel_filter.py):
+#    - globs/prefijos: "I*.schedulesdirect.org", "Sky Sports *"
+#    - regex: "re:Canal \d+" (debe cubrir el ID completo)
+#    - exclusiones: "!Sky Sports 16" (se aplica después de las inclusiones)
+# Las reglas se compilan y validan una vez al empezar el merge; al terminar cada feed se avisa
+# de los IDs configurados que no coincidieron con ningún canal.
+# Variable de entorno: EPG_FILTROS (ruta del archivo, por defecto filtros.json).
+FILTERS = cargar_filtros(os.environ.get('EPG_FILTROS', ARCHIVO_FILTROS))
+
+# Resolución de programas duplicados/solapados en un mismo canal (entre feeds o dentro de uno).
+# PRIORIDAD_FUENTES: URLs de mayor a menor prioridad; las que no aparecen van detrás en el orden de EPG_URLS
+#   (lista vacía = el propio orden de EPG_URLS).
+# POLITICA_SOLAPES:
+#   'recortar'  -> el programa de menor prioridad se recorta al hueco libre (o se descarta si no queda nada)
+#   'descartar' -> el programa de menor prioridad se descarta entero
+#   'ninguna'   -> no se resuelve nada (comportamiento anterior)
+# Con 'recortar' y 'descartar' los duplicados exactos (mismo start y stop) conservan solo el de mayor
+# prioridad; con 'ninguna' se dejan todos.
+PRIORIDAD_FUENTES = []
+POLITICA_SOLAPES = os.environ.get('EPG_SOLAPES', 'recortar')
+
+# Orden de la salida (ver orden.py):
+#   'canonico' -> canales por nombre (o ID) y programas por canal e inicio, sin importar el orden de los feeds
+#   'feeds'    -> feed a feed y en el orden de cada archivo (comportamiento anterior)
+# Cada feed se ordena por separado (en memoria) y se mezclan con heapq.merge.
+# Variable de entorno: EPG_ORDEN.
+ORDEN_SALIDA = os.environ.get('EPG_ORDEN', 'canonico')
+
+# Ventana temporal de programas: se descartan al parsear los que terminaron hace más de
+# VENTANA_HORAS_ATRAS o empiezan dentro de más de VENTANA_HORAS_ADELANTE. None = sin límite.
+# Variables de entorno: EPG_VENTANA_ATRAS / EPG_VENTANA_ADELANTE (en horas; vacías o sin definir = sin
+# límite, los workflows usan 2 y 72). Ver xmltv_time.horas_ventana_env; fetch-nxt-plus.py usa la misma ventana.
+VENTANA_HORAS_ATRAS, VENTANA_HORAS_ADELANTE = horas_ventana_env()
+
+# Descargas simultáneas como máximo (un hilo por feed, todos sobre la misma sesión HTTP)
+MAX_DESCARGAS_CONCURRENTES = int(os.environ.get('EPG_MAX_DESCARGAS', '4'))
+HTTP_TIMEOUT = 30
+
+# Parseo en procesos: los hilos descargan y cada feed en disco (local o en la caché HTTP) se parsea y
+# filtra en un proceso del pool, que devuelve solo lo conservado serializado (ver feed_parser.py).
+# EPG_PROCESOS_PARSEO: número de procesos; vacío = automático (núcleos disponibles, como mucho uno por
+# feed; sin pool si hay un solo núcleo), 0 = desactivado. Los archivos pequeños se parsean en el hilo.
+PROCESOS_PARSEO = os.environ.get('EPG_PROCESOS_PARSEO', '')
+PROCESOS_MIN_BYTES = 256 * 1024
+
+# Almacén SQLite opcional (ver epg_store.py): con --db / EPG_DB el merge se carga en la base y la
+# salida se exporta desde ella (canales y programas por canal e inicio), conservando historial.
+# Solo con EPG_ORDEN=canonico: la base no conserva el orden de los feeds.
+DB_RETENCION = float(os.environ.get('EPG_DB_RETENCION_DIAS', '30')) * 24 * 3600
+
+# Salida fragmentada opcional (ver shards.py): con --shards dia|grupo|dia+grupo se escriben además
+# XMLTV por día y/o por grupo de canales en EPG_SHARDS_DIR, con un manifest.json (rangos, canales,
+# tamaños y hashes). Los días se cortan en la zona SHARDS_OFFSET.
+# El grupo de un canal sale de su mapping ("group" en mappings.json) o, si no tiene, del primer grupo
+# de GRUPOS_CANALES cuyas reglas (misma sintaxis que FILTERS) coinciden con su ID; si no, 'otros'.
+# Ejemplo: GRUPOS_CANALES = {'deportes': ['re:.*Sports.*', 'ESPN*'], 'infantiles': ['Cartoonito.mx']}
+GRUPOS_CANALES = {}
+SHARDS_OFFSET = os.environ.get('EPG_SHARDS_OFFSET', '-0500')
+
+# Instrumentación opcional (tiempos y memoria por etapa, informe JSON junto al XML); ver perfil.py.
+# Se activa con --perfil / EPG_PERFIL=1; --cprofile / EPG_CPROFILE=1 añade un volcado .pstats.
+PERFIL = Perfil()
+
+# Caché de descargas con GET condicional (ETag/Last-Modified). EPG_CACHE_DIR='' la desactiva.
+HTTP_CACHE_DIR = os.environ.get('EPG_CACHE_DIR', '.epg-cache')
+HTTP_CACHE_MAX_AGE = float(os.environ.get('EPG_CACHE_MAX_AGE_DIAS', '7')) * 24 * 3600
+HTTP_CACHE_MAX_BYTES = int(float(os.environ.get('EPG_CACHE_MAX_MB', '500')) * 1024 * 1024)
+
+# Caché de resultados filtrados por feed (merge incremental). EPG_FEED_CACHE_DIR='' la desactiva.
+# FEED_CACHE_VERSION forma parte de la clave: súbela si cambia cómo se parsea/filtra un feed.
+FEED_CACHE_DIR = os.environ.get('EPG_FEED_CACHE_DIR', os.path.join(HTTP_CACHE_DIR, 'feeds') if HTTP_CACHE_DIR else '')
+FEED_CACHE_VERSION = 2
 
 def cargar_mappings(archivo_mapping='mappings.json'):
-    """Carga el archivo de mappings desde JSON."""
+    """Carga el archivo de mappings desde JSON y lo compila (ver channel_mapping.py)."""
     try:
         with open(archivo_mapping, 'r', encoding='utf-8') as f:
             mappings = json.load(f)
             print(f"Mappings cargados: {len(mappings)} entradas.")
-            return mappings
     except FileNotFoundError:
         print(f"Advertencia: No se encontró {archivo_mapping}. Usando nombres originales.")
-        return {}
+        mappings = {}
     except json.JSONDecodeError:
         print(f"Error: {archivo_mapping} no es un JSON válido. Usando nombres originales.")
-        return {}
-
-def aplicar_mappings(root, mappings):
-    """Aplica los mappings a los canales: elimina todos los <display-name> y agrega solo uno nuevo por ID."""
-    canales = root.findall('channel')
-    mappings_aplicados = 0
-    for canal in canales:
-        canal_id = canal.get('id')
-        if canal_id and canal_id in mappings:
-            nombre_deseado = mappings[canal_id]
-            # Eliminar TODOS los display-name existentes
-            display_names = canal.findall('display-name')
-            for dn in display_names:
-                canal.remove(dn)
-            # Agregar SOLO uno nuevo
-            display_name = ET.SubElement(canal, 'display-name')
-            display_name.text = nombre_deseado
-            mappings_aplicados += 1
-            print(f"Mapping aplicado (solo uno): {canal_id} -> {nombre_deseado}")
-        elif canal_id:
-            print(f"Advertencia: No hay mapping para {canal_id}. Manteniendo nombres originales.")
-    print(f"Total mappings aplicados: {mappings_aplicados}/{len(canales)} canales.")
-
-def download_and_parse_xml(url, local_filename=None):
-    """Descarga y parsea un XML desde una URL, priorizando archivo local si existe (modificación para workflow)."""
+        mappings = {}
+    mapping = ChannelMapping(mappings)
+    for aviso in mapping.advertencias:
+        print(f"Advertencia en {archivo_mapping}: {aviso}")
+    return mapping
+
+def crear_sesion_http(pool_size=MAX_DESCARGAS_CONCURRENTES):
+    """Sesión compartida por todas las descargas, con un pool de conexiones reutilizables."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def crear_cache_http():
+    """Devuelve la HTTPCache configurada, o None si está desactivada."""
+    if not HTTP_CACHE_DIR:
+        return None
+    return HTTPCache(HTTP_CACHE_DIR, max_age=HTTP_CACHE_MAX_AGE, max_bytes=HTTP_CACHE_MAX_BYTES)
+
+def crear_feed_cache():
+    """Devuelve la FeedCache configurada, o None si está desactivada."""
+    if not FEED_CACHE_DIR:
+        return None
+    return FeedCache(FEED_CACHE_DIR, FEED_CACHE_VERSION, max_age=HTTP_CACHE_MAX_AGE)
+
+def crear_pool_procesos(num_feeds):
+    """ProcessPoolExecutor para el parseo según PROCESOS_PARSEO, o None si no compensa."""
+    procesos = int(PROCESOS_PARSEO) if PROCESOS_PARSEO else min(os.cpu_count() or 1, num_feeds)
+    if procesos < 1 or (not PROCESOS_PARSEO and procesos < 2):
+        return None
+    print(f"Parseo en {procesos} procesos")
+    # 'spawn': el padre ya tiene hilos (descargas) y hacer fork con hilos vivos puede bloquear al hijo
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+
+def parse_archivo_feed(ruta, filtro, feed_cache=None, ventana=None, procesos=None):
+    """Parsea y filtra un feed guardado en disco, reutilizando el resultado anterior si ni el
+    contenido del archivo ni su filtro cambiaron desde la última ejecución.
+
+    La caché guarda el resultado sin recortar por ventana (la ventana se mueve entre ejecuciones),
+    y la ventana se aplica al recargarlo.
+    Con `procesos` (pool de crear_pool_procesos) el parseo y el filtrado corren en otro proceso y aquí
+    solo se convierte lo conservado.
+    """
+    if procesos is not None and os.path.getsize(ruta) < PROCESOS_MIN_BYTES:
+        procesos = None  # No compensa el viaje entre procesos
+    if feed_cache is None and procesos is None:
+        with open(ruta, 'rb') as f:
+            return recolectar_feed(f, filtro, ventana)
+
+    clave = guardado = None
+    if feed_cache is not None:
+        clave = feed_cache.clave(ruta, getattr(filtro, 'reglas', filtro))
+        guardado = feed_cache.ruta_si_existe(clave)
+    if guardado is not None:
+        try:
+            with open(guardado, 'rb') as f:
+                resultado = recolectar_feed(f, None, ventana)
+            if hasattr(filtro, 'marcar_vistos'):
+                filtro.marcar_vistos(c.get('id') for c in resultado[0])
+            print(f"  - {ruta} sin cambios: reutilizando resultado filtrado de la ejecución anterior")
+            return resultado
+        except (*xml_backend.ParseError, ValueError, OSError, EOFError) as e:
+            print(f"  - Resultado en caché de {ruta} ilegible ({e}), se vuelve a procesar")
+
+    if procesos is not None:
+        reglas = list(getattr(filtro, 'reglas', filtro)) if filtro else None
+        medir = isinstance(filtro, FiltroMedido)
+        datos, vistos, segundos_filtro = procesos.submit(parsear_serializado, ruta, reglas, medir).result()
+        if medir:
+            filtro.segundos += segundos_filtro  # El filtrado corrió en el proceso trabajador
+        if hasattr(filtro, 'marcar_vistos'):
+            filtro.marcar_vistos(vistos)
+        if feed_cache is not None:
+            feed_cache.guardar_serializado(clave, datos)
+        return recolectar_feed(io.BytesIO(datos), None, ventana)
+
+    with open(ruta, 'rb') as f:
+        canales, programas = recolectar_feed(f, filtro)
+    feed_cache.guardar(clave, canales + programas)
+    if ventana is not None:
+        programas = [p for p in programas if en_ventana(p.get('start'), p.get('stop'), ventana)]
+    return canales, programas
+
+def download_and_parse_xml(url, local_filename=None, filtro=None, session=None, cache=None, feed_cache=None,
+                           ventana=None, procesos=None):
+    """Descarga y parsea en streaming un XML desde una URL, priorizando archivo local si existe (modificación para workflow).
+
+    Con `cache` la descarga es un GET condicional: si el servidor responde 304 se parsea la copia en disco.
+    Con `feed_cache` los archivos en disco (locales o en caché) que no cambiaron no se vuelven a parsear.
+    Devuelve (canales, programas) ya filtrados por filtro, o None si el feed no se pudo leer.
+    """
     # Modificación: Intenta leer archivo local primero si se proporciona
     if local_filename and os.path.exists(local_filename):
         try:
             print(f"Leyendo XML local: {local_filename}")
-            with open(local_filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-            root = ET.fromstring(content)
-            return root
-        except ET.ParseError as e:
+            with PERFIL.medir('parseo', url=url, origen='local'):
+                return parse_archivo_feed(local_filename, filtro, feed_cache, ventana, procesos)
+        except xml_backend.ParseError as e:
             print(f"Error parseando XML local {local_filename}: {e}. Fallback a URL.")
         except Exception as e:
             print(f"Error leyendo local {local_filename}: {e}. Fallback a URL.")
     
-    # Fallback original: Descarga de URL
+    # Fallback original: Descarga de URL (el cuerpo se parsea a medida que llega)
     try:
         print(f"Descargando de URL: {url} (fuente externa o fallback)")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        root = ET.fromstring(response.content)
-        return root
+        if cache is not None:
+            with PERFIL.medir('descarga', url=url) as datos:
+                ruta, estado = cache.fetch(session or requests, url, timeout=HTTP_TIMEOUT)
+                datos['estado'] = estado
+            if estado == 'no-modificado':
+                print(f"  - {url} sin cambios (304), usando copia en caché")
+            try:
+                with PERFIL.medir('parseo', url=url, origen='cache-http'):
+                    return parse_archivo_feed(ruta, filtro, feed_cache, ventana, procesos)
+            except (*xml_backend.ParseError, ValueError):
+                cache.invalidar(url)  # No reutilizar un cuerpo que no parsea
+                raise
+        with (session or requests).get(url, timeout=HTTP_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            # Sin caché el cuerpo se parsea mientras llega: descarga y parseo no se pueden separar
+            with PERFIL.medir('descarga+parseo', url=url):
+                return recolectar_feed(response.raw, filtro, ventana)
     except requests.RequestException as e:
         print(f"Error descargando {url}: {e}")
         return None
-    except ET.ParseError as e:
+    except xml_backend.ParseError as e:
         print(f"Error parseando XML de {url}: {e}")
         return None
+    except ValueError as e:
+        print(f"XML inválido en {url}: {e}")
+        return None
+
+def local_filename_for(url):
+    """Modificación: Detecta si es una fuente local (generada en el mismo workflow) y devuelve su filename."""
+    if 'mvshub.xml' in url:
+        return 'mvshub.xml'
+    elif 'dish.xml' in url:
+        return 'dish.xml'
+    elif 'openepg.xml' in url:
+        return 'openepg.xml'
+    return None
+
+def compilar_filtros(filtros=FILTERS):
+    """Compila y valida una sola vez las reglas de cada URL. Devuelve {url: ChannelFilter} solo para
+    las URLs con reglas (una lista vacía equivale a no filtrar)."""
+    compilados = {}
+    for url, reglas in filtros.items():
+        filtro = ChannelFilter(reglas, url)
+        for aviso in filtro.advertencias:
+            print(f"Advertencia en FILTERS[{url}]: {aviso}")
+        if filtro:
+            compilados[url] = filtro
+    return compilados
+
+def procesar_feed(url, session=None, cache=None, feed_cache=None, ventana=None, filtro=None, procesos=None):
+    """Descarga (o lee en local), parsea y filtra un feed. Pensado para correr en un hilo del pool."""
+    if filtro:
+        print(f"Aplicando filtrado ({filtro.describir()}) en {url}")
+        if PERFIL.activo:
+            filtro = FiltroMedido(filtro)
+    with PERFIL.perfilar_hilo():
+        resultado = download_and_parse_xml(url, local_filename_for(url), filtro,
+                                           session, cache, feed_cache, ventana, procesos)
+    if isinstance(filtro, FiltroMedido):
+        # El filtrado ocurre dentro del parseo; aquí solo se separa su parte del tiempo
+        PERFIL.registrar('filtrado', filtro.segundos, url=url)
+    return resultado
+
+def prioridades_fuentes(urls):
+    """Devuelve {url: prioridad} (0 = mayor prioridad) según PRIORIDAD_FUENTES y el orden de urls."""
+    ordenadas = [u for u in PRIORIDAD_FUENTES if u in urls] + [u for u in urls if u not in PRIORIDAD_FUENTES]
+    return {url: i for i, url in enumerate(ordenadas)}
+
+def _recortar(elem, atributo, epoch):
+    """Reescribe start/stop de un programa conservando su zona horaria."""
+    elem.set(atributo, format_xmltv_time(epoch, offset_de(elem.get(atributo))))
+
+class _Ocupacion:
+    """Tramos elementales [puntos[k], puntos[k+1]) de un canal, libres u ocupados por lo ya conservado.
+
+    Un tramo solo pasa de libre a ocupado: el siguiente libre se busca con union-find (compresión de
+    caminos) y el siguiente ocupado con un árbol de Fenwick, ambos en O(log n).
+    """
+
+    def __init__(self, tramos):
+        self.n = tramos
+        self._siguiente = list(range(tramos + 1))  # siguiente tramo libre (n = ninguno)
+        self._fenwick = [0] * (tramos + 1)
+        self.ocupados = [False] * tramos
+
+    def libre_desde(self, k):
+        """Primer tramo libre >= k (n si no queda ninguno)."""
+        siguiente = self._siguiente
+        while siguiente[k] != k:
+            siguiente[k] = siguiente[siguiente[k]]
+            k = siguiente[k]
+        return k
+
+    def ocupado_desde(self, k):
+        """Primer tramo ocupado >= k (n si no hay ninguno)."""
+        # Cuántos ocupados hay antes de k; se busca el siguiente (el de orden cuenta + 1)
+        cuenta, i = 0, k
+        while i > 0:
+            cuenta += self._fenwick[i]
+            i -= i & -i
+        pos, paso = 0, 1 << self.n.bit_length()
+        while paso:
+            if pos + paso <= self.n and self._fenwick[pos + paso] <= cuenta:
+                pos += paso
+                cuenta -= self._fenwick[pos]
+            paso >>= 1
+        return pos
+
+    def ocupar(self, inicio, fin):
+        """Marca como ocupados los tramos de [inicio, fin) (todos libres)."""
+        for k in range(inicio, fin):
+            self.ocupados[k] = True
+            self._siguiente[k] = k + 1
+            i = k + 1
+            while i <= self.n:
+                self._fenwick[i] += 1
+                i += i & -i
+
+def resolver_solapes(programas, prioridades, politica=POLITICA_SOLAPES):
+    """Elimina duplicados y resuelve solapes de programas por canal.
+
+    programas: lista de (url_fuente, elemento) en orden de salida.
+    Por cada canal coloca los intervalos de mayor a menor prioridad (a igual prioridad, primero el que
+    empieza más tarde) sobre lo ya conservado, así que un programa solo lo recorta o lo elimina otro de
+    igual o mayor prioridad y un recorte previo nunca invierte las prioridades. Lo conservado se lleva
+    por tramos entre los inicios y finales del canal (ver _Ocupacion): O(n log n) por canal.
+    - Duplicado exacto (mismo start y stop que otro de igual o mayor prioridad): se descarta.
+    - 'recortar': el que llega se queda con el primer tramo libre de su intervalo, o se descarta si no
+      queda ninguno. Un programa nunca se parte en dos: si otro de mayor prioridad cae en medio, se
+      conserva el tramo anterior y el posterior se pierde (b[00,30) con a[10,20) prioritario -> b[00,10)).
+    - 'descartar': el que llega se descarta entero si se solapa con algo conservado.
+    A igual prioridad gana el que empieza más tarde (el anterior se queda con el tramo previo).
+    Un programa de duración cero (o negativa) se descarta si cae dentro de algo conservado y no ocupa
+    nada. Los programas con fechas ilegibles se dejan tal cual.
+    Devuelve (lista de (url, elemento) conservados en el orden original, {url: {'duplicados', 'descartados', 'recortados'}}).
+    """
+    informe = defaultdict(lambda: {'duplicados': 0, 'descartados': 0, 'recortados': 0})
+    if politica == 'ninguna':
+        return list(programas), {}
+
+    por_canal = defaultdict(list)
+    for pos, (url, elem) in enumerate(programas):
+        inicio = parse_xmltv_time(elem.get('start'))
+        fin = parse_xmltv_time(elem.get('stop'))
+        if inicio is None or fin is None:
+            continue
+        por_canal[elem.get('channel')].append((inicio, fin, prioridades.get(url, len(prioridades)), pos, url))
 
-def merge_epg_feeds(urls):
-    """Mergea múltiples feeds EPG en uno solo, aplicando filtros por URL si están definidos en FILTERS."""
+    eliminados = set()
+    recortes = defaultdict(dict)  # posición -> {'start'|'stop': epoch}
+
+    def descartar(item, motivo):
+        eliminados.add(item[3])
+        informe[item[4]][motivo] += 1
+
+    for intervalos in por_canal.values():
+        intervalos.sort(key=lambda it: (it[2], -it[0], it[3]))
+        puntos = sorted({x for it in intervalos for x in it[:2]})
+        indice = {x: k for k, x in enumerate(puntos)}
+        ocupacion = _Ocupacion(len(puntos) - 1)
+        colocados = set()  # (inicio, fin) ya colocados, aunque después se recortaran
+        for it in intervalos:
+            inicio, fin = it[0], it[1]
+            if (inicio, fin) in colocados:
+                descartar(it, 'duplicados')
+                continue
+            colocados.add((inicio, fin))
+            a, b = indice[inicio], indice[fin]
+            if a >= b:
+                if a < ocupacion.n and ocupacion.ocupados[a]:
+                    descartar(it, 'descartados')
+                continue
+            if politica == 'recortar':
+                # Primer tramo libre de [inicio, fin), hasta el siguiente ocupado
+                desde = ocupacion.libre_desde(a)
+                if desde < b:
+                    hasta = min(b, ocupacion.ocupado_desde(desde))
+                    if desde != a:
+                        recortes[it[3]]['start'] = puntos[desde]
+                    if hasta != b:
+                        recortes[it[3]]['stop'] = puntos[hasta]
+                    ocupacion.ocupar(desde, hasta)
+                    continue
+            elif ocupacion.ocupado_desde(a) >= b:
+                ocupacion.ocupar(a, b)
+                continue
+            descartar(it, 'descartados')
+
+    for pos, cambios in recortes.items():
+        if pos in eliminados:
+            continue
+        url, elem = programas[pos]
+        for atributo, epoch in cambios.items():
+            _recortar(elem, atributo, epoch)
+        informe[url]['recortados'] += 1
+    resultado = [item for pos, item in enumerate(programas) if pos not in eliminados]
+    return resultado, dict(informe)
+
+def merge_epg_feeds(urls, mapping=None, fuentes=None):
+    """Mergea múltiples feeds EPG en uno solo, aplicando filtros por URL si están definidos en FILTERS.
+
+    Cada feed se parsea en streaming y el filtro se aplica elemento a elemento, así que el pico de
+    memoria depende de lo que se conserva y no del tamaño de los feeds originales.
+    Las descargas corren en paralelo (MAX_DESCARGAS_CONCURRENTES hilos sobre una sesión HTTP con pool)
+    y cada feed se parsea en cuanto llega su respuesta (en un pool de procesos si hay varios núcleos,
+    ver PROCESOS_PARSEO); el merge se hace siempre en el orden de `urls`, así que el primer feed que
+    trae un canal sigue ganando.
+    Los mappings (renombrar, remapear IDs, fusionar alias) se aplican al mismo tiempo, antes de
+    deduplicar canales y de resolver solapes, así los alias de un canal quedan bajo un solo ID.
+    La salida sale en el orden de ORDEN_SALIDA (por defecto canónico: canales por nombre y programas
+    por canal e inicio).
+    Con `fuentes` (dict) se anota la URL de la que sale cada canal y programa conservado, por su
+    clave del delta (ver delta.py).
+    """
+    if mapping is None:
+        mapping = ChannelMapping()
     all_channels = {}  # Diccionario para evitar duplicados por ID de canal
     all_programmes = []
+    cache = crear_cache_http()
+    feed_cache = crear_feed_cache()
+    filtros = compilar_filtros()
+    ventana = None
+    if VENTANA_HORAS_ATRAS is not None or VENTANA_HORAS_ADELANTE is not None:
+        ventana = ventana_desde_ahora(VENTANA_HORAS_ATRAS, VENTANA_HORAS_ADELANTE)
+        print(f"Ventana de programas: -{VENTANA_HORAS_ATRAS}h / +{VENTANA_HORAS_ADELANTE}h desde ahora")
 
-    for url in urls:
-        print(f"Procesando {url}...")
-        
-        # Modificación: Detecta si es una fuente local y pasa el filename para priorizar local
-        local_filename = None
-        if 'mvshub.xml' in url:
-            local_filename = 'mvshub.xml'
-        elif 'dish.xml' in url:
-            local_filename = 'dish.xml'
-        elif 'openepg.xml' in url:
-            local_filename = 'openepg.xml'
-        
-        root = download_and_parse_xml(url, local_filename)
-        if root is None or root.tag != 'tv':
-            print(f"Saltando {url}: XML inválido o vacío.")
-            continue
+    procesos = crear_pool_procesos(len(urls))
+    with PERFIL.etapa('feeds'), (procesos or nullcontext()), crear_sesion_http() as session, \
+            ThreadPoolExecutor(max_workers=max(1, MAX_DESCARGAS_CONCURRENTES)) as pool:
+        futuros = [pool.submit(procesar_feed, url, session, cache, feed_cache, ventana, filtros.get(url), procesos)
+                   for url in urls]
+
+        for url, futuro in zip(urls, futuros):
+            resultado = futuro.result()
+            print(f"Procesando {url}...")
+            if resultado is None:
+                print(f"Saltando {url}: XML inválido o vacío.")
+                continue
+            canales, programas = resultado
+
+            canales_procesados = 0
+            inicio_mapping = time.perf_counter()
 
-        canales_procesados = 0
-        programas_procesados = 0
-
-        # Obtener la lista de IDs permitidos para esta URL (si existe en FILTERS)
-        # Si no hay filtro (None o lista vacía), no filtrar (incluir todo)
-        ids_permitidos = FILTERS.get(url, None)
-        filtrar = (ids_permitidos is not None and len(ids_permitidos) > 0)
-        if filtrar:
-            print(f"Aplicando filtrado solo para IDs: {ids_permitidos} en {url}")
-
-        # Extraer canales (evitar duplicados por 'id'), con filtrado si aplica
-        for channel in root.findall('channel'):
-            channel_id = channel.get('id')
-            if channel_id:
-                # Si hay filtro, solo incluir si el ID está en la lista permitida
-                if filtrar and channel_id not in ids_permitidos:
-                    continue  # Salta canales no deseados
-                if channel_id not in all_channels:
+            # Agregar canales (evitar duplicados por 'id'); el filtrado ya se hizo durante el parseo
+            for channel in canales:
+                original_id = channel.get('id')
+                channel_id = mapping.id_final(original_id)
+                if channel_id and channel_id not in all_channels:
+                    # El mapping (y su cuenta en el resumen) solo se aplica a los canales que se conservan
+                    mapping.canal(channel)
                     all_channels[channel_id] = channel
                     canales_procesados += 1
+                    if fuentes is not None:
+                        fuentes[channel_id] = url
+                elif channel_id and channel_id != original_id:
+                    mapping.fusionados += 1
+
+            if mapping.ids:
+                for programme in programas:
+                    mapping.programa(programme)
+            PERFIL.acumular('mapping', time.perf_counter() - inicio_mapping)
+            all_programmes.extend((url, programme) for programme in programas)
+
+            print(f"  - Canales agregados: {canales_procesados}, Programas: {len(programas)}")
+            if url in filtros:
+                sin_coincidencia = filtros[url].sin_coincidencia()
+                if sin_coincidencia:
+                    print(f"  - Reglas de filtro sin ningún canal en el feed ({len(sin_coincidencia)}): {sin_coincidencia}")
 
-        # Extraer programas, con filtrado si aplica
-        for programme in root.findall('programme'):
-            programme_channel = programme.get('channel')
-            if filtrar and programme_channel not in ids_permitidos:
-                continue  # Salta programas no deseados (solo aquellos de canales filtrados)
-            all_programmes.append(programme)
-            programas_procesados += 1
+    if cache is not None:
+        borradas = cache.purgar()
+        if borradas:
+            print(f"Caché HTTP: {borradas} entradas expiradas eliminadas.")
+    if feed_cache is not None:
+        feed_cache.purgar()
 
-        print(f"  - Canales agregados: {canales_procesados}, Programas: {programas_procesados}")
+    print(mapping.resumen())
+
+    # Duplicados y solapes por canal, según la prioridad de cada fuente
+    prioridades = prioridades_fuentes(urls)
+    with PERFIL.etapa('solapes'):
+        all_programmes, informe = resolver_solapes(all_programmes, prioridades)
+        if fuentes is not None:
+            # Después de resolver: un recorte puede haber movido el start (parte de la clave)
+            for url, programme in all_programmes:
+                fuentes[delta_guia.clave(programme)] = url
+    for url, conteo in informe.items():
+        print(f"Solapes en {url}: {conteo['duplicados']} duplicados, "
+              f"{conteo['descartados']} descartados, {conteo['recortados']} recortados")
 
     # Crear nuevo XML raíz
-    tv = ET.Element('tv')
+    tv = registros.raiz('tv')
     tv.set('generator-info-name', 'Merged EPG Script')
     tv.set('generator-info-url', 'https://github.com/tu-usuario/tu-repo')
 
-    # Agregar canales mergeados
-    for channel in all_channels.values():
-        tv.append(channel)
+    canales = list(all_channels.values())
+    if ORDEN_SALIDA == 'canonico':
+        # Cada feed por separado (en orden de prioridad, que desempata) y mezcla k-way
+        with PERFIL.etapa('orden'):
+            por_feed = {url: [] for url in sorted(prioridades, key=prioridades.get)}
+            for url, programme in all_programmes:
+                por_feed[url].append(programme)
+            all_programmes = None
+            canales, programas = orden.ordenar_guia(canales, list(por_feed.values()))
+            por_feed = None
+            for channel in canales:
+                tv.append(channel)
+            for programme in programas:
+                tv.append(programme)
+    else:
+        # Agregar canales mergeados
+        for channel in canales:
+            tv.append(channel)
 
-    # Agregar todos los programas
-    for programme in all_programmes:
-        tv.append(programme)
+        # Agregar todos los programas
+        for _, programme in all_programmes:
+            tv.append(programme)
 
     return tv
 
-def pretty_xml(element):
-    """Formatea el XML para que sea legible, eliminando líneas vacías extras."""
-    rough_string = ET.tostring(element, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ")
-    
-    # Filtrar líneas vacías extras (solo espacios o \n)
-    lines = pretty_xml.split('\n')
-    clean_lines = []
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        if stripped or i == 0:  # Mantener la primera línea (XML declaration) aunque esté vacía
-            clean_lines.append(line.rstrip())  # Remover trailing spaces
-    return '\n'.join(clean_lines) + '\n'  # Agregar un \n final para cierre limpio
-
-def main():
-    """Función principal: mergea y guarda el XML."""
-    if not EPG_URLS:
-        print("No hay URLs configuradas.")
-        return
+class _MultiWriter:
+    """Reparte cada write() entre varios file handles (XML plano y .gz en una sola pasada)."""
+
+    def __init__(self, *handles):
+        self.handles = handles
+
+    def write(self, texto):
+        for fh in self.handles:
+            fh.write(texto)
+
+def abrir_gzip_texto(ruta, nivel):
+    """Abre un .gz para escribir texto UTF-8 con cabecera reproducible (mtime=0), para que el
+    mismo contenido produzca siempre los mismos bytes."""
+    raw = open(ruta, 'wb')
+    gz = gzip.GzipFile(filename=os.path.basename(ruta)[:-len('.gz')], mode='wb',
+                       compresslevel=nivel, fileobj=raw, mtime=0)
+    return raw, io.TextIOWrapper(gz, encoding='utf-8')
+
+def write_xmltv(tv, output_file, gzip_salida='no', gzip_nivel=9, elementos=None):
+    """Escribe el XML mergeado elemento a elemento, con el mismo formato que el antiguo pretty_xml
+    (minidom con sangría de 2 espacios, sin líneas vacías ni espacios finales).
+
+    gzip_salida: 'no' (solo output_file), 'tambien' (output_file y output_file + '.gz'),
+    'solo' (solo output_file + '.gz'). Devuelve (elementos escritos, lista de archivos generados).
+    Con `elementos` se escriben esos (p. ej. exportados de la base) en lugar de los hijos de `tv`.
+    """
+    archivos = []
+    handles = []
+    cerrar = []
+    try:
+        if gzip_salida != 'solo':
+            f = open(output_file, 'w', encoding='utf-8')
+            cerrar.append(f)
+            handles.append(f)
+            archivos.append(output_file)
+        if gzip_salida in ('tambien', 'solo'):
+            raw, gz = abrir_gzip_texto(output_file + '.gz', gzip_nivel)
+            cerrar[:0] = [gz, raw]
+            handles.append(gz)
+            archivos.append(output_file + '.gz')
+
+        destino = handles[0] if len(handles) == 1 else _MultiWriter(*handles)
+        with PERFIL.etapa('serializacion') as datos:
+            if PERFIL.activo:
+                destino = EscrituraMedida(destino)
+            with XMLTVWriter(destino, tv.attrib, limpiar=True) as writer:
+                for elem in (tv if elementos is None else elementos):
+                    writer.write(elem)
+            for fh in cerrar:
+                fh.close()  # El vaciado final de los buffers también es escritura
+            if PERFIL.activo:
+                datos['escritura_segundos'] = round(destino.segundos, 4)
+    finally:
+        for fh in cerrar:
+            fh.close()
+    return writer.elementos, archivos
+
+def grupo_de_canal(mapping):
+    """Función channel_id -> grupo para los shards: primero el mapping, luego GRUPOS_CANALES."""
+    reglas = [(grupo, ChannelFilter(r, grupo)) for grupo, r in GRUPOS_CANALES.items()]
+
+    def grupo_de(channel_id):
+        if channel_id in mapping.grupos:
+            return mapping.grupos[channel_id]
+        for grupo, filtro in reglas:
+            if channel_id in filtro:
+                return grupo
+        return None
+    return grupo_de
+
+def parse_args(argv=None):
+    """Opciones de línea de comandos; cada una tiene su variable de entorno equivalente."""
+    parser = argparse.ArgumentParser(description="Mergea los feeds EPG configurados en mxepg.xml.")
+    parser.add_argument('--output', default=os.environ.get('EPG_OUTPUT', 'mxepg.xml'),
+                        help="Archivo XMLTV de salida (env EPG_OUTPUT).")
+    parser.add_argument('--gzip', dest='gzip_salida', choices=('no', 'tambien', 'solo'),
+                        default=os.environ.get('EPG_GZIP', 'no'),
+                        help="Escribir además (tambien) o en lugar (solo) un .xml.gz (env EPG_GZIP).")
+    parser.add_argument('--gzip-level', dest='gzip_nivel', type=int, choices=range(1, 10), metavar='1-9',
+                        default=int(os.environ.get('EPG_GZIP_LEVEL', '9')),
+                        help="Nivel de compresión del .gz (env EPG_GZIP_LEVEL, por defecto 9).")
+    parser.add_argument('--shards', choices=('no',) + MODOS_SHARDS, default=os.environ.get('EPG_SHARDS', 'no'),
+                        help="Escribir además shards por día y/o grupo con un manifest.json (env EPG_SHARDS).")
+    parser.add_argument('--shards-dir', dest='shards_dir', default=os.environ.get('EPG_SHARDS_DIR', 'shards'),
+                        help="Directorio de los shards (env EPG_SHARDS_DIR, por defecto shards).")
+    parser.add_argument('--db', default=os.environ.get('EPG_DB', ''),
+                        help="Cargar el merge en esta base SQLite y exportar la salida desde ella (env EPG_DB).")
+    parser.add_argument('--servir', default=os.environ.get('EPG_SERVIR', ''), metavar='[HOST:]PUERTO',
+                        help="Quedarse sirviendo la guía por HTTP y refrescarla periódicamente (env EPG_SERVIR).")
+    parser.add_argument('--refresco', type=float, default=float(os.environ.get('EPG_REFRESCO_MIN', '60')),
+                        help="Minutos entre refrescos en modo servidor (env EPG_REFRESCO_MIN, por defecto 60).")
+    parser.add_argument('--delta', action='store_true', default=os.environ.get('EPG_DELTA', '') == '1',
+                        help="Escribir además <output>.delta.json con los cambios respecto a la salida "
+                             "anterior (env EPG_DELTA=1).")
+    parser.add_argument('--perfil', action='store_true', default=os.environ.get('EPG_PERFIL', '') == '1',
+                        help="Medir tiempo y memoria por etapa y guardar <output>.perfil.json (env EPG_PERFIL=1).")
+    parser.add_argument('--cprofile', action='store_true', default=os.environ.get('EPG_CPROFILE', '') == '1',
+                        help="Con --perfil, volcar además <output>.pstats de cProfile (env EPG_CPROFILE=1).")
+    args = parser.parse_args(argv)
+    if args.db and ORDEN_SALIDA != 'canonico':
+        # La base no guarda la posición de cada programa en su feed (y el historial no la tiene)
+        parser.error(f"--db exporta siempre en orden canónico; no se puede combinar con EPG_ORDEN={ORDEN_SALIDA}")
+    return args
 
+def escribir_delta(args, anterior, elementos, ruta_xml, fuentes, attrib):
+    """Escribe <base>.delta.json (cambios respecto a la salida anterior) y guarda el nuevo estado."""
+    base = base_informe(args.output)
+    with PERFIL.etapa('delta'):
+        cambios = delta_guia.escribir(anterior, elementos, ruta_xml, base + '.delta.json',
+                                      base + '.delta-estado.json', fuentes, dict(attrib))
+    if cambios is None:
+        print(f"Delta: sin salida anterior, se guardan las huellas en {base}.delta-estado.json")
+    else:
+        print(delta_guia.resumen(cambios))
+        print(f"Delta guardado: {base}.delta.json ({os.path.getsize(base + '.delta.json')} bytes)")
+
+def ejecutar_merge(args):
+    """Un ciclo completo: mergea, guarda el XML (y base/shards si se pidieron). Devuelve el <tv> o None."""
+    global PERFIL
     print(f"Iniciando merge de {len(EPG_URLS)} feeds EPG a las {datetime.now()}")
-    
+    PERFIL = Perfil(args.perfil, args.cprofile)
+    PERFIL.iniciar()
+
     # Cargar mappings al inicio
-    mappings = cargar_mappings()
+    with PERFIL.etapa('cargar_mappings'):
+        mapping = cargar_mappings()
     
-    merged_tv = merge_epg_feeds(EPG_URLS)
+    # Los mappings se aplican dentro del merge, mientras se agregan canales y programas
+    fuentes = {} if args.delta else None
+    merged_tv = merge_epg_feeds(EPG_URLS, mapping, fuentes)
     if merged_tv is None:
         print("No se pudo mergear ningún feed.")
-        return
+        return None
 
-    # Aplicar mappings después del merge
-    aplicar_mappings(merged_tv, mappings)
+    if args.delta:
+        # Huellas de la salida anterior, antes de sobrescribirla
+        base = base_informe(args.output)
+        ruta_anterior = args.output + '.gz' if args.gzip_salida == 'solo' else args.output
+        with PERFIL.etapa('delta_anterior'):
+            anterior = delta_guia.cargar_estado(base + '.delta-estado.json', ruta_anterior)
 
-    xml_content = pretty_xml(merged_tv)
+    if args.db:
+        with PERFIL.etapa('db'), EPGStore(args.db) as store:
+            conteo = store.ingerir_merge(merged_tv)
+            canales_purgados, programas_purgados = store.purgar(DB_RETENCION)
+            print(f"Base {args.db}: {conteo['canales']} canales y {conteo['programas']} programas cargados, "
+                  f"{conteo['reemplazados']} reemplazados, {programas_purgados} programas y "
+                  f"{canales_purgados} canales purgados por retención")
+            # La salida cubre la misma ventana que el merge; el resto queda como historial en la base
+            desde = hasta = None
+            if VENTANA_HORAS_ATRAS is not None or VENTANA_HORAS_ADELANTE is not None:
+                desde, hasta = ventana_desde_ahora(VENTANA_HORAS_ATRAS, VENTANA_HORAS_ADELANTE)
+            elementos, archivos = write_xmltv(merged_tv, args.output, args.gzip_salida, args.gzip_nivel,
+                                              store.exportar(desde, hasta, conteo['lote']))
+            if args.delta:
+                escribir_delta(args, anterior, store.exportar(desde, hasta, conteo['lote']), archivos[0],
+                               fuentes, merged_tv.attrib)
+    else:
+        # Guardar en archivo (serialización incremental, sin copias intermedias del documento)
+        elementos, archivos = write_xmltv(merged_tv, args.output, args.gzip_salida, args.gzip_nivel)
+        if args.delta:
+            escribir_delta(args, anterior, merged_tv, archivos[0], fuentes, merged_tv.attrib)
     
-    # Guardar en archivo
-    output_file = 'mxepg.xml'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(xml_content)
-    
-    print(f"Archivo mergeado guardado: {output_file}")
-    print(f"Tamaño aproximado: {len(xml_content)} caracteres")
+    for archivo in archivos:
+        print(f"Archivo mergeado guardado: {archivo} ({elementos} elementos)")
+        print(f"Tamaño: {os.path.getsize(archivo)} bytes")
+
+    if args.shards != 'no':
+        with PERFIL.etapa('shards'):
+            manifiesto = escribir_shards(merged_tv, args.shards_dir, args.shards, write_xmltv,
+                                         grupo_de_canal(mapping), SHARDS_OFFSET,
+                                         args.gzip_salida, args.gzip_nivel)
+        print(f"Shards ({args.shards}): {len(manifiesto['shards'])} archivos en {args.shards_dir}/")
+    PERFIL.detener()
+    for ruta in PERFIL.guardar(base_informe(args.output)):
+        print(f"Informe de rendimiento guardado: {ruta}")
     print("Merge completado exitosamente.")
+    return merged_tv
+
+def servir(args):
+    """Modo servidor: sirve la guía desde memoria y la refresca cada REFRESCO_MINUTOS (ver epg_server.py)."""
+    merged_tv = ejecutar_merge(args)
+    if merged_tv is None:
+        return
+    host, _, puerto = args.servir.rpartition(':')
+    servidor = ServidorGuia((host or '0.0.0.0', int(puerto)), IndiceGuia(merged_tv))
+    servidor.iniciar_en_hilo()
+    print(f"Sirviendo la guía en http://{host or '0.0.0.0'}:{puerto}/ (refresco cada {args.refresco} min)")
+    try:
+        while True:
+            time.sleep(args.refresco * 60)
+            try:
+                merged_tv = ejecutar_merge(args)
+            except Exception as e:
+                # Un refresco fallido no tumba el servidor: se sigue sirviendo la versión anterior
+                print(f"Error en el refresco: {e}. Se mantiene la guía anterior.")
+                continue
+            if merged_tv is not None:
+                servidor.actualizar(IndiceGuia(merged_tv))
+                print(f"Índice actualizado: versión {servidor.indice.version}")
+    except KeyboardInterrupt:
+        print("Deteniendo servidor...")
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+def main(argv=None):
+    """Función principal: mergea y guarda el XML (o lo sirve por HTTP con --servir)."""
+    args = parse_args(argv)
+    if not EPG_URLS:
+        print("No hay URLs configuradas.")
+        return
+    if args.servir:
+        servir(args)
+    else:
+        ejecutar_merge(args)
 
 if __name__ == "__main__":
     main()
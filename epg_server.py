@@ -0,0 +1,241 @@
+"""Servidor HTTP de la guía mergeada a partir de un índice en memoria.
+
+El índice (IndiceGuia) es inmutable: se construye entero a partir del <tv> del merge y el servidor
+lo reemplaza con una sola asignación tras cada refresco, así que cada petición ve una versión
+completa (la anterior o la nueva), nunca una mezcla.
+
+Rutas:
+- /  o  /mxepg.xml                   -> XMLTV completo (precalculado, también en gzip)
+- /xmltv?canal=ID[&canal=ID2][&desde=T][&hasta=T]
+                                      -> XMLTV solo con esos canales y/o programas que tocan el rango
+- /ahora.json[?canal=ID...][&t=T]    -> programa actual y siguiente por canal
+- /estado.json                        -> versión del índice, fecha de carga y conteos
+T es una fecha XMLTV ('20251018120000 -0500') o segundos epoch.
+
+Todas las respuestas llevan ETag (distinto para la versión gzip) y responden 304 a If-None-Match;
+con Accept-Encoding: gzip se sirven comprimidas.
+"""
+import bisect
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from xmltv_time import format_xmltv_time, parse_xmltv_time
+from xmltv_writer import XMLTVWriter
+
+TIPO_XML = 'application/xml; charset=utf-8'
+TIPO_JSON = 'application/json; charset=utf-8'
+
+
+def serializar(elementos, attrib):
+    """XMLTV con el mismo formato que mxepg.xml, como bytes UTF-8."""
+    buffer = io.StringIO()
+    with XMLTVWriter(buffer, attrib, limpiar=True) as writer:
+        for elem in elementos:
+            writer.write(elem)
+    return buffer.getvalue().encode('utf-8')
+
+
+def comprimir(datos):
+    """gzip reproducible (mtime=0): el mismo contenido da los mismos bytes."""
+    return gzip.compress(datos, compresslevel=6, mtime=0)
+
+
+def _etag(datos):
+    return '"' + hashlib.sha256(datos).hexdigest()[:32] + '"'
+
+
+def _instante(valor):
+    """Fecha XMLTV o segundos epoch -> epoch; None si no viene; ValueError si no se entiende."""
+    if not valor:
+        return None
+    if valor.lstrip('-').isdigit() and len(valor) <= 11:
+        return int(valor)
+    epoch = parse_xmltv_time(valor)
+    if epoch is None:
+        raise ValueError(f"Fecha no válida: {valor!r}")
+    return epoch
+
+
+class IndiceGuia:
+    """Canales y programas del merge indexados por canal y ordenados por inicio."""
+
+    def __init__(self, tv):
+        self.attrib = dict(tv.attrib)
+        self.canales = {}      # id -> <channel>
+        self.programas = {}    # id -> [<programme>] ordenados por inicio
+        self.inicios = {}      # id -> [epoch inicio] (paralela a programas, para bisect)
+        self.fines = {}        # id -> [epoch fin o None]
+        sueltos = []           # Programas sin fecha legible: solo salen en el XML completo
+        por_canal = {}
+        for elem in tv:
+            if elem.tag == 'channel':
+                self.canales[elem.get('id')] = elem
+            elif elem.tag == 'programme':
+                inicio = parse_xmltv_time(elem.get('start'))
+                if inicio is None:
+                    sueltos.append(elem)
+                    continue
+                por_canal.setdefault(elem.get('channel'), []).append(
+                    (inicio, parse_xmltv_time(elem.get('stop')), elem))
+        total = 0
+        for channel_id, filas in por_canal.items():
+            filas.sort(key=lambda fila: fila[0])
+            self.inicios[channel_id] = [f[0] for f in filas]
+            self.fines[channel_id] = [f[1] for f in filas]
+            self.programas[channel_id] = [f[2] for f in filas]
+            total += len(filas)
+        self.total_programas = total + len(sueltos)
+
+        # El XML completo se sirve tal cual lo escribió el merge (mismo orden que mxepg.xml)
+        self.completo = serializar(tv, self.attrib)
+        self.completo_gzip = comprimir(self.completo)
+        self.etag = _etag(self.completo)
+        self.version = self.etag.strip('"')
+        self.cargado = datetime.now().astimezone().isoformat(timespec='seconds')
+
+    def _rango(self, channel_id, desde, hasta):
+        """Índices [i, j) de los programas del canal que tocan [desde, hasta)."""
+        inicios = self.inicios.get(channel_id, [])
+        j = bisect.bisect_left(inicios, hasta) if hasta is not None else len(inicios)
+        i = 0
+        if desde is not None:
+            # El primero que puede tocar el rango es el anterior al primer inicio >= desde
+            # (tras resolver_solapes los programas de un canal no se pisan)
+            i = max(0, bisect.bisect_left(inicios, desde) - 1)
+            fines = self.fines[channel_id]
+            while i < j and fines[i] is not None and fines[i] <= desde:
+                i += 1
+        return i, j
+
+    def porcion(self, canales=None, desde=None, hasta=None):
+        """Elementos de un XMLTV parcial: los canales pedidos (o todos) y sus programas en el rango."""
+        ids = [c for c in canales if c in self.canales] if canales else list(self.canales)
+        elementos = [self.canales[c] for c in ids]
+        for channel_id in ids:
+            i, j = self._rango(channel_id, desde, hasta)
+            elementos.extend(self.programas.get(channel_id, [])[i:j])
+        return elementos
+
+    def ahora(self, canales=None, instante=None):
+        """{id: {'nombre', 'ahora', 'siguiente'}} con el programa en emisión y el siguiente."""
+        instante = int(time.time() if instante is None else instante)
+        resultado = {}
+        for channel_id in (canales or list(self.canales)):
+            if channel_id not in self.canales:
+                continue
+            inicios = self.inicios.get(channel_id, [])
+            k = bisect.bisect_right(inicios, instante)  # primer programa que empieza después de ahora
+            actual = None
+            if k > 0:
+                fin = self.fines[channel_id][k - 1]
+                if fin is None or fin > instante:
+                    actual = self._resumen(channel_id, k - 1)
+            siguiente = self._resumen(channel_id, k) if k < len(inicios) else None
+            resultado[channel_id] = {
+                'nombre': self.canales[channel_id].findtext('display-name'),
+                'ahora': actual,
+                'siguiente': siguiente,
+            }
+        return resultado
+
+    def _resumen(self, channel_id, i):
+        elem = self.programas[channel_id][i]
+        fin = self.fines[channel_id][i]
+        return {
+            'titulo': elem.findtext('title'),
+            'inicio': format_xmltv_time(self.inicios[channel_id][i]),
+            'fin': format_xmltv_time(fin) if fin is not None else None,
+            'descripcion': elem.findtext('desc'),
+        }
+
+    def estado(self):
+        return {'version': self.version, 'cargado': self.cargado, 'canales': len(self.canales),
+                'programas': self.total_programas, 'bytes': len(self.completo),
+                'bytes_gzip': len(self.completo_gzip)}
+
+
+class ServidorGuia(ThreadingHTTPServer):
+    """ThreadingHTTPServer con el índice actual; actualizar() lo reemplaza de forma atómica."""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, indice=None):
+        super().__init__(direccion, ManejadorGuia)
+        self.indice = indice
+
+    def actualizar(self, indice):
+        self.indice = indice  # Una asignación: las peticiones en curso siguen con el índice anterior
+
+    def iniciar_en_hilo(self):
+        hilo = threading.Thread(target=self.serve_forever, name='servidor-epg', daemon=True)
+        hilo.start()
+        return hilo
+
+
+class ManejadorGuia(BaseHTTPRequestHandler):
+    server_version = 'EPGMerger/1.0'
+
+    def do_HEAD(self):
+        self.do_GET(cuerpo=False)
+
+    def do_GET(self, cuerpo=True):
+        indice = self.server.indice  # Referencia local: toda la petición usa la misma versión
+        if indice is None:
+            return self._responder(503, TIPO_JSON, b'{"error": "indice no cargado"}', cuerpo=cuerpo)
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        try:
+            if url.path in ('/', '/mxepg.xml'):
+                return self._responder(200, TIPO_XML, indice.completo, indice.completo_gzip, cuerpo, indice.etag)
+            if url.path == '/xmltv':
+                elementos = indice.porcion(params.get('canal'), _instante(params.get('desde', [None])[0]),
+                                           _instante(params.get('hasta', [None])[0]))
+                return self._responder(200, TIPO_XML, serializar(elementos, indice.attrib), cuerpo=cuerpo)
+            if url.path == '/ahora.json':
+                datos = indice.ahora(params.get('canal'), _instante(params.get('t', [None])[0]))
+                return self._responder(200, TIPO_JSON, json.dumps(datos, ensure_ascii=False).encode('utf-8'),
+                                       cuerpo=cuerpo)
+            if url.path == '/estado.json':
+                return self._responder(200, TIPO_JSON, json.dumps(indice.estado()).encode('utf-8'), cuerpo=cuerpo)
+        except ValueError as e:
+            return self._responder(400, TIPO_JSON, json.dumps({'error': str(e)}).encode('utf-8'), cuerpo=cuerpo)
+        self._responder(404, TIPO_JSON, b'{"error": "ruta desconocida"}', cuerpo=cuerpo)
+
+    def _acepta_gzip(self):
+        return 'gzip' in self.headers.get('Accept-Encoding', '').lower()
+
+    def _responder(self, estado, tipo, datos, datos_gzip=None, cuerpo=True, etag=None):
+        usar_gzip = estado == 200 and self._acepta_gzip() and len(datos) > 1024
+        if usar_gzip and datos_gzip is None:
+            datos_gzip = comprimir(datos)
+        enviar = datos_gzip if usar_gzip else datos
+        # La variante gzip lleva su propio ETag (los bytes son otros)
+        etag = (etag or _etag(datos))[:-1] + ('-gz"' if usar_gzip else '"')
+        if estado == 200 and etag in [e.strip() for e in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        self.send_response(estado)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(enviar)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if estado == 200:
+            self.send_header('ETag', etag)
+        if usar_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if cuerpo:
+            self.wfile.write(enviar)
+
+    def log_message(self, formato, *args):
+        pass  # El merger ya imprime lo suyo; el acceso por petición no aporta en los logs
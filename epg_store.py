@@ -0,0 +1,304 @@
+"""Almacén SQLite de la guía: canales y programas indexados por (channel, start).
+
+Cada canal/programa se guarda como su fragmento XML original (sin tail), más las columnas que se
+consultan: channel, start/stop en epoch UTC (ver xmltv_time.py), la fuente y el lote de ingesta.
+Así la exportación reproduce los elementos tal cual y las consultas por canal y rango usan el índice.
+
+- ingerir_merge(tv): carga el resultado de merge_epg_feeds. Por canal, el merge nuevo manda en el
+  rango de tiempo que cubre: se hace upsert por (channel, start) y se borran los programas antiguos
+  que se solapan con ese rango y ya no vienen (horarios que cambiaron). Lo que queda fuera del
+  rango se conserva como historial hasta purgar().
+- ingerir_archivo(ruta, fuente): carga un XMLTV cualquiera (dish.xml, mvshub.xml...) en streaming,
+  con upsert por (channel, start) y sin borrar nada.
+- programas(channel, desde, hasta): lo que emite un canal entre dos instantes.
+- exportar(desde, hasta, lote): genera los elementos en orden (canales y luego programas por canal e
+  inicio) para escribirlos con XMLTVWriter sin cargar la guía completa en memoria. Con `lote` (el de
+  ingerir_merge) solo salen los canales de ese merge y sus programas: los canales filtrados, renombrados
+  o que ya no vienen en ningún feed quedan en la base hasta purgar(), pero no en la salida.
+
+Uso desde la línea de comandos:
+    python epg_store.py epg.sqlite ingest dish.xml mvshub.xml
+    python epg_store.py epg.sqlite query 306 20251018120000 20251018180000
+    python epg_store.py epg.sqlite export salida.xml
+"""
+import argparse
+import sqlite3
+import time
+
+import xml_backend
+from xmltv_time import format_xmltv_time, parse_xmltv_time
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id TEXT PRIMARY KEY,
+    orden INTEGER NOT NULL,
+    xml TEXT NOT NULL,
+    fuente TEXT,
+    lote INTEGER NOT NULL,
+    visto REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS programmes (
+    channel TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER,
+    xml TEXT NOT NULL,
+    fuente TEXT,
+    lote INTEGER NOT NULL,
+    PRIMARY KEY (channel, start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS programmes_stop ON programmes (stop);
+CREATE TABLE IF NOT EXISTS lotes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fuente TEXT,
+    fecha REAL NOT NULL,
+    canales INTEGER NOT NULL DEFAULT 0,
+    programas INTEGER NOT NULL DEFAULT 0,
+    rechazados INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+UPSERT_CANAL = """
+INSERT INTO channels (id, orden, xml, fuente, lote, visto) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET orden = excluded.orden, xml = excluded.xml, fuente = excluded.fuente,
+    lote = excluded.lote, visto = excluded.visto
+"""
+
+UPSERT_PROGRAMA = """
+INSERT INTO programmes (channel, start, stop, xml, fuente, lote) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (channel, start) DO UPDATE SET stop = excluded.stop, xml = excluded.xml,
+    fuente = excluded.fuente, lote = excluded.lote
+"""
+
+LOTE_FILAS = 5000  # Filas por executemany
+
+
+def _fragmento(elem):
+    """XML del elemento sin su tail (el formato lo pone el escritor al exportar)."""
+    tail, elem.tail = elem.tail, None
+    try:
+        return xml_backend.tostring(elem)
+    finally:
+        elem.tail = tail
+
+
+class EPGStore:
+    """Base de datos SQLite de la guía. No es seguro compartir una instancia entre hilos."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.conn = sqlite3.connect(ruta)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(ESQUEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _nuevo_lote(self, fuente):
+        return self.conn.execute('INSERT INTO lotes (fuente, fecha) VALUES (?, ?)',
+                                 (fuente, time.time())).lastrowid
+
+    def _ingerir(self, elementos, fuente, reemplazar_rango):
+        """Upsert de una secuencia de <channel>/<programme>. Devuelve el resumen del lote."""
+        ahora = time.time()
+        with self.conn:
+            lote = self._nuevo_lote(fuente)
+            orden_base = self.conn.execute('SELECT COALESCE(MAX(orden), -1) + 1 FROM channels').fetchone()[0]
+            canales = []
+            programas = []
+            rangos = {}  # channel -> [min start, max stop] de este lote
+            conteo = {'canales': 0, 'programas': 0, 'rechazados': 0}
+
+            def volcar():
+                if canales:
+                    self.conn.executemany(UPSERT_CANAL, canales)
+                    conteo['canales'] += len(canales)
+                    canales.clear()
+                if programas:
+                    self.conn.executemany(UPSERT_PROGRAMA, programas)
+                    conteo['programas'] += len(programas)
+                    programas.clear()
+
+            for elem in elementos:
+                if elem.tag == 'channel':
+                    channel_id = elem.get('id')
+                    if not channel_id:
+                        conteo['rechazados'] += 1
+                        continue
+                    # En un merge el orden de los canales es el del documento; en un archivo suelto
+                    # los canales nuevos van detrás de los existentes
+                    orden = (conteo['canales'] + len(canales)) if reemplazar_rango else orden_base + len(canales)
+                    canales.append((channel_id, orden, _fragmento(elem), fuente, lote, ahora))
+                elif elem.tag == 'programme':
+                    channel_id = elem.get('channel')
+                    start = parse_xmltv_time(elem.get('start'))
+                    if not channel_id or start is None:
+                        conteo['rechazados'] += 1  # Sin clave no hay upsert posible
+                        continue
+                    stop = parse_xmltv_time(elem.get('stop'))
+                    programas.append((channel_id, start, stop, _fragmento(elem), fuente, lote))
+                    rango = rangos.get(channel_id)
+                    fin = stop if stop is not None else start
+                    if rango is None:
+                        rangos[channel_id] = [start, fin]
+                    else:
+                        rango[0] = min(rango[0], start)
+                        rango[1] = max(rango[1], fin)
+                if len(canales) + len(programas) >= LOTE_FILAS:
+                    if not reemplazar_rango:
+                        orden_base += len(canales)
+                    volcar()
+            volcar()
+
+            reemplazados = 0
+            if reemplazar_rango:
+                for channel_id, (desde, hasta) in rangos.items():
+                    reemplazados += self.conn.execute(
+                        'DELETE FROM programmes WHERE channel = ? AND start < ? AND COALESCE(stop, start) > ? '
+                        'AND lote <> ?', (channel_id, hasta, desde, lote)).rowcount
+            conteo['reemplazados'] = reemplazados
+            conteo['lote'] = lote
+            if reemplazar_rango:
+                # Los canales que no vinieron en este merge pasan detrás de los suyos (el orden 0..n-1 es
+                # ahora de los canales del merge), conservando su orden relativo
+                self.conn.execute('UPDATE channels SET orden = orden + ? WHERE lote <> ?',
+                                  (conteo['canales'], lote))
+            self.conn.execute('UPDATE lotes SET canales = ?, programas = ?, rechazados = ? WHERE id = ?',
+                              (conteo['canales'], conteo['programas'], conteo['rechazados'], lote))
+        return conteo
+
+    def ingerir_merge(self, tv, fuente='merge'):
+        """Carga el <tv> devuelto por merge_epg_feeds (o cualquier iterable de elementos)."""
+        return self._ingerir(iter(tv), fuente, reemplazar_rango=True)
+
+    def ingerir_archivo(self, ruta, fuente=None):
+        """Carga un XMLTV en disco en streaming (cada elemento se suelta en cuanto se guarda)."""
+        def elementos():
+            contexto = xml_backend.iterparse(ruta, events=('start', 'end'))
+            _, root = next(contexto)
+            for evento, elem in contexto:
+                if evento == 'end' and elem.tag in ('channel', 'programme'):
+                    yield elem
+                    root.remove(elem)
+        return self._ingerir(elementos(), fuente or ruta, reemplazar_rango=False)
+
+    def programas(self, channel_id, desde=None, hasta=None):
+        """Filas (start, stop, xml) de los programas de un canal que tocan [desde, hasta)."""
+        condiciones = ['channel = ?']
+        parametros = [channel_id]
+        if hasta is not None:
+            condiciones.append('start < ?')
+            parametros.append(hasta)
+        if desde is not None:
+            condiciones.append('(stop > ? OR (stop IS NULL AND start >= ?))')
+            parametros.extend([desde, desde])
+        return self.conn.execute(
+            f"SELECT start, stop, xml FROM programmes WHERE {' AND '.join(condiciones)} ORDER BY start",
+            parametros).fetchall()
+
+    def exportar(self, desde=None, hasta=None, lote=None):
+        """Genera los <channel> y luego los <programme> (por orden de canal e inicio) que tocan el rango.
+
+        Con `lote`, solo los canales guardados por ese lote con sus programas (incluido su historial) y
+        los programas que trajo ese lote aunque su canal no venga: lo mismo que escribiría ese merge.
+        """
+        condiciones = []
+        parametros = []
+        orden_canal = 'c.orden'
+        if lote is not None:
+            canales = self.conn.execute('SELECT xml FROM channels WHERE lote = ? ORDER BY orden, id', (lote,))
+            condiciones.append('(c.lote = ? OR p.lote = ?)')
+            parametros.extend([lote, lote])
+            # Los programas cuyo canal no es del lote van al final por ID, como en la salida directa
+            orden_canal = f'CASE WHEN c.lote = {int(lote)} THEN c.orden END'
+        else:
+            canales = self.conn.execute('SELECT xml FROM channels ORDER BY orden, id')
+        for (xml,) in canales.fetchall():
+            yield xml_backend.fromstring(xml)
+        if hasta is not None:
+            condiciones.append('p.start < ?')
+            parametros.append(hasta)
+        if desde is not None:
+            condiciones.append('(p.stop > ? OR (p.stop IS NULL AND p.start >= ?))')
+            parametros.extend([desde, desde])
+        donde = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+        # Un cursor aparte: las filas se leen de a poco mientras se escriben
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT p.xml FROM programmes p LEFT JOIN channels c ON c.id = p.channel
+            {donde} ORDER BY {orden_canal} IS NULL, {orden_canal}, p.channel, p.start""", parametros)
+        for (xml,) in cursor:
+            yield xml_backend.fromstring(xml)
+
+    def purgar(self, retencion_segundos, ahora=None):
+        """Borra programas terminados y canales no vistos hace más de `retencion_segundos`."""
+        limite = (time.time() if ahora is None else ahora) - retencion_segundos
+        with self.conn:
+            programas = self.conn.execute('DELETE FROM programmes WHERE COALESCE(stop, start) < ?',
+                                          (int(limite),)).rowcount
+            canales = self.conn.execute('DELETE FROM channels WHERE visto < ?', (limite,)).rowcount
+        return canales, programas
+
+    def estadisticas(self):
+        canales = self.conn.execute('SELECT COUNT(*) FROM channels').fetchone()[0]
+        programas, inicio, fin = self.conn.execute(
+            'SELECT COUNT(*), MIN(start), MAX(stop) FROM programmes').fetchone()
+        return {'canales': canales, 'programas': programas, 'desde': inicio, 'hasta': fin}
+
+
+def _instante(valor):
+    """Acepta una fecha XMLTV o segundos epoch."""
+    if valor is None:
+        return None
+    return int(valor) if valor.isdigit() and len(valor) <= 10 else parse_xmltv_time(valor)
+
+
+def main(argv=None):
+    from xmltv_writer import XMLTVWriter
+
+    parser = argparse.ArgumentParser(description="Almacén SQLite de la guía EPG.")
+    parser.add_argument('db', help="Archivo SQLite.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_ingest = sub.add_parser('ingest', help="Cargar uno o más XMLTV.")
+    p_ingest.add_argument('archivos', nargs='+')
+    p_query = sub.add_parser('query', help="Programas de un canal en un rango (fechas XMLTV o epoch).")
+    p_query.add_argument('canal')
+    p_query.add_argument('desde', nargs='?')
+    p_query.add_argument('hasta', nargs='?')
+    p_export = sub.add_parser('export', help="Exportar a XMLTV.")
+    p_export.add_argument('salida')
+    p_export.add_argument('--desde')
+    p_export.add_argument('--hasta')
+    sub.add_parser('stats', help="Resumen del contenido.")
+    args = parser.parse_args(argv)
+
+    with EPGStore(args.db) as store:
+        if args.comando == 'ingest':
+            for ruta in args.archivos:
+                print(f"{ruta}: {store.ingerir_archivo(ruta)}")
+        elif args.comando == 'query':
+            inicio = time.perf_counter()
+            filas = store.programas(args.canal, _instante(args.desde), _instante(args.hasta))
+            for start, stop, xml in filas:
+                titulo = xml_backend.fromstring(xml).findtext('title')
+                fin = format_xmltv_time(stop) if stop is not None else '?'
+                print(f"{format_xmltv_time(start)} - {fin}  {titulo}")
+            print(f"{len(filas)} programas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        elif args.comando == 'export':
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                with XMLTVWriter(f, limpiar=True) as writer:
+                    for elem in store.exportar(_instante(args.desde), _instante(args.hasta)):
+                        writer.write(elem)
+            print(f"Exportados {writer.elementos} elementos a {args.salida}")
+        else:
+            print(store.estadisticas())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Estado de sesión de Playwright (cookies y localStorage) guardado en disco con caducidad.
+
+Los scrapers con navegador (fetchdish-28hrs.py, mvshubnew.py) cargaban en cada ejecución una SPA
+pesada solo para obtener la sesión. Con esto la sesión se guarda con ``context.storage_state()`` en
+``<directorio>/<nombre>.json`` junto con la hora de guardado y datos propios del script (p. ej. el UUID
+de mvshub); mientras no pase ``ttl`` segundos, los contextos nuevos se crean ya con ese estado y el
+script puede saltarse la navegación de calentamiento o no abrir el navegador en absoluto.
+
+El estado guardado puede dejar de valer antes de caducar (el servidor invalida la sesión): cada script
+hace su propia comprobación barata y llama a invalidar() si falla.
+
+Variables de entorno: PLAYWRIGHT_ESTADO_DIR (por defecto .playwright-estado; '' lo desactiva) y
+PLAYWRIGHT_ESTADO_TTL (segundos, por defecto 24 h).
+"""
+import json
+import os
+import time
+
+DIRECTORIO = os.environ.get('PLAYWRIGHT_ESTADO_DIR', '.playwright-estado')
+TTL_SEG = float(os.environ.get('PLAYWRIGHT_ESTADO_TTL', str(24 * 3600)))
+
+
+class EstadoNavegador:
+    """Estado de sesión de un sitio: {'guardado': epoch, 'datos': {...}, 'storage_state': {...}}."""
+
+    def __init__(self, nombre, directorio=DIRECTORIO, ttl=TTL_SEG):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.ruta = os.path.join(directorio, nombre + '.json') if directorio else None
+        self._entrada = None
+
+    def cargar(self):
+        """Entrada guardada si existe y no ha caducado; None si no (o si está dañada)."""
+        if self._entrada is not None or self.ruta is None:
+            return self._entrada
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                entrada = json.load(f)
+            edad = time.time() - float(entrada['guardado'])
+            if not isinstance(entrada.get('storage_state'), dict):
+                raise ValueError("sin storage_state")
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if edad > self.ttl:
+            print(f"Estado de navegador '{self.nombre}' caducado ({edad / 3600:.1f} h), se descarta.")
+            return None
+        self._entrada = entrada
+        return entrada
+
+    def storage_state(self):
+        """Estado para ``browser.new_context(storage_state=...)``, o None si no hay uno vigente."""
+        entrada = self.cargar()
+        return entrada['storage_state'] if entrada else None
+
+    def cookies(self):
+        """Cookies guardadas que no han expirado ([] si no hay estado vigente)."""
+        ahora = time.time()
+        return [c for c in (self.storage_state() or {}).get('cookies', [])
+                if c.get('expires', -1) in (-1, None) or c['expires'] > ahora]
+
+    def datos(self):
+        """Datos propios guardados con el estado ({} si no hay estado vigente)."""
+        entrada = self.cargar()
+        return dict(entrada.get('datos') or {}) if entrada else {}
+
+    async def nuevo_contexto(self, browser, **opciones):
+        """Contexto nuevo con el estado guardado si lo hay. Devuelve (context, restaurado)."""
+        estado = self.storage_state()
+        if estado is not None:
+            opciones['storage_state'] = estado
+        return await browser.new_context(**opciones), estado is not None
+
+    async def guardar(self, context, **datos):
+        """Guarda el estado actual de `context` (y `datos`) con la hora de ahora."""
+        if self.ruta is None:
+            return
+        entrada = {'guardado': time.time(), 'datos': datos, 'storage_state': await context.storage_state()}
+        os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+        tmp = self.ruta + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entrada, f)
+        os.replace(tmp, self.ruta)
+        self._entrada = entrada
+
+    def invalidar(self):
+        """Borra el estado guardado (la sesión ya no vale)."""
+        self._entrada = None
+        if self.ruta is None:
+            return
+        try:
+            os.remove(self.ruta)
+        except FileNotFoundError:
+            pass
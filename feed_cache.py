@@ -0,0 +1,101 @@
+"""Caché de resultados intermedios por feed para el merge incremental.
+
+Guarda los <channel>/<programme> que un feed conservó tras el filtrado, indexados por una clave que
+combina el hash del contenido crudo del feed, el hash de su entrada en FILTERS y una versión del
+procesado. Si en la siguiente ejecución el feed no cambió, el merger recarga ese resultado (pequeño)
+en vez de parsear y filtrar de nuevo el feed completo.
+
+Cada entrada es un documento <tv> comprimido con gzip que contiene los elementos serializados con
+el backend XML (tails incluidos), así que al re-parsearlo se obtienen elementos idénticos y el XML
+mergeado sale igual que en una reconstrucción completa.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import xml_backend
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_archivo(ruta):
+    """SHA-256 del contenido de un archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def hash_filtro(filtro):
+    """Hash estable de una entrada de FILTERS (None o lista vacía = sin filtro)."""
+    normalizado = sorted(set(filtro)) if filtro else None
+    return hashlib.sha256(json.dumps(normalizado).encode('utf-8')).hexdigest()
+
+
+class FeedCache:
+    """Resultados filtrados por feed, direccionados por contenido.
+
+    - version: se mezcla en la clave; cambiarla invalida todas las entradas (p. ej. si cambia
+      la lógica de parseo/filtrado).
+    - max_age: segundos sin uso tras los que purgar() borra una entrada.
+    """
+
+    def __init__(self, directorio, version, max_age=7 * 24 * 3600):
+        self.directorio = directorio
+        self.version = str(version)
+        self.max_age = max_age
+        os.makedirs(directorio, exist_ok=True)
+
+    def clave(self, ruta_feed, filtro):
+        """Clave de la entrada para el archivo crudo `ruta_feed` filtrado con `filtro`."""
+        h = hashlib.sha256()
+        h.update(self.version.encode('utf-8'))
+        h.update(hash_archivo(ruta_feed).encode('ascii'))
+        h.update(hash_filtro(filtro).encode('ascii'))
+        return h.hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + '.xml.gz')
+
+    def ruta_si_existe(self, clave):
+        """Ruta del resultado guardado (y marca la entrada como usada), o None si no existe."""
+        ruta = self._ruta(clave)
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        return ruta
+
+    def guardar(self, clave, elementos):
+        """Guarda los elementos conservados de un feed (en el orden en que deben recargarse)."""
+        ruta = self._ruta(clave)
+        tmp = ruta + '.tmp'
+        with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=1) as f:
+            f.write('<tv>')
+            for elem in elementos:
+                f.write(xml_backend.tostring(elem))
+            f.write('</tv>')
+        os.replace(tmp, ruta)
+
+    def guardar_serializado(self, clave, datos):
+        """Igual que guardar(), con los elementos ya serializados como un <tv> en UTF-8
+        (el resultado que devuelve un proceso trabajador, ver feed_parser.parsear_serializado)."""
+        ruta = self._ruta(clave)
+        tmp = ruta + '.tmp'
+        with gzip.open(tmp, 'wb', compresslevel=1) as f:
+            f.write(datos)
+        os.replace(tmp, ruta)
+
+    def purgar(self):
+        """Borra las entradas sin uso en max_age segundos y devuelve cuántas se borraron."""
+        limite = time.time() - self.max_age
+        borradas = 0
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+                borradas += 1
+        return borradas
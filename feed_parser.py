@@ -0,0 +1,139 @@
+"""Parseo en streaming de feeds XMLTV (comprimidos o no), filtrado por canal y por ventana.
+
+Lo usa el merger en sus hilos y, con el pool de procesos, cada proceso trabajador: parsear_serializado
+parsea y filtra un feed en disco y devuelve el resultado como bytes (un <tv> con los elementos
+conservados, el mismo formato que guarda feed_cache), que viajan entre procesos mucho más baratos
+que los Element y el padre vuelve a convertir con recolectar_feed.
+recolectar_feed guarda lo conservado como registros compactos (ver registros.py), no como Element.
+"""
+import bz2
+import gzip
+import io
+import lzma
+
+import xml_backend
+from channel_filter import ChannelFilter
+from perfil import FiltroMedido
+from registros import registro
+from xmltv_time import en_ventana
+
+
+class _StreamConPrefijo(io.RawIOBase):
+    """Stream de solo lectura que devuelve primero `prefijo` y después el resto de `fuente`.
+
+    Permite mirar los primeros bytes de un cuerpo HTTP sin depender de su estado `closed`
+    (urllib3 se marca cerrado al agotar el cuerpo, y gzip siempre lee una vez más al final).
+    """
+
+    def __init__(self, prefijo, fuente):
+        self._prefijo = prefijo
+        self._fuente = fuente
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefijo:
+            n = min(len(buffer), len(self._prefijo))
+            buffer[:n] = self._prefijo[:n]
+            self._prefijo = self._prefijo[n:]
+            return n
+        data = self._fuente.read(len(buffer)) or b''
+        n = len(data)
+        buffer[:n] = data
+        return n
+
+
+def abrir_descomprimido(fuente):
+    """Detecta gzip/xz/bzip2 por los bytes mágicos y devuelve un stream que descomprime al vuelo.
+
+    Sirve tanto para archivos locales como para cuerpos HTTP (guías publicadas como .xml.gz).
+    Si la entrada no está comprimida devuelve un stream equivalente sin descomprimir.
+    """
+    if hasattr(fuente, 'peek'):
+        cabecera = fuente.peek(6)[:6]
+    else:
+        cabecera = fuente.read(6) or b''
+        fuente = io.BufferedReader(_StreamConPrefijo(cabecera, fuente))
+    if cabecera.startswith(b'\x1f\x8b'):
+        return gzip.GzipFile(fileobj=fuente, mode='rb')
+    if cabecera.startswith(b'\xfd7zXZ\x00'):
+        return lzma.LZMAFile(fuente, mode='rb')
+    if cabecera.startswith(b'BZh'):
+        return bz2.BZ2File(fuente, mode='rb')
+    return fuente
+
+
+def iterparse_feed(fuente, filtro=None, ventana=None):
+    """Recorre un XMLTV de forma incremental y devuelve ('channel'|'programme', elemento) para los que pasan el filtro.
+
+    Cada elemento de primer nivel se desprende de la raíz en cuanto se cierra, así que los descartados
+    se liberan de inmediato y la memoria solo crece con lo que se conserva.
+    Con `ventana` (desde, hasta) en epoch también se descartan los programas fuera de ese rango.
+    La entrada puede venir comprimida (gzip/xz/bzip2); se descomprime en streaming.
+    Lanza ValueError si la raíz no es <tv>.
+    """
+    filtrar = bool(filtro)  # Lista/set de IDs o ChannelFilter; vacío o None = sin filtro
+    root = None
+    profundidad = 0
+    for evento, elem in xml_backend.iterparse(abrir_descomprimido(fuente), events=('start', 'end')):
+        if evento == 'start':
+            if root is None:
+                if elem.tag != 'tv':
+                    raise ValueError(f"raíz <{elem.tag}> en lugar de <tv>")
+                root = elem
+            profundidad += 1
+            continue
+
+        profundidad -= 1
+        if profundidad != 1:
+            continue
+        # La raíz solo tiene vivo este hijo (los anteriores ya se quitaron), así que remove() es O(1)
+        root.remove(elem)
+        if elem.tag == 'channel':
+            clave = elem.get('id')
+        elif elem.tag == 'programme':
+            clave = elem.get('channel')
+        else:
+            continue
+        if filtrar and clave not in filtro:
+            continue  # Descartado: no queda ninguna referencia al elemento
+        if ventana is not None and elem.tag == 'programme' and \
+                not en_ventana(elem.get('start'), elem.get('stop'), ventana):
+            continue
+        yield elem.tag, elem
+
+
+def recolectar_feed(fuente, filtro, ventana=None):
+    """Consume iterparse_feed y separa canales y programas conservados, como registros compactos
+    (cada Element se convierte y se suelta en cuanto sale del parser)."""
+    canales = []
+    programas = []
+    for tag, elem in iterparse_feed(fuente, filtro, ventana):
+        if tag == 'channel':
+            canales.append(registro(elem))
+        else:
+            programas.append(registro(elem))
+    return canales, programas
+
+
+def parsear_serializado(ruta, reglas=None, medir_filtro=False):
+    """Trabajador del pool de procesos: parsea y filtra `ruta` con las reglas de su entrada de FILTERS.
+
+    Devuelve (datos, vistos, segundos_filtro): `datos` son los elementos conservados como un <tv> en
+    UTF-8, sin recortar por ventana (así sirven tal cual para feed_cache); `vistos` son los IDs de canal
+    que pasaron el filtro, para que el padre pueda informar de las reglas sin coincidencia. Con
+    `medir_filtro` (--perfil) segundos_filtro es el tiempo pasado en el filtro; si no, 0.
+    """
+    filtro = ChannelFilter(reglas) if reglas else None
+    if filtro is not None and medir_filtro:
+        filtro = FiltroMedido(filtro)
+    partes = [b'<tv>']
+    vistos = []
+    with open(ruta, 'rb') as f:
+        for tag, elem in iterparse_feed(f, filtro):
+            if tag == 'channel':
+                vistos.append(elem.get('id'))
+            partes.append(xml_backend.tostring(elem, encoding='utf-8'))
+    partes.append(b'</tv>')
+    return b''.join(partes), vistos, getattr(filtro, 'segundos', 0.0)
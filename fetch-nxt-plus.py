@@ -1,4 +1,8 @@
-import xml.etree.ElementTree as ET
+import os
+
+import xml_backend
+from xmltv_time import en_ventana, horas_ventana_env, ventana_desde_ahora
+from xmltv_writer import XMLTVWriter
 
 # Lista de IDs que quieres filtrar
 CANAL_IDS = [
@@ -9,47 +13,67 @@ CANAL_IDS = [
 INPUT_FILE = "nxt-plus-unfiltered.xml"
 OUTPUT_FILE = "nxt-plus.xml"
 
+# Solo se conservan programas que terminan después de ahora-ATRAS y empiezan antes de ahora+ADELANTE (None = sin límite).
+# Misma ventana que epg-merger.py: EPG_VENTANA_ATRAS / EPG_VENTANA_ADELANTE (en horas; vacías o sin definir = sin límite).
+VENTANA_HORAS_ATRAS, VENTANA_HORAS_ADELANTE = horas_ventana_env()
+
 def filtrar_canales():
     try:
-        tree = ET.parse(INPUT_FILE)
+        tree = xml_backend.parse(INPUT_FILE)
         root = tree.getroot()
 
-        # Crear nuevo XML raíz
-        tv = ET.Element('tv')
-        tv.set('generator-info-name', 'Filtered EPG Script')
-        tv.set('generator-info-url', 'https://github.com/tu-usuario/tu-repo')
-
-        # Agregar canales que estén en la lista CANAL_IDS
-        canales_encontrados = 0
+        # Canales que estén en la lista CANAL_IDS
+        canales = []
         for canal_id in CANAL_IDS:
             canal = root.find(f"./channel[@id='{canal_id}']")
             if canal is not None:
-                tv.append(canal)
-                canales_encontrados += 1
+                canales.append(canal)
             else:
                 print(f"Canal con id '{canal_id}' no encontrado en el XML.")
 
-        print(f"Canales encontrados y agregados: {canales_encontrados}/{len(CANAL_IDS)}")
+        print(f"Canales encontrados y agregados: {len(canales)}/{len(CANAL_IDS)}")
 
-        # Agregar programas que correspondan a cualquiera de los canales en CANAL_IDS
-        programas = root.findall("./programme")
-        programas_agregados = 0
-        for prog in programas:
+        # Programas que correspondan a cualquiera de los canales en CANAL_IDS y caigan en la ventana
+        ventana = ventana_desde_ahora(VENTANA_HORAS_ATRAS, VENTANA_HORAS_ADELANTE)
+        programas = []
+        fuera_de_ventana = 0
+        for prog in root.findall("./programme"):
             if prog.get('channel') in CANAL_IDS:
-                tv.append(prog)
-                programas_agregados += 1
+                if not en_ventana(prog.get('start'), prog.get('stop'), ventana):
+                    fuera_de_ventana += 1
+                    continue
+                programas.append(prog)
+
+        print(f"Programas agregados: {len(programas)} (fuera de ventana: {fuera_de_ventana})")
 
-        print(f"Programas agregados: {programas_agregados}")
+        # Guardar XML filtrado con declaración y encoding UTF-8 en un temporal y reemplazar al final:
+        # si algo falla, el nxt-plus.xml anterior queda intacto
+        tmp = OUTPUT_FILE + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8', errors='xmlcharrefreplace') as f:
+                with XMLTVWriter(f, attrib={
+                    'generator-info-name': 'Filtered EPG Script',
+                    'generator-info-url': 'https://github.com/tu-usuario/tu-repo'
+                }, estilo='etree', indent=None) as writer:
+                    for elem in canales + programas:
+                        writer.write(elem)
+            os.replace(tmp, OUTPUT_FILE)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
 
-        # Guardar XML filtrado con declaración y encoding UTF-8
-        tree_filtrado = ET.ElementTree(tv)
-        tree_filtrado.write(OUTPUT_FILE, encoding='utf-8', xml_declaration=True)
         print(f"Archivo filtrado guardado en {OUTPUT_FILE}")
 
-    except ET.ParseError as e:
+    except xml_backend.ParseError as e:
         print(f"Error al parsear XML: {e}")
-    except FileNotFoundError:
-        print(f"Archivo {INPUT_FILE} no encontrado.")
+    except OSError as e:
+        # Con ElementTree un archivo inexistente da FileNotFoundError y lxml un OSError genérico: se mira
+        # la ruta para no dar por "no encontrado" un error de permisos, de disco o del archivo de salida
+        if not os.path.exists(INPUT_FILE):
+            print(f"Archivo {INPUT_FILE} no encontrado.")
+        else:
+            print(f"Error de E/S: {e}")
 
 if __name__ == "__main__":
     filtrar_canales()
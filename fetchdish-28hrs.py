@@ -1,148 +1,394 @@
 import asyncio
+import bisect
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
-from playwright.async_api import async_playwright
+from playwright.async_api import Error as PlaywrightError, async_playwright
 import json
+import os
 import re  # Para manipular la URL del thumbnail
+import requests
+
+from channel_filter import ARCHIVO_FILTROS, ChannelFilter, cargar_filtros
+from estado_navegador import EstadoNavegador
+from xmltv_writer import XMLTVWriter
 
 URL_TEMPLATE = ("https://tvlistings.gracenote.com/api/grid?"
                 "lineupId=MEX-1008175-DEFAULT&timespan=6&headendId=1008175&country=MEX&timezone=&device=-"
                 "&postalCode=&isOverride=true&pref=16,128&userId=-&aid=dishmex&languagecode=es-mx&time={timestamp}")
 
-async def fetch_multiple(num_fetches=5, interval_seconds=21000):
-    """Realiza múltiples fetches de EPG con timestamps incrementales."""
-    base_ts = int(time.time())
-    all_data = []
-    pending_responses = {}  # url -> response object or None
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent=(
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
-        ))
-        page = await context.new_page()
-
+PAGINA_GRID = "https://tvlistings.gracenote.com/grid-affiliates.html?aid=dishmex"
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
+
+# Modo de descarga del grid (variable de entorno DISH_MODO):
+#   'http'      -> el navegador solo carga la página para obtener las cookies y se cierra; las ventanas
+#                  se piden con requests (pool de conexiones) y solo las rechazadas vuelven al navegador
+#   'navegador' -> todas las ventanas se piden desde la página (comportamiento anterior)
+MODO = os.environ.get('DISH_MODO', 'http')
+
+# Lista de canales a conservar: la entrada de esta URL (donde se publica dish.xml) en filtros.json, el
+# mismo archivo que usa epg-merger.py, así los canales descartados no se guardan ni se escriben.
+# Con DISH_SALIDA_COMPLETA=<archivo> (p. ej. dish-completo.xml) se escribe además la guía sin filtrar
+# para depurar. Variables de entorno: EPG_FILTROS / DISH_FILTRO_URL / DISH_SALIDA_COMPLETA.
+ARCHIVO_FILTROS_DISH = os.environ.get('EPG_FILTROS', ARCHIVO_FILTROS)
+FILTRO_URL = os.environ.get('DISH_FILTRO_URL', 'https://raw.githubusercontent.com/Dingolobo/test/refs/heads/main/dish.xml')
+SALIDA_COMPLETA = os.environ.get('DISH_SALIDA_COMPLETA', '')
+
+# Sesión del grid (cookies + localStorage) guardada entre ejecuciones, ver estado_navegador.py
+ESTADO = EstadoNavegador('dish')
+
+# Ventanas del grid pedidas a la vez (como mucho), tiempo máximo por petición y reintentos por ventana.
+# Variables de entorno: DISH_CONCURRENCIA / DISH_TIMEOUT_SEG / DISH_REINTENTOS.
+CONCURRENCIA = int(os.environ.get('DISH_CONCURRENCIA', '4'))
+TIMEOUT_SEG = float(os.environ.get('DISH_TIMEOUT_SEG', '30'))
+REINTENTOS = int(os.environ.get('DISH_REINTENTOS', '2'))
+
+# fetch dentro de la página (mismas cookies/sesión que el navegador) que devuelve el cuerpo
+# directamente, con AbortController para cortar las respuestas que no llegan a tiempo
+FETCH_JS = """
+async ({url, timeoutMs}) => {
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), timeoutMs);
+    try {
+        const response = await fetch(url, {
+            headers: {
+                "Accept": "application/json, text/javascript, */*; q=0.01",
+                "X-Requested-With": "XMLHttpRequest"
+            },
+            credentials: "include",
+            signal: controller.signal
+        });
+        return {status: response.status, body: await response.text()};
+    } catch (e) {
+        return {status: 0, error: String(e)};
+    } finally {
+        clearTimeout(timer);
+    }
+}
+"""
+
+async def fetch_ventana(page, url, timeout=TIMEOUT_SEG, reintentos=REINTENTOS):
+    """Pide una ventana del grid y devuelve su JSON; reintenta con espera creciente si falla."""
+    ultimo_error = None
+    for intento in range(reintentos + 1):
+        if intento:
+            await asyncio.sleep(2 ** intento)
+        try:
+            # El timeout de Python cubre también un evaluate que se quede colgado
+            resultado = await asyncio.wait_for(
+                page.evaluate(FETCH_JS, {'url': url, 'timeoutMs': int(timeout * 1000)}), timeout + 5)
+            if resultado.get('status') != 200:
+                raise RuntimeError(resultado.get('error') or f"HTTP {resultado.get('status')}")
+            return json.loads(resultado['body'])
+        except (asyncio.TimeoutError, PlaywrightError, RuntimeError, ValueError) as e:
+            ultimo_error = str(e) or 'timeout'
+            print(f"Intento {intento + 1}/{reintentos + 1} fallido para {url}: {ultimo_error}")
+    raise RuntimeError(f"Sin respuesta tras {reintentos + 1} intentos: {ultimo_error}")
+
+def urls_ventanas(num_fetches, interval_seconds, base_ts=None):
+    """URLs del grid para `num_fetches` ventanas consecutivas desde ahora (o desde base_ts)."""
+    base_ts = int(time.time()) if base_ts is None else base_ts
+    return [URL_TEMPLATE.format(timestamp=base_ts + i * interval_seconds) for i in range(num_fetches)]
+
+async def _abrir_pagina(p):
+    """Navegador con una página en el origen del grid y la sesión establecida. Devuelve (browser, context, page).
+
+    Con un estado de sesión vigente el contexto se crea ya con él y no se carga la SPA: se sirve un
+    documento vacío en la URL del grid (sin tráfico de red), que basta para que el fetch del grid salga
+    del mismo origen con las cookies restauradas. Si no, se carga la página real y se guarda la sesión.
+    """
+    browser = await p.chromium.launch(headless=True)
+    context, restaurado = await ESTADO.nuevo_contexto(browser, user_agent=USER_AGENT)
+    page = await context.new_page()
+
+    if restaurado:
+        await page.route(PAGINA_GRID, lambda route: route.fulfill(
+            status=200, content_type='text/html', body='<!DOCTYPE html><html><body></body></html>'))
+        await page.goto(PAGINA_GRID)
+        await page.unroute(PAGINA_GRID)
+    else:
         # Ir a la página inicial para establecer cookies/sesión
-        await page.goto("https://tvlistings.gracenote.com/grid-affiliates.html?aid=dishmex")
+        await page.goto(PAGINA_GRID)
         await asyncio.sleep(2)  # Esperar un poco para cargar la página
+        await ESTADO.guardar(context)
+    return browser, context, page
 
-        # Listener único para todas las respuestas (síncrono)
-        def handle_response(response):
-            response_url = response.url
-            if any(url in response_url for url in pending_responses) and response.status == 200:
-                # Encontrar la URL que coincide y almacenar el objeto response
-                for pending_url in list(pending_responses.keys()):
-                    if pending_url in response_url:
-                        pending_responses[pending_url] = response
-                        print(f"Respuesta capturada para {pending_url}")
-                        break
-
-        page.on("response", handle_response)
-
-        for i in range(num_fetches):
-            current_ts = base_ts + i * interval_seconds
-            url = URL_TEMPLATE.format(timestamp=current_ts)
-            pending_responses[url] = None  # Marcar como pendiente
-
-            # Realizar el fetch via evaluate
-            await page.evaluate(f"""
-                fetch("{url}", {{
-                    headers: {{
-                        "Accept": "application/json, text/javascript, */*; q=0.01",
-                        "X-Requested-With": "XMLHttpRequest"
-                    }},
-                    credentials: "include"
-                }});
-            """)
-
-            # Esperar la respuesta (similar al original)
-            await asyncio.sleep(5)
-
-            # Verificar si se capturó el response object
-            if pending_responses[url] is not None:
+async def fetch_con_navegador(ventanas, recibir, concurrencia=CONCURRENCIA):
+    """Pide cada ventana [(índice, url)] desde la página del grid y pasa su JSON a recibir(índice, datos)
+    en cuanto llega. Devuelve cuántas ventanas se obtuvieron.
+
+    Las ventanas se piden en paralelo (como mucho `concurrencia` a la vez) y cada una espera su propia
+    respuesta, con timeout y reintentos: el tiempo total lo marca la respuesta más lenta.
+    """
+    async with async_playwright() as p:
+        browser, _, page = await _abrir_pagina(p)
+        limite = asyncio.Semaphore(max(1, concurrencia))
+
+        async def una(i, url):
+            async with limite:
+                inicio = time.perf_counter()
                 try:
-                    # Ahora parsear el JSON en contexto async
-                    response_obj = pending_responses[url]
-                    response_text = await response_obj.text()
-                    data = json.loads(response_text)
-                    all_data.append(data)
-                    print(f"Fetch {i+1} completado para timestamp {current_ts}.")
-                except Exception as e:
-                    print(f"Error parseando JSON para fetch {i+1}: {e}")
-                    # Opcional: intentar con response.json() si text() falla
-                    try:
-                        data = await response_obj.json()
-                        all_data.append(data)
-                        print(f"Fetch {i+1} completado usando json() alternativo.")
-                    except Exception as e2:
-                        print(f"Error alternativo parseando JSON: {e2}")
-                finally:
-                    del pending_responses[url]  # Remover de pendientes
-            else:
-                print(f"Advertencia: No se obtuvo respuesta para fetch {i+1} ({url}). Continuando...")
-
-            # Pequeña pausa entre fetches para evitar rate limiting
-            if i < num_fetches - 1:
-                await asyncio.sleep(2)
+                    data = await fetch_ventana(page, url)
+                except RuntimeError as e:
+                    print(f"Advertencia: No se obtuvo respuesta para fetch {i+1} ({url}): {e}. Continuando...")
+                    return False
+                recibir(i, data)
+                print(f"Fetch {i+1} completado con el navegador ({time.perf_counter() - inicio:.1f}s).")
+                return True
+
+        inicio = time.perf_counter()
+        obtenidas = sum(await asyncio.gather(*(una(i, url) for i, url in ventanas)))
+        print(f"{len(ventanas)} ventanas pedidas con el navegador en {time.perf_counter() - inicio:.1f}s "
+              f"(concurrencia {max(1, concurrencia)})")
 
         await browser.close()
+    return obtenidas
 
-    # Verificar si hay pendientes al final
-    if pending_responses:
-        print(f"Advertencia: {len(pending_responses)} respuestas pendientes no capturadas.")
+def _comprobar_obtenidas(obtenidas, total):
+    if obtenidas < total:
+        print(f"Advertencia: {total - obtenidas} ventanas sin datos.")
 
-    if not all_data:
+    if not obtenidas:
+        ESTADO.invalidar()  # La sesión guardada no sirvió: la próxima ejecución empieza de cero
         raise Exception("No se pudo obtener ningún dato EPG")
 
+async def fetch_multiple(num_fetches=5, interval_seconds=21000, concurrencia=CONCURRENCIA, mezcla=None):
+    """Realiza múltiples fetches de EPG con timestamps incrementales, todos desde el navegador.
+
+    Con `mezcla` (MezclaEPG) cada ventana se incorpora en cuanto llega y se devuelve la mezcla; sin ella
+    se devuelven los JSON en el orden de las ventanas, como antes.
+    """
+    urls = urls_ventanas(num_fetches, interval_seconds)
+    if mezcla is not None:
+        _comprobar_obtenidas(await fetch_con_navegador(list(enumerate(urls)), mezcla.agregar, concurrencia), len(urls))
+        return mezcla
+
+    resultados = [None] * len(urls)
+    await fetch_con_navegador(list(enumerate(urls)), resultados.__setitem__, concurrencia)
+    all_data = [data for data in resultados if data is not None]
+    _comprobar_obtenidas(len(all_data), len(urls))
     return all_data
 
-def merge_epg_data(all_data):
-    """Fusiona múltiples conjuntos de datos EPG, eliminando duplicados."""
-    channels = {}  # channelId -> {'callSign': str, 'thumbnail': str, 'events': list}
+# --- Modo sin navegador: Chromium solo para las cookies, el grid con requests --------------------
+
+class Rechazado(RuntimeError):
+    """El API rechazó la petición hecha sin navegador (401/403/429 o una página en lugar de JSON)."""
 
-    for data in all_data:
-        for channel in data.get('channels', []):
+async def cosechar_cookies():
+    """Abre el navegador solo para cargar la página del grid y devuelve sus cookies (guarda la sesión)."""
+    ESTADO.invalidar()
+    async with async_playwright() as p:
+        browser, context, _ = await _abrir_pagina(p)
+        cookies = await context.cookies()
+        await browser.close()
+    print(f"Sesión obtenida con el navegador: {len(cookies)} cookies")
+    return cookies
+
+def obtener_cookies():
+    """Cookies de la sesión guardada si sigue vigente (sin abrir el navegador) o recién obtenidas.
+    Devuelve (cookies, restauradas)."""
+    cookies = ESTADO.cookies()
+    if cookies:
+        print(f"Sesión restaurada del estado guardado: {len(cookies)} cookies (sin abrir el navegador)")
+        return cookies, True
+    try:
+        return asyncio.run(cosechar_cookies()), False
+    except PlaywrightError as e:
+        print(f"Advertencia: no se pudieron obtener cookies con el navegador ({e}); se intenta sin ellas.")
+        return [], False
+
+def crear_sesion_http(cookies, concurrencia=CONCURRENCIA):
+    """requests.Session con pool de conexiones, las cookies del navegador y las cabeceras del fetch de la página."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrencia))
+    session.mount('https://', adapter)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept': 'application/json, text/javascript, */*; q=0.01',
+        'X-Requested-With': 'XMLHttpRequest',
+        'Referer': PAGINA_GRID,
+    })
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    return session
+
+def fetch_ventana_http(session, url, timeout=TIMEOUT_SEG, reintentos=REINTENTOS):
+    """Pide una ventana del grid sin navegador. Lanza Rechazado (sin reintentar) si el API no la acepta
+    así, o RuntimeError si no hubo respuesta tras los reintentos."""
+    ultimo_error = None
+    for intento in range(reintentos + 1):
+        if intento:
+            time.sleep(2 ** intento)
+        try:
+            response = session.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            ultimo_error = str(e)
+            print(f"Intento {intento + 1}/{reintentos + 1} fallido para {url}: {ultimo_error}")
+            continue
+        if response.status_code in (401, 403, 429):
+            raise Rechazado(f"HTTP {response.status_code}")
+        if response.status_code != 200:
+            ultimo_error = f"HTTP {response.status_code}"
+            print(f"Intento {intento + 1}/{reintentos + 1} fallido para {url}: {ultimo_error}")
+            continue
+        try:
+            return response.json()
+        except ValueError:
+            raise Rechazado(f"respuesta no JSON ({response.headers.get('Content-Type', '?')})")
+    raise RuntimeError(f"Sin respuesta tras {reintentos + 1} intentos: {ultimo_error}")
+
+def _pedir_http(urls, indices, cookies, concurrencia, recibir):
+    """Pide con requests las ventanas `indices` de `urls` y pasa cada JSON a recibir(índice, datos) en
+    cuanto llega (desde este hilo). Devuelve (cuántas se obtuvieron, índices rechazados)."""
+    obtenidas, rechazadas = 0, []
+    inicio = time.perf_counter()
+    with crear_sesion_http(cookies, concurrencia) as session, \
+            ThreadPoolExecutor(max_workers=max(1, concurrencia)) as pool:
+        futuros = {pool.submit(fetch_ventana_http, session, urls[i]): i for i in indices}
+        for futuro in as_completed(futuros):
+            i = futuros.pop(futuro)  # Sin más referencias al futuro, el JSON se libera tras incorporarlo
+            try:
+                recibir(i, futuro.result())
+                obtenidas += 1
+                print(f"Fetch {i+1} completado sin navegador.")
+            except Rechazado as e:
+                print(f"Fetch {i+1} rechazado sin navegador ({e}).")
+                rechazadas.append(i)
+            except RuntimeError as e:
+                print(f"Advertencia: No se obtuvo respuesta para fetch {i+1} ({urls[i]}): {e}. Continuando...")
+    print(f"{len(indices)} ventanas pedidas sin navegador en {time.perf_counter() - inicio:.1f}s "
+          f"(concurrencia {max(1, concurrencia)})")
+    return obtenidas, sorted(rechazadas)
+
+def fetch_multiple_http(num_fetches=5, interval_seconds=21000, concurrencia=CONCURRENCIA, mezcla=None):
+    """Como fetch_multiple, pero las ventanas se piden con requests en `concurrencia` hilos con las
+    cookies de la sesión guardada (sin abrir el navegador) o, si no hay, recién obtenidas con él.
+    Cada ventana se incorpora a `mezcla` (una MezclaEPG nueva si no se pasa) en cuanto llega; devuelve
+    la mezcla.
+
+    Si el API rechaza las cookies guardadas se descarta el estado, se obtiene una sesión nueva y se
+    reintentan; lo que siga rechazado sin navegador se vuelve a pedir con el navegador.
+    """
+    mezcla = MezclaEPG() if mezcla is None else mezcla
+    urls = urls_ventanas(num_fetches, interval_seconds)
+    cookies, restauradas = obtener_cookies()
+    obtenidas, rechazadas = _pedir_http(urls, range(len(urls)), cookies, concurrencia, mezcla.agregar)
+
+    if rechazadas and restauradas:
+        print("La sesión guardada fue rechazada; se obtiene una nueva con el navegador.")
+        try:
+            cookies = asyncio.run(cosechar_cookies())
+        except PlaywrightError as e:
+            print(f"Advertencia: no se pudo renovar la sesión con el navegador ({e}).")
+        else:
+            nuevas, rechazadas = _pedir_http(urls, rechazadas, cookies, concurrencia, mezcla.agregar)
+            obtenidas += nuevas
+
+    if rechazadas:
+        print(f"Se piden con el navegador las ventanas rechazadas: {[i + 1 for i in rechazadas]}")
+        obtenidas += asyncio.run(fetch_con_navegador([(i, urls[i]) for i in rechazadas], mezcla.agregar, concurrencia))
+    _comprobar_obtenidas(obtenidas, len(urls))
+    return mezcla
+
+class MezclaEPG:
+    """Fusión incremental de las ventanas del grid: cada JSON se incorpora en cuanto llega y se suelta.
+
+    Cada canal guarda sus eventos ordenados por startTime (inserción con bisect; como las ventanas
+    avanzan en el tiempo casi siempre se agrega al final) y un índice startTime -> ventana de origen
+    para deduplicar, así incorporar un evento cuesta O(log n) en lugar de reconstruir el conjunto de
+    inicios del canal en cada ventana. A igual startTime gana la ventana anterior (y dentro de una
+    ventana la primera aparición), igual que al fusionar todas en orden, aunque las respuestas lleguen
+    desordenadas; los canales salen en el orden en que aparecen en las ventanas.
+
+    Con `filtro` (ChannelFilter) los canales que no pasan se descartan antes de guardar sus eventos;
+    con conservar_descartados=True se guardan igual (marcados) para poder pedir la guía completa.
+    """
+
+    def __init__(self, filtro=None, conservar_descartados=False):
+        self.filtro = filtro
+        self.conservar_descartados = conservar_descartados
+        self.descartados = set()  # channelId de los canales que no pasaron el filtro
+        self._canales = {}  # channelId -> {'callSign', 'thumbnail', 'origen', 'pasa', 'events', 'inicios', 'ventanas'}
+
+    def agregar(self, ventana, data):
+        """Incorpora el JSON de la ventana número `ventana` (su posición entre las pedidas)."""
+        for posicion, channel in enumerate(data.get('channels', [])):
             cid = channel.get('channelId', '')
             if not cid:
                 continue
 
-            if cid not in channels:
-                thumbnail = channel.get('thumbnail', '')
-                # Procesar la URL del thumbnail: agregar https: si es necesario y cambiar w=55 a w=256
-                if thumbnail:
-                    if thumbnail.startswith('//'):
-                        thumbnail = 'https:' + thumbnail
-                    # Reemplazar w=55 por w=256 usando regex para manejar posibles variaciones
-                    thumbnail = re.sub(r'w=\d+', 'w=256', thumbnail)
-                channels[cid] = {
-                    'callSign': channel.get('callSign', 'SinNombre'),
-                    'thumbnail': thumbnail,
-                    'events': []
-                }
+            origen = (ventana, posicion)
+            chdata = self._canales.get(cid)
+            if chdata is None:
+                pasa = self.filtro is None or cid in self.filtro
+                if not pasa:
+                    self.descartados.add(cid)
+                    if not self.conservar_descartados:
+                        continue
+                chdata = self._canales[cid] = {'pasa': pasa, 'events': [], 'inicios': [], 'ventanas': {}}
+            if chdata.get('origen', origen) >= origen:
+                chdata['origen'] = origen
+                chdata['callSign'] = channel.get('callSign', 'SinNombre')
+                chdata['thumbnail'] = _thumbnail_canal(channel.get('thumbnail', ''))
 
             # Deduplicar eventos por startTime en este canal
-            existing_starts = {e['startTime'] for e in channels[cid]['events']}
+            events, inicios, ventanas = chdata['events'], chdata['inicios'], chdata['ventanas']
             for event in channel.get('events', []):
                 start_time = event.get('startTime', '')
-                if start_time and start_time not in existing_starts:
-                    channels[cid]['events'].append(event)
-                    existing_starts.add(start_time)
-
-    # Ordenar eventos por startTime para cada canal (opcional, pero mejora legibilidad)
-    for chdata in channels.values():
-        chdata['events'].sort(key=lambda e: e.get('startTime', ''))
-
-    return channels
+                if not start_time:
+                    continue
+                previa = ventanas.get(start_time)
+                if previa is None:
+                    pos = bisect.bisect_right(inicios, start_time)
+                    inicios.insert(pos, start_time)
+                    events.insert(pos, event)
+                    ventanas[start_time] = ventana
+                elif ventana < previa:
+                    events[bisect.bisect_left(inicios, start_time)] = event
+                    ventanas[start_time] = ventana
+
+    def canales(self, completa=False):
+        """channelId -> {'callSign': str, 'thumbnail': str, 'events': lista ordenada por startTime}.
+        Con completa=True incluye también los canales descartados por el filtro (si se conservaron)."""
+        ordenados = sorted(self._canales.items(), key=lambda item: item[1]['origen'])
+        return {cid: {'callSign': chdata['callSign'], 'thumbnail': chdata['thumbnail'], 'events': chdata['events']}
+                for cid, chdata in ordenados if completa or chdata['pasa']}
+
+def _thumbnail_canal(thumbnail):
+    # Procesar la URL del thumbnail: agregar https: si es necesario y cambiar w=55 a w=256
+    if thumbnail:
+        if thumbnail.startswith('//'):
+            thumbnail = 'https:' + thumbnail
+        # Reemplazar w=55 por w=256 usando regex para manejar posibles variaciones
+        thumbnail = re.sub(r'w=\d+', 'w=256', thumbnail)
+    return thumbnail
+
+def filtro_dish(archivo_filtros=ARCHIVO_FILTROS_DISH, url=FILTRO_URL):
+    """ChannelFilter con la entrada de `url` en filtros.json, o None si no tiene (se conservan todos)."""
+    filtro = ChannelFilter(cargar_filtros(archivo_filtros).get(url), url)
+    for aviso in filtro.advertencias:
+        print(f"Advertencia en {archivo_filtros}[{url}]: {aviso}")
+    if not filtro:
+        print(f"Sin filtro de canales para {url} en {archivo_filtros}: se conservan todos.")
+        return None
+    print(f"Aplicando filtrado ({filtro.describir()}) antes de guardar los eventos")
+    return filtro
+
+def merge_epg_data(all_data, filtro=None):
+    """Fusiona múltiples conjuntos de datos EPG (en orden de ventana), eliminando duplicados y, con
+    `filtro`, descartando los canales que no pasan."""
+    mezcla = MezclaEPG(filtro)
+    for ventana, data in enumerate(all_data):
+        mezcla.agregar(ventana, data)
+    return mezcla.canales()
 
 def channels_to_xmltv(channels):
-    """Convierte los canales fusionados a formato XMLTV."""
-    tv = ET.Element('tv')
-
+    """Convierte los canales fusionados a formato XMLTV, generando los elementos uno a uno
+    (primero todos los <channel>, luego todos los <programme>)."""
     # Crear elementos <channel>
     for cid, chdata in channels.items():
-        ch = ET.SubElement(tv, 'channel', id=cid)
+        ch = ET.Element('channel', id=cid)
         display_name = ET.SubElement(ch, 'display-name')
         display_name.text = chdata['callSign']
         
@@ -150,6 +396,7 @@ def channels_to_xmltv(channels):
         thumbnail = chdata.get('thumbnail', '')
         if thumbnail:
             icon = ET.SubElement(ch, 'icon', src=thumbnail)
+        yield ch
 
     # Crear elementos <programme>
     for cid, chdata in channels.items():
@@ -157,7 +404,7 @@ def channels_to_xmltv(channels):
             start_str = event.get('startTime', '').replace('-', '').replace(':', '').replace('T', '').replace('Z', ' +0000')
             stop_str = event.get('endTime', '').replace('-', '').replace(':', '').replace('T', '').replace('Z', ' +0000')
 
-            prog = ET.SubElement(tv, 'programme', {
+            prog = ET.Element('programme', {
                 'start': start_str,
                 'stop': stop_str,
                 'channel': cid
@@ -208,29 +455,33 @@ def channels_to_xmltv(channels):
                 date_elem = ET.SubElement(prog, 'date')
                 date_elem.text = str(release_year)
 
-    return ET.tostring(tv, encoding='utf-8', xml_declaration=True).decode('utf-8')
-
-def pretty_xml(xml_str):
-    """Formatea el XML con sangrías para que sea legible."""
-    dom = xml.dom.minidom.parseString(xml_str)
-    return dom.toprettyxml(indent="  ")
+            yield prog
 
-def save_xmltv(xml_str, filename="dish.xml"):
+def save_xmltv(channels, filename="dish.xml"):
+    """Escribe el XMLTV en streaming con sangría de 2 espacios (mismo formato que minidom.toprettyxml)."""
     with open(filename, "w", encoding="utf-8") as f:
-        f.write(xml_str)
+        with XMLTVWriter(f) as writer:
+            for elem in channels_to_xmltv(channels):
+                writer.write(elem)
 
 def main():
     # Realizar fetches múltiples (5 fetches cubren ~6h + 4*5:50h ≈ 28.33 horas)
     # interval_seconds = 5*3600 + 50*60 = 5 horas 50 min en segundos
-    all_epg_data = asyncio.run(fetch_multiple(num_fetches=4, interval_seconds=5*3600 + 50*60))
-    
-    # Fusionar datos
-    merged_channels = merge_epg_data(all_epg_data)
+    # Cada ventana se fusiona en cuanto llega (el JSON crudo no se acumula)
+    # y los canales fuera de la lista de filtros.json se descartan antes de guardar sus eventos
+    filtro = filtro_dish()
+    mezcla = MezclaEPG(filtro, conservar_descartados=bool(SALIDA_COMPLETA))
+    if MODO == 'navegador':
+        asyncio.run(fetch_multiple(num_fetches=4, interval_seconds=5*3600 + 50*60, mezcla=mezcla))
+    else:
+        fetch_multiple_http(num_fetches=4, interval_seconds=5*3600 + 50*60, mezcla=mezcla)
+    merged_channels = mezcla.canales()
     
-    # Generar XML
-    xmltv_str = channels_to_xmltv(merged_channels)
-    xmltv_pretty = pretty_xml(xmltv_str)
-    save_xmltv(xmltv_pretty)
+    # Generar y guardar XML
+    save_xmltv(merged_channels)
+    if SALIDA_COMPLETA:
+        save_xmltv(mezcla.canales(completa=True), SALIDA_COMPLETA)
+        print(f"Guía completa sin filtrar (depuración): {SALIDA_COMPLETA}")
     
     total_channels = len(merged_channels)
     total_programmes = sum(len(ch['events']) for ch in merged_channels.values())
@@ -241,6 +492,11 @@ def main():
     print(f"Programas totales (sin duplicados): {total_programmes}")
     print(f"Canales con logos: {channels_with_logos}")
     print(f"Programas con posters: {programmes_with_posters}")
+    if filtro is not None:
+        print(f"Canales descartados por el filtro: {len(mezcla.descartados)}")
+        sin_coincidencia = filtro.sin_coincidencia()
+        if sin_coincidencia:
+            print(f"Reglas de filtro sin ningún canal en el grid ({len(sin_coincidencia)}): {sin_coincidencia}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+"""Caché en disco de respuestas HTTP con GET condicional (ETag / Last-Modified).
+
+Cada URL se guarda como dos archivos en el directorio de caché: ``<clave>.body`` con el cuerpo ya
+descomprimido y ``<clave>.json`` con los metadatos (url, etag, last_modified, fechas y tamaño).
+En la siguiente descarga se envían If-None-Match / If-Modified-Since; si el servidor responde 304 se
+sirve el cuerpo guardado sin volver a transferirlo.
+
+Política de expiración: las entradas que no se usan en ``max_age`` segundos se borran, y si el total
+supera ``max_bytes`` se borran las menos usadas recientemente (LRU) hasta bajar del límite.
+"""
+import hashlib
+import json
+import os
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HTTPCache:
+    """Caché de cuerpos HTTP por URL. Seguro para usar desde varios hilos con URLs distintas."""
+
+    def __init__(self, directorio, max_age=7 * 24 * 3600, max_bytes=500 * 1024 * 1024):
+        self.directorio = directorio
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        os.makedirs(directorio, exist_ok=True)
+
+    def _rutas(self, url):
+        clave = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directorio, clave)
+        return base + '.body', base + '.json'
+
+    def _leer_meta(self, ruta_meta):
+        try:
+            with open(ruta_meta, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _escribir_meta(self, ruta_meta, meta):
+        tmp = ruta_meta + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, ruta_meta)
+
+    def fetch(self, session, url, timeout=30):
+        """Descarga `url` usando la caché y devuelve (ruta_del_cuerpo, estado).
+
+        estado es 'nuevo' (200, cuerpo descargado y guardado) o 'no-modificado' (304, cuerpo en caché).
+        Propaga las excepciones de requests (incluido raise_for_status) igual que una descarga normal.
+        """
+        ruta_body, ruta_meta = self._rutas(url)
+        meta = self._leer_meta(ruta_meta)
+        if meta is not None and not os.path.exists(ruta_body):
+            meta = None
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        ahora = time.time()
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and meta is not None:
+                meta['validated_at'] = ahora
+                meta['last_used'] = ahora
+                self._escribir_meta(ruta_meta, meta)
+                return ruta_body, 'no-modificado'
+
+            response.raise_for_status()
+            # El cuerpo se guarda ya descomprimido (Content-Encoding) para poder parsearlo directamente
+            tmp = ruta_body + '.tmp'
+            tamaño = 0
+            with open(tmp, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    tamaño += len(chunk)
+            os.replace(tmp, ruta_body)
+            self._escribir_meta(ruta_meta, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'stored_at': ahora,
+                'validated_at': ahora,
+                'last_used': ahora,
+                'size': tamaño,
+            })
+        return ruta_body, 'nuevo'
+
+    def invalidar(self, url):
+        """Borra la entrada de `url` (p. ej. si el cuerpo guardado resultó no ser XML válido)."""
+        for ruta in self._rutas(url):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+    def purgar(self):
+        """Aplica la política de expiración y devuelve cuántas entradas se borraron."""
+        ahora = time.time()
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith('.json'):
+                continue
+            ruta_meta = os.path.join(self.directorio, nombre)
+            meta = self._leer_meta(ruta_meta)
+            ruta_body = ruta_meta[:-len('.json')] + '.body'
+            if meta is None or not os.path.exists(ruta_body):
+                entradas.append((0, 0, meta.get('url') if meta else None, ruta_meta, ruta_body))
+                continue
+            entradas.append((meta.get('last_used', 0), os.path.getsize(ruta_body), meta.get('url'), ruta_meta, ruta_body))
+
+        entradas.sort()  # Menos usadas recientemente primero
+        total = sum(e[1] for e in entradas)
+        borradas = 0
+        for last_used, tamaño, _url, ruta_meta, ruta_body in entradas:
+            if ahora - last_used <= self.max_age and total <= self.max_bytes:
+                continue
+            for ruta in (ruta_meta, ruta_body):
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+            total -= tamaño
+            borradas += 1
+        return borradas
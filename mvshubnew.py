@@ -2,6 +2,7 @@ import asyncio
 import re
 import requests
 import xml.etree.ElementTree as ET
+import xml_backend
 from datetime import datetime, timedelta
 import sys
 import os
@@ -9,6 +10,9 @@ import logging
 import time
 from playwright.async_api import async_playwright, TimeoutError
 
+from estado_navegador import EstadoNavegador
+from xmltv_writer import XMLTVWriter
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -19,11 +23,17 @@ GENERIC_UUID = ["5cc95856-8487-406e-bb67-83f97d24ab5f",
                 "19a5d5da-d1cf-4c3d-a586-2c3fab12b809",
                 "3ad1b727-09ea-4e42-aaa2-d74e26c29224"
                ]
+# Espacio de nombres de las respuestas XML del API de Minerva
+NS = "{http://ws.minervanetworks.com/}"
 CHANNEL_URL_PREFIX = "https://edge.prod.ovp.ses.com:9443/xtv-ws-client/api/epgcache/list/"
 
 CHANNEL_IDS = [306, 645, 701, 702, 703, 704, 705, 726, 727, 728, 734, 736, 741, 761, 762, 763, 764, 766, 769, 770, 771, 772, 801, 802, 803, 805, 806, 807, 808, 809, 814, 821, 822, 963, 964, 965, 1062, 1141, 1361, 1445, 1447,  1451]
 OUTPUT_FILE = "mvshub.xml"
 
+# Sesión de la SPA y último UUID válido, guardados entre ejecuciones (ver estado_navegador.py)
+ESTADO = EstadoNavegador('mvshub')
+CANAL_PRUEBA = 222
+
 HEADERS_EPG = {
     'accept': 'application/xml, text/xml, */*',
     'accept-language': 'es-419,es;q=0.9',
@@ -44,7 +54,12 @@ async def extract_valid_uuid():
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
+        # Con la sesión guardada la SPA arranca sin repetir su inicialización (cookies/localStorage).
+        # La navegación sigue haciendo falta: el UUID solo aparece en las peticiones que hace la SPA
+        # (si el UUID guardado sigue valiendo, uuid_guardado() evita abrir el navegador).
+        context, restaurado = await ESTADO.nuevo_contexto(browser)
+        if restaurado:
+            logger.info("Contexto restaurado del estado de sesión guardado.")
         page = await context.new_page()
 
         # Definimos un evento para detener la escucha cuando se obtiene UUID válido
@@ -78,11 +93,14 @@ async def extract_valid_uuid():
         except TimeoutError:
             logger.warning("No se encontró el elemento clave, continuar igual.")
 
-        # Scroll para forzar carga
+        # Scroll para forzar carga, solo si la SPA aún no pidió la guía con un UUID válido
         for y in range(0, 1000, 100):
+            if stop_listening.is_set():
+                break
             await page.evaluate(f"window.scrollTo(0, {y})")
             await asyncio.sleep(0.5)
-        await page.evaluate("window.scrollTo(0, 0)")
+        if not stop_listening.is_set():
+            await page.evaluate("window.scrollTo(0, 0)")
 
         # Esperar hasta 20 segundos o hasta que se obtenga UUID válido
         try:
@@ -90,6 +108,8 @@ async def extract_valid_uuid():
         except asyncio.TimeoutError:
             logger.warning("Timeout esperando UUID válido.")
 
+        if valid_uuid:
+            await ESTADO.guardar(context, uuid=valid_uuid)
         await browser.close()
 
     if valid_uuid:
@@ -108,6 +128,21 @@ async def run_with_retries(max_retries=8, retry_delay=3):
         await asyncio.sleep(retry_delay)
     return None
 
+def uuid_guardado():
+    """UUID de la sesión guardada si sigue vigente y el API lo acepta (un fetch corto del canal de prueba);
+    si no, descarta el estado guardado y devuelve None."""
+    uuid = ESTADO.datos().get('uuid')
+    if not uuid:
+        return None
+    logger.info(f"Comprobando UUID guardado: {uuid}")
+    ahora = int(time.time() * 1000)
+    if fetch_channel_contents(CANAL_PRUEBA, ahora, ahora + 3600 * 1000, requests.Session(), uuid):
+        logger.info("UUID guardado válido, no hace falta abrir el navegador.")
+        return uuid
+    logger.warning("UUID guardado rechazado, se descarta el estado de sesión.")
+    ESTADO.invalidar()
+    return None
+
 # --- Funciones fetch_channel_contents y build_xmltv iguales que antes ---
 # (las copias tal cual, solo agregué el parámetro uuid en fetch_channel_contents)
 
@@ -133,55 +168,47 @@ def fetch_channel_contents(channel_id, date_from, date_to, session, uuid):
             f.write(response.text)
         logger.info(f"Raw XML saved to {raw_file} (len: {len(response.text)} chars)")
         
-        root = ET.fromstring(response.content)
-        ns = "{http://ws.minervanetworks.com/}"
-        contents = root.findall(f".//{ns}content")
+        root = xml_backend.fromstring(response.content)
+        contents = root.findall(f".//{NS}content")
         if not contents:
             all_children = [child.tag for child in root]
-            logger.warning(f"No <content> found for {channel_id}. Root children: {all_children[:10]}. Snippet: {ET.tostring(root, encoding='unicode')[:300]}")
+            logger.warning(f"No <content> found for {channel_id}. Root children: {all_children[:10]}. Snippet: {xml_backend.tostring(root)[:300]}")
         else:
             logger.info(f"Found {len(contents)} programmes for channel {channel_id}")
         return contents
         
-    except ET.ParseError as pe:
+    except xml_backend.ParseError as pe:
         logger.error(f"XML Parse error for {channel_id}: {pe} - Response: {response.text[:300]}")
         return []
     except Exception as e:
         logger.error(f"Exception for {channel_id}: {e}")
         return []
 
-def build_xmltv(channels_data):
-    if not channels_data:
-        logger.warning("No data to build XMLTV - skipping")
-        return False
-    
-    tv = ET.Element("tv", attrib={
-        "generator-info-name": "MVS Hub Multi-Channel Dynamic 24h",
-        "generator-info-url": "https://www.mvshub.com.mx/"
-    })
-    
-    ns = "{http://ws.minervanetworks.com/}"
-    channels = {}
+def xmltv_elements(channels_data, channels):
+    """Genera los <channel>/<programme> uno a uno (cada canal seguido de sus programas).
+
+    Registra en `channels` los IDs de canal emitidos.
+    """
     
     for channel_id, contents in channels_data:
         if not contents:
             continue
         
         first_content = contents[0]
-        tv_channel = first_content.find(f".//{ns}TV_CHANNEL")
+        tv_channel = first_content.find(f".//{NS}TV_CHANNEL")
         call_sign = str(channel_id)
         number = ""
         logo_src = ""
         if tv_channel is not None:
-            call_sign_elem = tv_channel.find(f"{ns}callSign")
+            call_sign_elem = tv_channel.find(f"{NS}callSign")
             call_sign = call_sign_elem.text if call_sign_elem is not None else str(channel_id)
-            number_elem = tv_channel.find(f"{ns}number")
+            number_elem = tv_channel.find(f"{NS}number")
             number = number_elem.text if number_elem is not None else ""
             # Logo del CANAL: Solo del <TV_CHANNEL><images>
-            channel_images = tv_channel.findall(f".//{ns}images/{ns}image")
+            channel_images = tv_channel.findall(f".//{NS}images/{NS}image")
             if channel_images:
                 channel_image = channel_images[0]  # Primera imagen del canal (logo)
-                url_elem = channel_image.find(f"{ns}url")
+                url_elem = channel_image.find(f"{NS}url")
                 if url_elem is not None and url_elem.text:
                     logo_src = url_elem.text.strip()
                     logger.debug(f"Logo del canal {channel_id}: {logo_src}")
@@ -189,18 +216,19 @@ def build_xmltv(channels_data):
             logger.warning(f"No TV_CHANNEL in first content for {channel_id} - using defaults")
         
         if channel_id not in channels:
-            channel = ET.SubElement(tv, "channel", id=str(channel_id))
+            channel = ET.Element("channel", id=str(channel_id))
             ET.SubElement(channel, "display-name").text = call_sign
             if number:
                 ET.SubElement(channel, "display-name").text = number
             if logo_src:
                 ET.SubElement(channel, "icon", src=logo_src)
             channels[channel_id] = True
+            yield channel
             logger.info(f"Added channel {channel_id}: {call_sign} (number: {number}, logo: {logo_src})")
         
         for content in contents:
-            start_elem = content.find(f"{ns}startDateTime")
-            end_elem = content.find(f"{ns}endDateTime")
+            start_elem = content.find(f"{NS}startDateTime")
+            end_elem = content.find(f"{NS}endDateTime")
             if start_elem is None or end_elem is None:
                 logger.warning(f"Missing start/end for programme in {channel_id} - skipping")
                 continue
@@ -211,36 +239,36 @@ def build_xmltv(channels_data):
                 logger.warning(f"Invalid start/end timestamp in {channel_id} - skipping programme")
                 continue
             
-            programme = ET.SubElement(tv, "programme", attrib={
+            programme = ET.Element("programme", attrib={
                 "start": datetime.utcfromtimestamp(start_ms / 1000).strftime("%Y%m%d%H%M%S") + " +0000",
                 "stop": datetime.utcfromtimestamp(end_ms / 1000).strftime("%Y%m%d%H%M%S") + " +0000",
                 "channel": str(channel_id)
             })
             
-            title_elem = content.find(f"{ns}title")
+            title_elem = content.find(f"{NS}title")
             if title_elem is not None and title_elem.text:
                 ET.SubElement(programme, "title", lang="es").text = title_elem.text
             else:
                 ET.SubElement(programme, "title", lang="es").text = "Sin título"
             
-            desc_elem = content.find(f"{ns}description")
+            desc_elem = content.find(f"{NS}description")
             if desc_elem is not None and desc_elem.text:
                 ET.SubElement(programme, "desc", lang="es").text = desc_elem.text
             
-            genres = content.findall(f".//{ns}genres/{ns}genre/{ns}name")
+            genres = content.findall(f".//{NS}genres/{NS}genre/{NS}name")
             for genre in genres:
                 if genre is not None and genre.text:
                     ET.SubElement(programme, "category", lang="es").text = genre.text
 
             # Episode Title como sub-title (compatible con XMLTV)
-            episode_title_elem = content.find(f"{ns}episodeTitle")
+            episode_title_elem = content.find(f"{NS}episodeTitle")
             if episode_title_elem is not None and episode_title_elem.text:
                 sub_title = ET.SubElement(programme, "sub-title", lang="es")
                 sub_title.text = episode_title_elem.text
 
             # Season Number y Episode Number como episode-num (formato estándar XMLTV: S{season}E{episode})
-            season_num_elem = content.find(f"{ns}seasonNumber")
-            episode_num_elem = content.find(f"{ns}episodeNumber")
+            season_num_elem = content.find(f"{NS}seasonNumber")
+            episode_num_elem = content.find(f"{NS}episodeNumber")
             if season_num_elem is not None and episode_num_elem is not None:
                 season_text = season_num_elem.text
                 episode_text = episode_num_elem.text
@@ -253,16 +281,16 @@ def build_xmltv(channels_data):
                         pass  # Omitir si no se puede formatear
 
             # Rating de parentalLevel
-            parental_level = content.find(f"{ns}parentalLevel")
+            parental_level = content.find(f"{NS}parentalLevel")
             if parental_level is not None:
-                rating_elem = parental_level.find(f"{ns}rating")
+                rating_elem = parental_level.find(f"{NS}rating")
                 if rating_elem is not None and rating_elem.text:
                     rating_container = ET.SubElement(programme, "rating")
                     value = ET.SubElement(rating_container, "value")
                     value.text = rating_elem.text
 
             # Org Air Date como date (fecha de estreno original)
-            org_air_date_elem = content.find(f"{ns}orgAirDate")
+            org_air_date_elem = content.find(f"{NS}orgAirDate")
             if org_air_date_elem is not None and org_air_date_elem.text:
                 org_date_text = org_air_date_elem.text.strip()
                 if org_date_text:
@@ -277,13 +305,13 @@ def build_xmltv(channels_data):
 
             # Poster del programa: Primera <image><url> en <images> DEL CONTENT (no del TV_CHANNEL)
             # Buscar específicamente en las <images> del <content> actual (programme)
-            content_images = content.findall(f"{ns}images/{ns}image")  # Sin .// para buscar directo en content
+            content_images = content.findall(f"{NS}images/{NS}image")  # Sin .// para buscar directo en content
             if not content_images:
                 # Fallback: Buscar descendientes si no está directo
-                content_images = content.findall(f".//{ns}images/{ns}image")
+                content_images = content.findall(f".//{NS}images/{NS}image")
             if content_images:
                 first_image = content_images[0]  # Primera imagen del content (debería ser BROWSE o similar, poster)
-                url_elem = first_image.find(f"{ns}url")
+                url_elem = first_image.find(f"{NS}url")
                 if url_elem is not None and url_elem.text:
                     poster_src = url_elem.text.strip()
                     if poster_src and "logo" not in poster_src.lower():  # Evitar logos accidentales
@@ -293,16 +321,28 @@ def build_xmltv(channels_data):
                         logger.debug(f"Imagen ignorada (posible logo): {poster_src}")
             else:
                 logger.debug(f"No se encontró <images> en content para canal {channel_id}")
+
+            yield programme
+
+def build_xmltv(channels_data):
+    if not channels_data:
+        logger.warning("No data to build XMLTV - skipping")
+        return False
+    
+    channels = {}
     
-    rough_string = ET.tostring(tv, encoding='unicode', method='xml')
-    reparsed = ET.fromstring(rough_string)
-    ET.indent(reparsed, space="  ", level=0)
-    tree = ET.ElementTree(reparsed)
-    tree.write(OUTPUT_FILE, encoding="utf-8", xml_declaration=True)
+    # Escritura incremental: mismo formato que ET.indent + tree.write, sin copias del documento
+    with open(OUTPUT_FILE, "w", encoding="utf-8", errors="xmlcharrefreplace") as f:
+        with XMLTVWriter(f, attrib={
+            "generator-info-name": "MVS Hub Multi-Channel Dynamic 24h",
+            "generator-info-url": "https://www.mvshub.com.mx/"
+        }, estilo="etree") as writer:
+            for elem in xmltv_elements(channels_data, channels):
+                writer.write(elem)
     
     num_channels = len(channels)
     total_programmes = sum(len(contents) for _, contents in channels_data if contents)
-    programmes_with_posters = sum(1 for _, contents in channels_data if contents for content in contents if content.findall(f".//{ns}images/{ns}image"))
+    programmes_with_posters = sum(1 for _, contents in channels_data if contents for content in contents if content.findall(f".//{NS}images/{NS}image"))
     logger.info(f"XMLTV generado: {OUTPUT_FILE} ({num_channels} canales, {total_programmes} programas)")
     logger.info(f"Programas con posters: {programmes_with_posters}")
     return True
@@ -330,13 +370,14 @@ def main(uuid):
     session = requests.Session()
     session.headers.update(HEADERS_EPG)
 
-    logger.info("=== TEST FETCH PARA CANAL 222 (debug) ===")
-    test_contents = fetch_channel_contents(222, date_from, date_to, session, uuid)
+    logger.info(f"=== TEST FETCH PARA CANAL {CANAL_PRUEBA} (debug) ===")
+    test_contents = fetch_channel_contents(CANAL_PRUEBA, date_from, date_to, session, uuid)
     if not test_contents:
-        logger.error("Test fetch para 222 falló (0 programas) - Revisa logs.")
+        logger.error(f"Test fetch para {CANAL_PRUEBA} falló (0 programas) - Revisa logs.")
+        ESTADO.invalidar()
         return False
     else:
-        logger.info(f"Test exitoso: {len(test_contents)} programas para 222 - Continuando con todos los canales.")
+        logger.info(f"Test exitoso: {len(test_contents)} programas para {CANAL_PRUEBA} - Continuando con todos los canales.")
 
     channels_data = []
     logger.info("=== DESCARGANDO TODOS LOS CANALES ===")
@@ -356,7 +397,7 @@ def main(uuid):
     return success
 
 if __name__ == "__main__":
-    uuid = asyncio.run(run_with_retries())
+    uuid = uuid_guardado() or asyncio.run(run_with_retries())
     if uuid:
         main(uuid)
     else:
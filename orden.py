@@ -0,0 +1,56 @@
+"""Orden canónico de la guía: canales por nombre (o ID) y programas por canal e inicio.
+
+Así el orden de salida no depende del orden de los feeds ni de cómo venga cada archivo, y un cambio
+pequeño arriba no reordena medio mxepg.xml. Cada feed se ordena por separado y los flujos ordenados
+se combinan con una mezcla k-way (heapq.merge), que es estable: a igual clave sale primero el feed
+anterior. Todo se ordena en memoria: la resolución de solapes ya necesita la guía entera cargada, así
+que volcar tramos a disco no bajaría el pico de memoria.
+"""
+import heapq
+
+from xmltv_time import parse_xmltv_time
+
+
+def clave_canal(elem):
+    """(nombre en minúsculas, id): el nombre es el primer display-name (ya con los mappings aplicados)."""
+    nombre = (elem.findtext('display-name') or '').strip()
+    return (nombre or elem.get('id') or '').casefold(), elem.get('id') or ''
+
+
+def ordenar_canales(canales):
+    return sorted(canales, key=clave_canal)
+
+
+def clave_programa(rangos):
+    """Función de clave para programas: posición del canal en `rangos` ({id: posición}), luego el
+    inicio. Los canales sin <channel> van al final por ID y los inicios ilegibles al final del canal."""
+    sin_canal = len(rangos)
+
+    def clave(elem):
+        channel_id = elem.get('channel') or ''
+        inicio = parse_xmltv_time(elem.get('start'))
+        return (rangos.get(channel_id, sin_canal), channel_id, inicio is None, inicio or 0)
+    return clave
+
+
+def ordenar(elementos, clave):
+    """Ordena los elementos por `clave` (sort estable, en memoria). Devuelve una lista de (clave, elemento)."""
+    return sorted(((clave(elem), elem) for elem in elementos), key=lambda fila: fila[0])
+
+
+def mezclar(flujos):
+    """Mezcla k-way de flujos ordenados de (clave, elemento); a igual clave respeta el orden de `flujos`."""
+    return (elem for _, elem in heapq.merge(*flujos, key=lambda fila: fila[0]))
+
+
+def ordenar_guia(canales, programas_por_feed):
+    """Canales y programas de la guía en orden canónico.
+
+    canales: lista de <channel>; programas_por_feed: listas de <programme>, una por feed, en el orden
+    de prioridad de los feeds (desempata a igual canal e inicio). Devuelve (canales ordenados,
+    iterador de programas).
+    """
+    canales = ordenar_canales(canales)
+    clave = clave_programa({c.get('id'): i for i, c in enumerate(canales)})
+    flujos = [ordenar(programas, clave) for programas in programas_por_feed]
+    return canales, mezclar(flujos)
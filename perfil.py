@@ -0,0 +1,194 @@
+"""Instrumentación opcional del merger: tiempos por etapa, pico de memoria y cProfile.
+
+Desactivado (por defecto) todas las llamadas son no-ops baratas. Activado (EPG_PERFIL=1 o --perfil):
+- etapa(nombre): etapas secuenciales del hilo principal; mide tiempo y pico de tracemalloc.
+- medir(nombre, **datos): sub-etapas (descarga/parseo de cada feed) que pueden correr en hilos del
+  pool; solo mide tiempo, porque el pico de tracemalloc es global al proceso.
+- registrar(nombre, segundos, **datos): sub-etapa cuyo tiempo ya midió el llamador (filtrado de un feed).
+- acumular(nombre, segundos): tiempo repartido entre feeds o llamadas cortas (mapping).
+El informe se guarda como JSON con guardar(); con cprofile=True además se vuelca un .pstats.
+"""
+import cProfile
+import json
+import os
+import platform
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+
+class Perfil:
+    def __init__(self, activo=False, cprofile=False):
+        self.activo = activo
+        self.cprofile = cprofile and activo
+        self.etapas = []
+        self.sub_etapas = []
+        self.acumulados = {}
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._profilers_hilos = []
+        self._inicio = None
+        self._profundidad = 0  # Etapas anidadas (p. ej. serialización dentro de 'shards')
+
+    def iniciar(self):
+        if not self.activo:
+            return
+        self._inicio = time.perf_counter()
+        tracemalloc.start()
+        if self.cprofile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def detener(self):
+        if not self.activo or self._inicio is None:
+            return
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.total = time.perf_counter() - self._inicio
+        self.memoria_pico_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    def etapa(self, nombre, **datos):
+        if not self.activo:
+            return nullcontext(datos)
+        return self._etapa(nombre, datos)
+
+    @contextmanager
+    def _etapa(self, nombre, datos):
+        # Solo la etapa exterior reinicia el pico; una anidada informa el pico de la exterior hasta ahí
+        if self._profundidad == 0:
+            tracemalloc.reset_peak()
+        self._profundidad += 1
+        actual_inicio = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        try:
+            yield datos  # El llamador puede completar datos (p. ej. tiempo de escritura)
+        finally:
+            self._profundidad -= 1
+            segundos = time.perf_counter() - inicio
+            actual, pico = tracemalloc.get_traced_memory()
+            self.etapas.append({
+                'etapa': nombre,
+                'nivel': self._profundidad,
+                'segundos': round(segundos, 4),
+                'memoria_pico_mb': round(pico / (1024 * 1024), 2),
+                'memoria_delta_mb': round((actual - actual_inicio) / (1024 * 1024), 2),
+                **datos,
+            })
+
+    def medir(self, nombre, **datos):
+        if not self.activo:
+            return nullcontext(datos)
+        return self._medir(nombre, datos)
+
+    @contextmanager
+    def _medir(self, nombre, datos):
+        inicio = time.perf_counter()
+        try:
+            yield datos  # El llamador puede completar datos (p. ej. número de programas)
+        finally:
+            self.registrar(nombre, time.perf_counter() - inicio, **datos)
+
+    def registrar(self, nombre, segundos, **datos):
+        """Anota una sub-etapa ya medida por el llamador (p. ej. el tiempo total de un FiltroMedido)."""
+        if not self.activo:
+            return
+        registro = {'etapa': nombre, 'segundos': round(segundos, 4),
+                    'hilo': threading.current_thread().name, **datos}
+        with self._lock:
+            self.sub_etapas.append(registro)
+
+    def perfilar_hilo(self):
+        """cProfile solo ve el hilo donde se activa: cada tarea del pool abre su propio perfil y al
+        guardar se suman todos al del hilo principal."""
+        if self._profiler is None:
+            return nullcontext()
+        return self._perfilar_hilo()
+
+    @contextmanager
+    def _perfilar_hilo(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._profilers_hilos.append(profiler)
+
+    def acumular(self, nombre, segundos):
+        if not self.activo:
+            return
+        with self._lock:
+            self.acumulados[nombre] = self.acumulados.get(nombre, 0.0) + segundos
+
+    def informe(self):
+        return {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'segundos_total': round(getattr(self, 'total', 0.0), 4),
+            'memoria_pico_mb': round(getattr(self, 'memoria_pico_mb', 0.0), 2),
+            'etapas': self.etapas,
+            'feeds': self.sub_etapas,
+            'acumulados_segundos': {k: round(v, 4) for k, v in self.acumulados.items()},
+        }
+
+    def guardar(self, base):
+        """Escribe <base>.perfil.json (y <base>.pstats con cProfile). Devuelve las rutas escritas."""
+        if not self.activo:
+            return []
+        rutas = [base + '.perfil.json']
+        with open(rutas[0], 'w', encoding='utf-8') as f:
+            json.dump(self.informe(), f, indent=2, ensure_ascii=False)
+        if self._profiler is not None:
+            rutas.append(base + '.pstats')
+            estadisticas = pstats.Stats(self._profiler)
+            for profiler in self._profilers_hilos:
+                estadisticas.add(profiler)
+            estadisticas.dump_stats(rutas[1])
+        return rutas
+
+
+class FiltroMedido:
+    """Envuelve un filtro de canales y acumula el tiempo de cada `id in filtro` (un feed, un hilo)."""
+
+    def __init__(self, filtro):
+        self._filtro = filtro
+        self.segundos = 0.0
+
+    def __contains__(self, channel_id):
+        inicio = time.perf_counter()
+        try:
+            return channel_id in self._filtro
+        finally:
+            self.segundos += time.perf_counter() - inicio
+
+    def __bool__(self):
+        return bool(self._filtro)
+
+    def __getattr__(self, nombre):
+        return getattr(self._filtro, nombre)
+
+
+class EscrituraMedida:
+    """File handle que acumula el tiempo pasado en write(), para separar escritura de serialización."""
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.segundos = 0.0
+
+    def write(self, texto):
+        inicio = time.perf_counter()
+        try:
+            return self._fh.write(texto)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+
+
+def base_informe(output_file):
+    """'mxepg.xml' -> 'mxepg' (el informe va junto al XML de salida)."""
+    base, extension = os.path.splitext(output_file)
+    return base if extension in ('.xml', '.gz') else output_file
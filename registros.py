@@ -0,0 +1,214 @@
+"""Registros compactos para los canales y programas que el merger retiene en memoria.
+
+Un Element de ElementTree (o de lxml) lleva su propio dict de atributos y su propia copia de cada
+texto; en una guía eso se repite miles de veces con los mismos valores (lang="es", IDs de canal,
+URLs de iconos, horas de inicio y las descripciones casi idénticas de mvshub.xml). Aquí cada nodo es
+un objeto con __slots__, sus atributos una tupla de pares (k, v) compartidos y sus hijos una tupla;
+los textos y los pares se internan, así que un valor repetido se guarda una sola vez.
+
+Los nodos imitan la parte de la API de Element que usa el merger (tag/text/tail, get/set/keys/items,
+attrib, iteración, find/findtext/findall/iter, append/remove/makeelement), así que filtros, mappings,
+solapes, orden, base, shards y servidor trabajan sobre ellos sin cambios. XMLTVWriter los escribe
+directamente en estilo 'minidom'; para el resto se materializan con a_elemento().
+
+Con cualquiera de los dos backends cada elemento se convierte al salir del parser y el original (con
+lxml, su subárbol ya desprendido de la raíz) se suelta. Convertir cuesta tiempo: con lxml el parseo
+tarda aproximadamente el doble que sin registros, a cambio de ~3,5 veces menos memoria. Con
+EPG_REGISTROS=0 se conservan los elementos del backend tal cual (más rápido con lxml, más memoria).
+"""
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import xml_backend
+
+# EPG_REGISTROS=0 desactiva la conversión (ver arriba)
+ACTIVOS = os.environ.get('EPG_REGISTROS', '1') != '0'
+
+# Tope de entradas de las tablas de pares y tuplas de atributos compartidos (en modo servidor el
+# proceso vive mucho: pasado el tope los valores nuevos simplemente no se comparten)
+MAX_COMPARTIDOS = 200_000
+
+_pares = {}
+_atributos = {}
+
+
+def _compartido(tabla, valor):
+    existente = tabla.get(valor)
+    if existente is not None:
+        return existente
+    if len(tabla) < MAX_COMPARTIDOS:
+        tabla[valor] = valor
+    return valor
+
+
+def _texto(texto):
+    return None if texto is None else sys.intern(texto)
+
+
+def _par(nombre, valor):
+    return _compartido(_pares, (sys.intern(nombre), sys.intern(valor)))
+
+
+def _tupla_atributos(items, compartir=True):
+    """Tupla de pares compartidos. Con compartir=True también se comparte la tupla entera (atributos de
+    los hijos: lang="es", el mismo icono...); la de un programa (start/stop) casi nunca se repite."""
+    if not items:
+        return ()
+    if compartir:
+        # Se busca con los pares tal como vienen del parser: la tupla es igual a la guardada
+        existente = _atributos.get(tuple(items))
+        if existente is not None:
+            return existente
+    tupla = tuple([_par(k, v) for k, v in items])
+    return _compartido(_atributos, tupla) if compartir else tupla
+
+
+class Nodo:
+    """Elemento XML compacto. Los hijos van en una tupla (en una lista si se crea con hijos=[],
+    como la raíz <tv> del merge, a la que se agregan miles)."""
+
+    __slots__ = ('tag', '_atributos', 'text', 'tail', '_hijos')
+
+    def __init__(self, tag, attrib=None, text=None, tail=None, hijos=()):
+        self.tag = sys.intern(tag)
+        self._atributos = _tupla_atributos(list((attrib or {}).items()), compartir=False)
+        self.text = _texto(text)
+        self.tail = _texto(tail)
+        self._hijos = hijos
+
+    @classmethod
+    def desde_elemento(cls, elem, compartir=True):
+        """Copia compacta de un Element (de ElementTree o lxml) y de todos sus descendientes."""
+        nodo = cls.__new__(cls)
+        nodo.tag = sys.intern(elem.tag)
+        nodo._atributos = _tupla_atributos(elem.items(), compartir)
+        texto, tail = elem.text, elem.tail
+        nodo.text = sys.intern(texto) if texto else texto
+        nodo.tail = sys.intern(tail) if tail else tail
+        nodo._hijos = tuple([_desde_elemento(hijo) for hijo in elem]) if len(elem) else ()
+        return nodo
+
+    def a_elemento(self):
+        """Element de ElementTree equivalente (para serializar con ET o guardar en la caché)."""
+        elem = ET.Element(self.tag, dict(self._atributos))
+        elem.text = self.text
+        elem.tail = self.tail
+        elem.extend(hijo.a_elemento() for hijo in self._hijos)
+        return elem
+
+    # --- Atributos ---
+    def get(self, nombre, default=None):
+        for k, v in self._atributos:
+            if k == nombre:
+                return v
+        return default
+
+    def set(self, nombre, valor):
+        par = _par(nombre, valor)
+        atributos = list(self._atributos)
+        for i, (k, _) in enumerate(atributos):
+            if k == nombre:
+                atributos[i] = par
+                break
+        else:
+            atributos.append(par)
+        self._atributos = tuple(atributos)
+
+    def keys(self):
+        return [k for k, _ in self._atributos]
+
+    def items(self):
+        return list(self._atributos)
+
+    @property
+    def attrib(self):
+        """Copia de los atributos como dict (modificarla no cambia el nodo: usar set())."""
+        return dict(self._atributos)
+
+    # --- Hijos ---
+    def __iter__(self):
+        return iter(self._hijos)
+
+    def __len__(self):
+        return len(self._hijos)
+
+    def __getitem__(self, indice):
+        return self._hijos[indice]
+
+    def append(self, hijo):
+        if isinstance(self._hijos, list):
+            self._hijos.append(hijo)
+        else:
+            self._hijos = self._hijos + (hijo,)
+
+    def remove(self, hijo):
+        hijos = list(self._hijos)
+        for i, actual in enumerate(hijos):
+            if actual is hijo:
+                del hijos[i]
+                break
+        else:
+            raise ValueError("Nodo.remove(x): x no es hijo de este nodo")
+        self._hijos = hijos if isinstance(self._hijos, list) else tuple(hijos)
+
+    def makeelement(self, tag, attrib):
+        return Nodo(tag, attrib)
+
+    def find(self, tag):
+        """Primer hijo directo con ese tag (solo nombres simples, como los usa el merger)."""
+        for hijo in self._hijos:
+            if hijo.tag == tag:
+                return hijo
+        return None
+
+    def findtext(self, tag, default=None):
+        hijo = self.find(tag)
+        if hijo is None:
+            return default
+        return hijo.text or ''
+
+    def findall(self, tag):
+        return [hijo for hijo in self._hijos if hijo.tag == tag]
+
+    def iter(self, tag=None):
+        if tag is None or self.tag == tag:
+            yield self
+        for hijo in self._hijos:
+            yield from hijo.iter(tag)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.tag} {dict(self._atributos)}>"
+
+
+class Canal(Nodo):
+    """<channel> retenido por el merge."""
+
+    __slots__ = ()
+
+
+class Programa(Nodo):
+    """<programme> retenido por el merge."""
+
+    __slots__ = ()
+
+
+_desde_elemento = Nodo.desde_elemento
+
+_CLASES = {'channel': Canal, 'programme': Programa}
+
+
+def registro(elem):
+    """Registro compacto de un <channel>/<programme> recién parseado (Canal, Programa o Nodo).
+    Con EPG_REGISTROS=0 se devuelve el propio elemento."""
+    if not ACTIVOS:
+        return elem
+    return _CLASES.get(elem.tag, Nodo).desde_elemento(elem, compartir=False)
+
+
+def raiz(tag='tv', attrib=None):
+    """Raíz a la que el merge agrega sus canales y programas (hijos en una lista; con EPG_REGISTROS=0,
+    un Element del backend)."""
+    if not ACTIVOS:
+        return xml_backend.Element(tag, attrib or {})
+    return Nodo(tag, attrib, hijos=[])
@@ -0,0 +1,131 @@
+"""Salida fragmentada de la guía: un XMLTV por día y/o por grupo de canales, más un manifiesto.
+
+Modos:
+- 'dia'        -> dia-YYYYMMDD.xml con los programas que empiezan ese día (en la zona `offset`)
+- 'grupo'      -> grupo-<nombre>.xml con todos los programas de los canales del grupo
+- 'dia+grupo'  -> grupo-<nombre>-YYYYMMDD.xml
+
+Cada shard lleva solo los <channel> que tienen programas en él, con el mismo formato que mxepg.xml.
+manifest.json lista cada shard con su rango de tiempo, canales, número de programas, tamaño y SHA-256,
+para que un cliente descargue solo lo que necesita y se salte lo que no cambió. Los shards de una
+ejecución anterior que ya no se generan se borran.
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+from xmltv_time import format_xmltv_time, parse_offset, parse_xmltv_time
+
+MODOS = ('dia', 'grupo', 'dia+grupo')
+GRUPO_POR_DEFECTO = 'otros'
+MANIFIESTO = 'manifest.json'
+
+
+def _nombre_seguro(texto):
+    """Nombre de grupo apto para un archivo ('Deportes MX' -> 'deportes-mx')."""
+    return re.sub(r'[^a-z0-9]+', '-', texto.lower()).strip('-') or GRUPO_POR_DEFECTO
+
+
+def _sha256(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def particionar(tv, modo, grupo_de=None, offset='+0000'):
+    """Reparte los programas de `tv` por shard. Devuelve ({nombre_shard: [programas]}, {id: <channel>}).
+
+    grupo_de(channel_id) -> nombre del grupo (None = GRUPO_POR_DEFECTO).
+    Los programas sin fecha legible van al shard 'sin-fecha' en los modos por día.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"Modo de shards desconocido: {modo} (usa uno de {MODOS})")
+    if parse_offset(offset) is None:
+        raise ValueError(f"Offset inválido para los shards por día: {offset!r} (formato +hhmm/-hhmm)")
+    canales = {}
+    shards = {}
+    grupos = {}
+    for elem in tv:
+        if elem.tag == 'channel':
+            canales[elem.get('id')] = elem
+            continue
+        if elem.tag != 'programme':
+            continue
+        partes = []
+        if modo in ('grupo', 'dia+grupo'):
+            channel_id = elem.get('channel')
+            grupo = grupos.get(channel_id)
+            if grupo is None:
+                grupo = grupos[channel_id] = _nombre_seguro((grupo_de and grupo_de(channel_id)) or GRUPO_POR_DEFECTO)
+            partes.append('grupo-' + grupo)
+        if modo in ('dia', 'dia+grupo'):
+            inicio = parse_xmltv_time(elem.get('start'))
+            partes.append('sin-fecha' if inicio is None else format_xmltv_time(inicio, offset)[:8])
+        if modo == 'dia':
+            partes[0] = 'dia-' + partes[0]
+        shards.setdefault('-'.join(partes), []).append(elem)
+    return shards, canales
+
+
+def escribir_shards(tv, directorio, modo, write_xmltv, grupo_de=None, offset='+0000',
+                    gzip_salida='no', gzip_nivel=9):
+    """Escribe los shards de `tv` en `directorio` y su manifest.json. Devuelve el manifiesto.
+
+    write_xmltv es la función del merger (mismo formato y opciones de gzip que la salida completa).
+    """
+    os.makedirs(directorio, exist_ok=True)
+    shards, canales = particionar(tv, modo, grupo_de, offset)
+    anteriores = set()
+    ruta_manifiesto = os.path.join(directorio, MANIFIESTO)
+    try:
+        with open(ruta_manifiesto, 'r', encoding='utf-8') as f:
+            anteriores = {archivo['archivo'] for shard in json.load(f).get('shards', [])
+                          for archivo in shard.get('archivos', [])}
+    except (OSError, ValueError):
+        pass
+
+    entradas = []
+    generados = set()
+    for nombre in sorted(shards):
+        programas = shards[nombre]
+        ids = list(dict.fromkeys(p.get('channel') for p in programas))
+        elementos = [canales[i] for i in ids if i in canales] + programas
+        _, archivos = write_xmltv(tv, os.path.join(directorio, nombre + '.xml'), gzip_salida, gzip_nivel,
+                                  elementos)
+        inicios = [t for t in (parse_xmltv_time(p.get('start')) for p in programas) if t is not None]
+        fines = [t for t in (parse_xmltv_time(p.get('stop')) for p in programas) if t is not None]
+        entrada = {
+            'shard': nombre,
+            'desde': format_xmltv_time(min(inicios), offset) if inicios else None,
+            'hasta': format_xmltv_time(max(fines), offset) if fines else None,
+            'canales': ids,
+            'programas': len(programas),
+            'archivos': [],
+        }
+        for ruta in archivos:
+            archivo = os.path.basename(ruta)
+            generados.add(archivo)
+            entrada['archivos'].append({'archivo': archivo, 'bytes': os.path.getsize(ruta), 'sha256': _sha256(ruta)})
+        entradas.append(entrada)
+
+    manifiesto = {
+        'generado': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'modo': modo,
+        'offset': offset,
+        'shards': entradas,
+    }
+    tmp = ruta_manifiesto + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, ruta_manifiesto)
+
+    for archivo in anteriores - generados:
+        try:
+            os.remove(os.path.join(directorio, archivo))
+        except FileNotFoundError:
+            pass
+    return manifiesto
@@ -0,0 +1,81 @@
+"""Reglas de filtrado de canales (channel_filter.py)."""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from channel_filter import ChannelFilter, cargar_filtros  # noqa: E402
+
+
+def conservados(filtro, ids):
+    return [channel_id for channel_id in ids if channel_id in filtro]
+
+
+class ChannelFilterTest(unittest.TestCase):
+
+    def test_id_exacto(self):
+        filtro = ChannelFilter(['12712', '306'])
+        self.assertEqual(conservados(filtro, ['12712', '1271', '306', None]), ['12712', '306'])
+
+    def test_prefijo_y_glob(self):
+        filtro = ChannelFilter(['Sky Sports *', 'I*.schedulesdirect.org', 'canal?.mx'])
+        ids = ['Sky Sports 1', 'Sky Sport', 'I123.json.schedulesdirect.org', 'X123.schedulesdirect.org',
+               'canal1.mx', 'canal12.mx']
+        self.assertEqual(conservados(filtro, ids),
+                         ['Sky Sports 1', 'I123.json.schedulesdirect.org', 'canal1.mx'])
+
+    def test_regex_cubre_el_id_completo(self):
+        filtro = ChannelFilter([r're:^Sky Sports \d+$', r're:ESPN\d'])
+        self.assertEqual(conservados(filtro, ['Sky Sports 16', 'Sky Sports HD', 'ESPN2', 'ESPN2.mx']),
+                         ['Sky Sports 16', 'ESPN2'])
+
+    def test_exclusiones(self):
+        filtro = ChannelFilter(['Sky*', '!Sky Sports 24', '!re:.*HD'])
+        self.assertEqual(conservados(filtro, ['Sky Sports 16', 'Sky Sports 24', 'Sky HD', 'Otro']),
+                         ['Sky Sports 16'])
+        # Solo exclusiones: pasa todo lo demás
+        self.assertEqual(conservados(ChannelFilter(['!306']), ['306', '307']), ['307'])
+
+    def test_sin_reglas_no_filtra(self):
+        self.assertFalse(ChannelFilter([]))
+        self.assertFalse(ChannelFilter(None))
+
+    def test_reglas_invalidas_y_advertencias(self):
+        for regla in ('', '  ', '!', 're:(', 3):
+            with self.assertRaises(ValueError):
+                ChannelFilter([regla])
+        filtro = ChannelFilter(['306', '306', '701,702', ' 12 '])
+        self.assertEqual(len(filtro.advertencias), 3)  # Duplicada, con coma y con espacios
+
+    def test_sin_coincidencia(self):
+        filtro = ChannelFilter(['306', 'Sky*', 're:ESPN\\d', '999'])
+        conservados(filtro, ['306', 'ESPN2'])
+        self.assertEqual(filtro.sin_coincidencia(), ['999', 'Sky*'])
+        filtro.marcar_vistos(['999'])
+        self.assertEqual(filtro.sin_coincidencia(), ['Sky*'])
+
+
+class CargarFiltrosTest(unittest.TestCase):
+
+    def test_reglas_con_nota_se_aplanan(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'filtros.json')
+            with open(ruta, 'w', encoding='utf-8') as f:
+                json.dump({'https://x/dish.xml': [{'id': '306', 'nota': 'Maria Vision'}, 'Sky*']}, f)
+            self.assertEqual(cargar_filtros(ruta), {'https://x/dish.xml': ['306', 'Sky*']})
+
+    def test_archivo_ausente_o_invalido_no_filtra(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'filtros.json')
+            self.assertEqual(cargar_filtros(ruta), {})
+            with open(ruta, 'w', encoding='utf-8') as f:
+                f.write('{"url": "306"}')
+            self.assertEqual(cargar_filtros(ruta), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Mappings de canales (channel_mapping.py) y su aplicación durante el merge (epg-merger.py)."""
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from channel_mapping import ChannelMapping  # noqa: E402
+
+
+def _cargar_merger():
+    """Importa epg-merger.py (el guion no es importable por nombre)."""
+    spec = importlib.util.spec_from_file_location('epg_merger', os.path.join(RAIZ, 'epg-merger.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+merger = _cargar_merger()
+
+
+def canal(channel_id, *nombres):
+    elem = ET.Element('channel', id=channel_id)
+    for nombre in nombres:
+        ET.SubElement(elem, 'display-name').text = nombre
+    return elem
+
+
+class ChannelMappingTest(unittest.TestCase):
+
+    def test_nombre_deja_un_solo_display_name(self):
+        mapping = ChannelMapping({'306': 'Maria Vision'})
+        elem = canal('306', 'MARIA', 'Maria HD')
+        self.assertEqual(mapping.canal(elem), '306')
+        self.assertEqual([dn.text for dn in elem.findall('display-name')], ['Maria Vision'])
+        self.assertEqual(mapping.renombrados, 1)
+
+    def test_remapeo_de_id_en_canal_y_programas(self):
+        mapping = ChannelMapping({'I123.sd.org': {'id': 'maria.mx', 'name': 'Maria Vision'}})
+        elem = canal('I123.sd.org', 'Otro')
+        self.assertEqual(mapping.id_final('I123.sd.org'), 'maria.mx')
+        self.assertEqual(mapping.canal(elem), 'maria.mx')
+        self.assertEqual(elem.get('id'), 'maria.mx')
+        programa = ET.Element('programme', channel='I123.sd.org')
+        mapping.programa(programa)
+        self.assertEqual(programa.get('channel'), 'maria.mx')
+        self.assertEqual((mapping.remapeados, mapping.programas_remapeados), (1, 1))
+
+    def test_sin_mapping_no_toca_el_canal(self):
+        mapping = ChannelMapping({'306': 'Maria Vision'})
+        elem = canal('999', 'Otro')
+        self.assertEqual(mapping.canal(elem), '999')
+        self.assertEqual(elem.findtext('display-name'), 'Otro')
+        self.assertEqual(mapping.id_final('999'), '999')
+        self.assertEqual(mapping.sin_mapping, 1)
+
+    def test_grupo_y_advertencias(self):
+        mapping = ChannelMapping({'a': {'id': 'b', 'group': 'Deportes'}, 'b': {'id': 'c'}, 'x': {'nombre': 'X'},
+                                  'y': 3})
+        self.assertEqual(mapping.grupos, {'b': 'Deportes'})
+        self.assertEqual(len(mapping.advertencias), 3)  # Clave desconocida, valor no válido y encadenado
+
+
+class FusionDeAliasTest(unittest.TestCase):
+    """Dos feeds con IDs distintos para el mismo canal quedan bajo un solo ID con merge_epg_feeds."""
+
+    FEED_A = ('<tv><channel id="a.306"><display-name>A</display-name></channel>'
+              '<programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="a.306">'
+              '<title>Uno</title></programme></tv>')
+    FEED_B = ('<tv><channel id="b.306"><display-name>B</display-name></channel>'
+              '<channel id="b.999"><display-name>Otro</display-name></channel>'
+              '<programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="b.306">'
+              '<title>Uno</title></programme>'
+              '<programme start="20260101010000 +0000" stop="20260101020000 +0000" channel="b.306">'
+              '<title>Dos</title></programme></tv>')
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.urls = []
+        for nombre, contenido in (('a.xml', self.FEED_A), ('b.xml', self.FEED_B)):
+            ruta = os.path.join(self.directorio.name, nombre)
+            with open(ruta, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+            self.urls.append(ruta)
+        # Sin cachés, pool ni ventana; cada URL es directamente su archivo local
+        self.originales = {nombre: getattr(merger, nombre) for nombre in (
+            'local_filename_for', 'HTTP_CACHE_DIR', 'FEED_CACHE_DIR', 'PROCESOS_PARSEO',
+            'VENTANA_HORAS_ATRAS', 'VENTANA_HORAS_ADELANTE')}
+        merger.local_filename_for = lambda url: url
+        merger.HTTP_CACHE_DIR = merger.FEED_CACHE_DIR = ''
+        merger.PROCESOS_PARSEO = '0'
+        merger.VENTANA_HORAS_ATRAS = merger.VENTANA_HORAS_ADELANTE = None
+
+    def tearDown(self):
+        for nombre, valor in self.originales.items():
+            setattr(merger, nombre, valor)
+        self.directorio.cleanup()
+
+    def test_alias_fusionados_bajo_el_id_destino(self):
+        mapping = ChannelMapping({'a.306': {'id': 'maria.mx', 'name': 'Maria Vision'}, 'b.306': {'id': 'maria.mx'}})
+        tv = merger.merge_epg_feeds(self.urls, mapping)
+        canales = [c.get('id') for c in tv if c.tag == 'channel']
+        programas = [(p.get('channel'), p.findtext('title')) for p in tv if p.tag == 'programme']
+        self.assertEqual(canales, ['maria.mx', 'b.999'])
+        self.assertEqual(tv[0].findtext('display-name'), 'Maria Vision')  # Gana el primer feed
+        # El "Uno" repetido del segundo feed es un duplicado exacto bajo el mismo ID
+        self.assertEqual(programas, [('maria.mx', 'Uno'), ('maria.mx', 'Dos')])
+        self.assertEqual((mapping.fusionados, mapping.renombrados, mapping.sin_mapping), (1, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Delta entre guías consecutivas (delta.py): calcular() y aplicar() de ida y vuelta."""
+import os
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import delta  # noqa: E402
+
+ANTERIOR = """<?xml version="1.0" encoding="UTF-8"?>
+<tv generator-info-name="prueba">
+  <channel id="c1"><display-name>Uno</display-name></channel>
+  <channel id="c2"><display-name>Dos</display-name></channel>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="c1"><title>A</title></programme>
+  <programme start="20260101010000 +0000" stop="20260101020000 +0000" channel="c1"><title>B</title></programme>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="c2"><title>C</title></programme>
+</tv>
+"""
+
+NUEVA = """<tv>
+  <channel id="c1"><display-name>Uno</display-name></channel>
+  <channel id="c3"><display-name>Tres</display-name></channel>
+  <programme channel="c1" stop="20260101010000 +0000" start="20260101000000 +0000">
+    <title>A</title>
+  </programme>
+  <programme start="20260101010000 +0000" stop="20260101020000 +0000" channel="c1"><title>B (repetición)</title></programme>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="c3"><title>D</title></programme>
+</tv>
+"""
+
+
+class DeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.ruta_anterior = self.ruta('anterior.xml')
+        with open(self.ruta_anterior, 'w', encoding='utf-8') as f:
+            f.write(ANTERIOR)
+        self.nuevos = list(ET.fromstring(NUEVA))
+        fuentes = {'c3': 'feed-b', 'c1|20260101010000 +0000': 'feed-a'}
+        self.anterior = delta.huellas_archivo(self.ruta_anterior)
+        self.nuevo, xml = delta.huellas(self.nuevos, fuentes, con_xml=True)
+        self.cambios = delta.calcular(self.anterior, self.nuevo, xml, {'generator-info-name': 'prueba'})
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def ruta(self, nombre):
+        return os.path.join(self.directorio.name, nombre)
+
+    def test_clasifica_por_clave_sin_depender_del_formato(self):
+        canales, programas = self.cambios['canales'], self.cambios['programas']
+        self.assertEqual(list(canales['añadidos']), ['c3'])
+        self.assertEqual(canales['eliminados'], ['c2'])
+        self.assertEqual(canales['modificados'], {})
+        # El programa A solo cambia de sangría y orden de atributos: no es una modificación
+        self.assertEqual(list(programas['modificados']), ['c1|20260101010000 +0000'])
+        self.assertEqual(list(programas['añadidos']), ['c3|20260101000000 +0000'])
+        self.assertEqual(programas['eliminados'], ['c2|20260101000000 +0000'])
+        self.assertEqual(self.cambios['resumen']['programas']['sin_cambios'], 1)
+        self.assertEqual(self.cambios['por_fuente']['feed-a'], {'añadidos': 0, 'modificados': 1, 'eliminados': 0})
+
+    def test_aplicar_reconstruye_la_guia_nueva(self):
+        salida = self.ruta('resultado.xml')
+        self.assertEqual(delta.aplicar(self.ruta_anterior, self.cambios, salida), 5)
+        self.assertEqual(delta.huellas_archivo(salida)['version'], self.nuevo['version'])
+        with open(salida, encoding='utf-8') as f:
+            self.assertIn('B (repetición)', f.read())
+
+    def test_aplicar_sobre_otra_base_falla(self):
+        otra = self.ruta('otra.xml')
+        with open(otra, 'w', encoding='utf-8') as f:
+            f.write(ANTERIOR.replace('<title>C</title>', '<title>C2</title>'))
+        with self.assertRaises(ValueError):
+            delta.aplicar(otra, self.cambios, self.ruta('resultado.xml'))
+
+    def test_sin_cambios_delta_vacio(self):
+        anterior, xml = delta.huellas(list(ET.fromstring(ANTERIOR)), con_xml=True)
+        cambios = delta.calcular(self.anterior, anterior, xml)
+        self.assertEqual(cambios['base'], cambios['version'])
+        for tipo in ('canales', 'programas'):
+            self.assertEqual(cambios['resumen'][tipo]['añadidos'] + cambios['resumen'][tipo]['modificados']
+                             + cambios['resumen'][tipo]['eliminados'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Caché de resultados filtrados por feed (feed_cache.py) y su uso en parse_archivo_feed (epg-merger.py)."""
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import xml_backend  # noqa: E402
+from channel_filter import ChannelFilter  # noqa: E402
+from feed_cache import FeedCache  # noqa: E402
+
+
+def _cargar_merger():
+    """Importa epg-merger.py (el guion no es importable por nombre)."""
+    spec = importlib.util.spec_from_file_location('epg_merger', os.path.join(RAIZ, 'epg-merger.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+merger = _cargar_merger()
+
+FEED = """<tv>
+  <channel id="c1"><display-name>Uno</display-name></channel>
+  <channel id="c2"><display-name>Dos</display-name></channel>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="c1"><title>A</title></programme>
+  <programme start="20260105000000 +0000" stop="20260105010000 +0000" channel="c1"><title>B</title></programme>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="c2"><title>C</title></programme>
+</tv>
+"""
+
+
+def serializados(resultado):
+    canales, programas = resultado
+    return [xml_backend.tostring(elem) for elem in canales + programas]
+
+
+class FeedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.feed = os.path.join(self.directorio.name, 'feed.xml')
+        self.escribir_feed(FEED)
+        self.cache = FeedCache(os.path.join(self.directorio.name, 'cache'), 1)
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def escribir_feed(self, contenido):
+        with open(self.feed, 'w', encoding='utf-8') as f:
+            f.write(contenido)
+
+    def test_clave_cambia_con_contenido_filtro_y_version(self):
+        clave = self.cache.clave(self.feed, ['c1', 'c2'])
+        self.assertEqual(self.cache.clave(self.feed, ['c2', 'c1']), clave)  # El orden de las reglas da igual
+        self.assertNotEqual(self.cache.clave(self.feed, ['c1']), clave)
+        self.assertNotEqual(self.cache.clave(self.feed, None), clave)
+        self.assertNotEqual(FeedCache(self.cache.directorio, 2).clave(self.feed, ['c1', 'c2']), clave)
+        self.escribir_feed(FEED.replace('<title>A</title>', '<title>A2</title>'))
+        self.assertNotEqual(self.cache.clave(self.feed, ['c1', 'c2']), clave)
+
+    def test_recarga_el_mismo_resultado(self):
+        filtro = ChannelFilter(['c1'])
+        primero = merger.parse_archivo_feed(self.feed, filtro, self.cache)
+        clave = self.cache.clave(self.feed, ['c1'])
+        self.assertIsNotNone(self.cache.ruta_si_existe(clave))
+        segundo = merger.parse_archivo_feed(self.feed, ChannelFilter(['c1']), self.cache)
+        self.assertEqual(serializados(segundo), serializados(primero))
+        self.assertEqual([c.get('id') for c in segundo[0]], ['c1'])
+
+    def test_la_ventana_se_aplica_al_recargar(self):
+        merger.parse_archivo_feed(self.feed, None, self.cache)
+        desde = 1767225600  # 2026-01-01 00:00 UTC
+        canales, programas = merger.parse_archivo_feed(self.feed, None, self.cache, (desde, desde + 86400))
+        self.assertEqual(len(canales), 2)
+        self.assertEqual([p.findtext('title') for p in programas], ['A', 'C'])
+
+    def test_purgar_borra_solo_las_entradas_sin_uso(self):
+        vieja, nueva = self.cache.clave(self.feed, ['c1']), self.cache.clave(self.feed, ['c2'])
+        self.cache.guardar_serializado(vieja, b'<tv/>')
+        self.cache.guardar_serializado(nueva, b'<tv/>')
+        hace_un_mes = time.time() - 30 * 24 * 3600
+        os.utime(self.cache.ruta_si_existe(vieja), (hace_un_mes, hace_un_mes))
+        self.assertEqual(self.cache.purgar(), 1)
+        self.assertIsNone(self.cache.ruta_si_existe(vieja))
+        self.assertIsNotNone(self.cache.ruta_si_existe(nueva))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Parseo de feeds en disco (feed_parser.py) y en el pool de procesos del merger (epg-merger.py)."""
+import gzip
+import importlib.util
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import xml_backend  # noqa: E402
+from channel_filter import ChannelFilter  # noqa: E402
+from feed_parser import iterparse_feed, parsear_serializado, recolectar_feed  # noqa: E402
+
+
+def _cargar_merger():
+    """Importa epg-merger.py (el guion no es importable por nombre)."""
+    spec = importlib.util.spec_from_file_location('epg_merger', os.path.join(RAIZ, 'epg-merger.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+merger = _cargar_merger()
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<tv generator-info-name="prueba">
+  <channel id="Sky Sports 1"><display-name>Sky 1</display-name></channel>
+  <channel id="Sky Sports 2"><display-name>Sky 2</display-name></channel>
+  <channel id="306"><display-name>Maria &amp; Vision</display-name></channel>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="Sky Sports 1"><title>A</title></programme>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="Sky Sports 2"><title>B</title></programme>
+  <programme start="20260101000000 +0000" stop="20260101010000 +0000" channel="306"><title>C &lt;en vivo&gt;</title></programme>
+</tv>
+"""
+REGLAS = ['Sky*', '!Sky Sports 2', '306']
+
+
+def serializados(resultado):
+    canales, programas = resultado
+    return [xml_backend.tostring(elem) for elem in canales + programas]
+
+
+class FeedParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.feed = os.path.join(self.directorio.name, 'feed.xml')
+        with open(self.feed, 'w', encoding='utf-8') as f:
+            f.write(FEED)
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def directo(self, reglas=REGLAS):
+        with open(self.feed, 'rb') as f:
+            return recolectar_feed(f, ChannelFilter(reglas) if reglas else None)
+
+    def test_serializado_equivale_al_parseo_directo(self):
+        datos, vistos, segundos = parsear_serializado(self.feed, REGLAS)
+        self.assertEqual(serializados(recolectar_feed(io.BytesIO(datos), None)), serializados(self.directo()))
+        self.assertEqual(vistos, ['Sky Sports 1', '306'])
+        self.assertEqual(segundos, 0.0)  # Sin medir_filtro no se mide nada
+        self.assertGreater(parsear_serializado(self.feed, REGLAS, medir_filtro=True)[2], 0.0)
+
+    def test_sin_reglas_conserva_todo(self):
+        datos, vistos, _ = parsear_serializado(self.feed)
+        self.assertEqual(len(vistos), 3)
+        self.assertEqual(serializados(recolectar_feed(io.BytesIO(datos), None)), serializados(self.directo(None)))
+
+    def test_entrada_comprimida(self):
+        comprimido = self.feed + '.gz'
+        with open(self.feed, 'rb') as origen, gzip.open(comprimido, 'wb') as destino:
+            destino.write(origen.read())
+        self.assertEqual(parsear_serializado(comprimido, REGLAS)[0], parsear_serializado(self.feed, REGLAS)[0])
+
+    def test_raiz_que_no_es_tv(self):
+        with self.assertRaises(ValueError):
+            list(iterparse_feed(io.BytesIO(b'<guia><channel id="x"/></guia>')))
+
+    def test_pool_de_procesos_da_el_mismo_resultado(self):
+        minimo = merger.PROCESOS_MIN_BYTES
+        merger.PROCESOS_MIN_BYTES = 0  # El feed de prueba es diminuto
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as procesos:
+                filtro = ChannelFilter(REGLAS)
+                resultado = merger.parse_archivo_feed(self.feed, filtro, procesos=procesos)
+        finally:
+            merger.PROCESOS_MIN_BYTES = minimo
+        self.assertEqual(serializados(resultado), serializados(self.directo()))
+        self.assertEqual(filtro.sin_coincidencia(), [])  # Los IDs vistos en el trabajador cuentan
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Fusión incremental de las ventanas del grid de dish (MezclaEPG en fetchdish-28hrs.py)."""
+import importlib.util
+import os
+import random
+import sys
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from channel_filter import ChannelFilter  # noqa: E402
+
+HAY_PLAYWRIGHT = importlib.util.find_spec('playwright') is not None
+
+
+def _cargar_fetchdish():
+    """Importa fetchdish-28hrs.py (el guion no es importable por nombre; necesita playwright)."""
+    spec = importlib.util.spec_from_file_location('fetchdish', os.path.join(RAIZ, 'fetchdish-28hrs.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def ventanas_aleatorias(semilla, num_ventanas=5):
+    """JSON del grid por ventana: canales en distinto orden y eventos que se repiten entre ventanas."""
+    r = random.Random(semilla)
+    ventanas = []
+    for ventana in range(num_ventanas):
+        canales = []
+        for cid in r.sample(['c1', 'c2', 'c3', 'c4', ''], r.randint(1, 5)):
+            eventos = [{'startTime': f'2026-01-01T{h:02d}:00:00Z', 'program': {'title': f'{cid}-{h}-v{ventana}'}}
+                       for h in r.sample(range(ventana * 4, ventana * 4 + 10), r.randint(0, 6))]
+            if eventos and r.random() < 0.2:
+                eventos.append({'startTime': '', 'program': {}})
+            canales.append({'channelId': cid, 'callSign': f'{cid}-v{ventana}',
+                            'thumbnail': f'//img/{cid}?w=55', 'events': eventos})
+        ventanas.append({'channels': canales})
+    return ventanas
+
+
+def fusion_referencia(fetchdish, ventanas, filtro=None):
+    """Todas las ventanas en orden, de una vez: gana la primera aparición de cada canal y de cada inicio."""
+    canales = {}
+    for data in ventanas:
+        for channel in data['channels']:
+            cid = channel['channelId']
+            if not cid or (filtro is not None and cid not in filtro):
+                continue
+            chdata = canales.setdefault(cid, {'callSign': channel['callSign'],
+                                              'thumbnail': fetchdish._thumbnail_canal(channel['thumbnail']),
+                                              'events': {}})
+            for event in channel['events']:
+                if event['startTime']:
+                    chdata['events'].setdefault(event['startTime'], event)
+    return {cid: {**chdata, 'events': [chdata['events'][k] for k in sorted(chdata['events'])]}
+            for cid, chdata in canales.items()}
+
+
+@unittest.skipUnless(HAY_PLAYWRIGHT, "fetchdish-28hrs.py necesita playwright")
+class MezclaEPGTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fetchdish = _cargar_fetchdish()
+
+    def test_igual_que_fusionar_en_orden_aunque_lleguen_desordenadas(self):
+        for semilla in range(200):
+            ventanas = ventanas_aleatorias(semilla)
+            llegada = list(enumerate(ventanas))
+            random.Random(semilla).shuffle(llegada)
+            mezcla = self.fetchdish.MezclaEPG()
+            for ventana, data in llegada:
+                mezcla.agregar(ventana, data)
+            esperado = fusion_referencia(self.fetchdish, ventanas)
+            self.assertEqual(mezcla.canales(), esperado, semilla)
+            self.assertEqual(list(mezcla.canales()), list(esperado), semilla)  # Mismo orden de canales
+
+    def test_merge_epg_data_en_orden(self):
+        ventanas = ventanas_aleatorias(7)
+        self.assertEqual(self.fetchdish.merge_epg_data(ventanas), fusion_referencia(self.fetchdish, ventanas))
+
+    def test_filtro_descarta_antes_de_guardar(self):
+        ventanas = ventanas_aleatorias(3)
+        filtro = ChannelFilter(['c1', 'c3'])
+        mezcla = self.fetchdish.MezclaEPG(filtro)
+        for ventana, data in reversed(list(enumerate(ventanas))):
+            mezcla.agregar(ventana, data)
+        self.assertEqual(mezcla.canales(), fusion_referencia(self.fetchdish, ventanas, filtro))
+        self.assertEqual(mezcla.canales(completa=True), mezcla.canales())  # Los descartados no se guardaron
+        self.assertTrue(mezcla.descartados <= {'c2', 'c4'})
+
+    def test_conservar_descartados_para_la_guia_completa(self):
+        ventanas = ventanas_aleatorias(5)
+        mezcla = self.fetchdish.MezclaEPG(ChannelFilter(['c1']), conservar_descartados=True)
+        for ventana, data in enumerate(ventanas):
+            mezcla.agregar(ventana, data)
+        self.assertEqual(mezcla.canales(completa=True), fusion_referencia(self.fetchdish, ventanas))
+        self.assertEqual(set(mezcla.canales()), {'c1'} & set(mezcla.canales(completa=True)))
+
+
+if __name__ == '__main__':
+    unittest.main()
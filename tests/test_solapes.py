@@ -0,0 +1,82 @@
+"""Resolución de solapes del merger (resolver_solapes en epg-merger.py)."""
+import importlib.util
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _cargar_merger():
+    """Importa epg-merger.py (el guion no es importable por nombre)."""
+    spec = importlib.util.spec_from_file_location('epg_merger', os.path.join(RAIZ, 'epg-merger.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+merger = _cargar_merger()
+
+PRIORIDADES = {'a': 0, 'b': 1, 'c': 2}
+
+
+def programa(fuente, inicio, fin, canal='c1'):
+    """(fuente, <programme>) entre dos horas "HHMM" del mismo día."""
+    elem = ET.Element('programme', start=f'20260101{inicio}00 +0000', stop=f'20260101{fin}00 +0000', channel=canal)
+    return fuente, elem
+
+
+def intervalos(resultado):
+    return sorted((fuente, elem.get('start')[8:12], elem.get('stop')[8:12]) for fuente, elem in resultado)
+
+
+class ResolverSolapesTest(unittest.TestCase):
+
+    def test_un_recorte_previo_no_invierte_prioridades(self):
+        programas = [programa('b', '0000', '0020'), programa('c', '0010', '0030'), programa('a', '0015', '0018')]
+        resultado, informe = merger.resolver_solapes(programas, PRIORIDADES, 'recortar')
+        self.assertEqual(intervalos(resultado), [('a', '0015', '0018'), ('b', '0000', '0015'), ('c', '0018', '0030')])
+        self.assertNotIn('a', informe)
+
+    def test_descartar_respeta_la_prioridad_mas_alta(self):
+        programas = [programa('b', '0000', '0020'), programa('c', '0010', '0030'), programa('a', '0015', '0018')]
+        resultado, informe = merger.resolver_solapes(programas, PRIORIDADES, 'descartar')
+        self.assertEqual(intervalos(resultado), [('a', '0015', '0018')])
+        self.assertEqual(informe['b']['descartados'], 1)
+        self.assertEqual(informe['c']['descartados'], 1)
+
+    def test_programa_contenido_conserva_el_tramo_anterior(self):
+        programas = [programa('b', '0000', '0030'), programa('a', '0010', '0020')]
+        resultado, informe = merger.resolver_solapes(programas, PRIORIDADES, 'recortar')
+        self.assertEqual(intervalos(resultado), [('a', '0010', '0020'), ('b', '0000', '0010')])
+        self.assertEqual(informe['b']['recortados'], 1)
+
+    def test_a_igual_prioridad_gana_el_que_empieza_despues(self):
+        programas = [programa('a', '0000', '0030'), programa('a', '0020', '0040')]
+        resultado, _ = merger.resolver_solapes(programas, PRIORIDADES, 'recortar')
+        self.assertEqual(intervalos(resultado), [('a', '0000', '0020'), ('a', '0020', '0040')])
+
+    def test_duplicado_exacto_conserva_la_fuente_prioritaria(self):
+        programas = [programa('c', '0000', '0030'), programa('a', '0000', '0030'), programa('b', '0010', '0020')]
+        resultado, informe = merger.resolver_solapes(programas, PRIORIDADES, 'recortar')
+        self.assertEqual(intervalos(resultado), [('a', '0000', '0030')])
+        self.assertEqual(informe['c']['duplicados'], 1)
+        self.assertEqual(informe['b']['descartados'], 1)
+
+    def test_duracion_cero_no_recorta_a_otros(self):
+        programas = [programa('a', '0010', '0010'), programa('b', '0000', '0030'), programa('c', '0020', '0020')]
+        resultado, informe = merger.resolver_solapes(programas, PRIORIDADES, 'recortar')
+        self.assertEqual(intervalos(resultado), [('a', '0010', '0010'), ('b', '0000', '0030')])
+        self.assertEqual(informe['c']['descartados'], 1)
+
+    def test_canales_distintos_no_se_tocan(self):
+        programas = [programa('b', '0000', '0030', 'c1'), programa('a', '0010', '0020', 'c2')]
+        resultado, informe = merger.resolver_solapes(programas, PRIORIDADES, 'recortar')
+        self.assertEqual(len(resultado), 2)
+        self.assertEqual(informe, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Backend XML compartido por los scripts: lxml si está instalado, ElementTree si no.
+
+Se elige una sola vez al importar (EPG_XML_BACKEND = auto | lxml | etree, por defecto auto):
+- lxml: iterparse y parse en C, con huge_tree (nodos de texto enormes en guías grandes) y, con
+  EPG_XML_RECUPERAR=1, recuperación de XML mal formado (p. ej. entidades sin escapar en un título).
+  La recuperación es opcional porque también "acepta" descargas cortadas a medias.
+- etree: xml.etree.ElementTree de la librería estándar (comportamiento de siempre).
+
+Los elementos que devuelve cada backend tienen la misma API básica (get/set/find/iter/text/tail),
+así que el resto del código no cambia. tostring() acepta elementos de cualquiera de los dos (y los
+registros de registros.py), y a_etree() convierte uno de lxml o un registro a ElementTree cuando
+hace falta la serialización exacta de ET (XMLTVWriter en estilo 'etree').
+"""
+import os
+import xml.etree.ElementTree as ET
+
+_PEDIDO = os.environ.get('EPG_XML_BACKEND', 'auto').lower()
+RECUPERAR = os.environ.get('EPG_XML_RECUPERAR', '') == '1'
+
+if _PEDIDO not in ('auto', 'lxml', 'etree'):
+    raise ValueError(f"EPG_XML_BACKEND desconocido: {_PEDIDO} (usa auto, lxml o etree)")
+
+lxml_etree = None
+if _PEDIDO != 'etree':
+    try:
+        from lxml import etree as lxml_etree
+    except ImportError:
+        if _PEDIDO == 'lxml':
+            raise
+
+if lxml_etree is not None:
+    NOMBRE = 'lxml'
+    ParseError = (ET.ParseError, lxml_etree.XMLSyntaxError)
+    _OPCIONES = dict(huge_tree=True, recover=RECUPERAR, remove_comments=True, remove_pis=True,
+                     resolve_entities=False)
+    _PARSER = lxml_etree.XMLParser(**_OPCIONES)
+
+    def iterparse(fuente, events=('end',)):
+        return lxml_etree.iterparse(fuente, events=events, **_OPCIONES)
+
+    def parse(fuente):
+        return lxml_etree.parse(fuente, _PARSER)
+
+    def fromstring(datos):
+        return lxml_etree.fromstring(datos, _PARSER)
+
+    Element = lxml_etree.Element
+    SubElement = lxml_etree.SubElement
+else:
+    NOMBRE = 'etree'
+    ParseError = (ET.ParseError,)
+
+    def iterparse(fuente, events=('end',)):
+        return ET.iterparse(fuente, events=events)
+
+    def parse(fuente):
+        return ET.parse(fuente)
+
+    def fromstring(datos):
+        return ET.fromstring(datos)
+
+    Element = ET.Element
+    SubElement = ET.SubElement
+
+
+def es_etree(elem):
+    """True si `elem` es un Element de la librería estándar."""
+    return isinstance(elem, ET.Element)
+
+
+def tostring(elem, encoding='unicode'):
+    """Serializa un elemento (de cualquiera de los dos backends o un registro) con su tail, como ET.tostring."""
+    if hasattr(elem, 'a_elemento'):
+        elem = elem.a_elemento()
+    if es_etree(elem):
+        return ET.tostring(elem, encoding=encoding)
+    if encoding == 'unicode':
+        return lxml_etree.tostring(elem, encoding='unicode', with_tail=True)
+    return lxml_etree.tostring(elem, encoding=encoding, xml_declaration=False, with_tail=True)
+
+
+def a_etree(elem):
+    """Copia un elemento de lxml o un registro como Element de ElementTree (los de ET se devuelven tal cual)."""
+    if es_etree(elem):
+        return elem
+    if hasattr(elem, 'a_elemento'):
+        return elem.a_elemento()
+    copia = ET.fromstring(lxml_etree.tostring(elem, encoding='utf-8', with_tail=False))
+    copia.tail = elem.tail
+    return copia
@@ -0,0 +1,108 @@
+"""Conversión de fechas XMLTV ("YYYYMMDDhhmmss +hhmm") a segundos epoch con aritmética entera.
+
+Evita construir objetos datetime por programa: el merger compara miles de start/stop por ejecución.
+"""
+import os
+import time
+
+
+def _dias_desde_epoch(anio, mes, dia):
+    """Días entre 1970-01-01 y la fecha dada (calendario gregoriano proléptico, algoritmo de H. Hinnant)."""
+    anio -= mes <= 2
+    era = anio // 400
+    yoe = anio - era * 400
+    doy = (153 * (mes + (-3 if mes > 2 else 9)) + 2) // 5 + dia - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def parse_offset(offset):
+    """'+0300' / '-0500' -> segundos (con signo); None si el formato no es válido."""
+    if len(offset) != 5 or offset[0] not in '+-' or not offset[1:].isdigit():
+        return None
+    segundos = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    return -segundos if offset[0] == '-' else segundos
+
+
+def parse_xmltv_time(valor):
+    """Convierte una fecha XMLTV en segundos epoch UTC (int), o None si no se puede interpretar.
+
+    Acepta 'YYYYMMDDhhmm[ss]' con zona opcional '+hhmm'/'-hhmm' (sin zona se asume UTC).
+    """
+    if not valor:
+        return None
+    partes = valor.split()
+    fecha = partes[0]
+    if len(partes) == 1 and len(fecha) > 14 and fecha[14] in '+-':
+        partes = [fecha[:14], fecha[14:]]  # Zona pegada a la fecha: '20251018093000+0000'
+        fecha = partes[0]
+    if len(fecha) < 12 or not fecha[:14].isdigit():
+        return None
+    try:
+        anio = int(fecha[0:4])
+        mes = int(fecha[4:6])
+        dia = int(fecha[6:8])
+        hora = int(fecha[8:10])
+        minuto = int(fecha[10:12])
+        segundo = int(fecha[12:14]) if len(fecha) >= 14 else 0
+    except ValueError:
+        return None
+    if not (1 <= mes <= 12 and 1 <= dia <= 31):
+        return None
+    offset = 0
+    if len(partes) > 1:
+        offset = parse_offset(partes[1])
+        if offset is None:
+            return None
+    return _dias_desde_epoch(anio, mes, dia) * 86400 + hora * 3600 + minuto * 60 + segundo - offset
+
+
+def format_xmltv_time(epoch, offset='+0000'):
+    """Segundos epoch UTC -> fecha XMLTV expresada en la zona `offset` (p. ej. '-0300')."""
+    desplazamiento = parse_offset(offset) or 0
+    return time.strftime('%Y%m%d%H%M%S', time.gmtime(epoch + desplazamiento)) + ' ' + offset
+
+
+def offset_de(valor, por_defecto='+0000'):
+    """Zona horaria de una fecha XMLTV ('+0000' si no trae)."""
+    partes = (valor or '').split()
+    if len(partes) > 1 and parse_offset(partes[1]) is not None:
+        return partes[1]
+    return por_defecto
+
+
+def horas_env(nombre, por_defecto):
+    """Horas de la variable de entorno `nombre` (o `por_defecto`); '' = None, sin límite."""
+    valor = os.environ.get(nombre, por_defecto)
+    return float(valor) if valor != '' else None
+
+
+def horas_ventana_env():
+    """(horas atrás, horas adelante) de la ventana de programas, compartida por el merger y los scripts
+    de extracción: EPG_VENTANA_ATRAS / EPG_VENTANA_ADELANTE (vacías o sin definir = sin límite)."""
+    return horas_env('EPG_VENTANA_ATRAS', ''), horas_env('EPG_VENTANA_ADELANTE', '')
+
+
+def ventana_desde_ahora(horas_atras, horas_adelante, ahora=None):
+    """Ventana (desde, hasta) en segundos epoch alrededor de `ahora`; un límite None queda abierto."""
+    ahora = int(time.time() if ahora is None else ahora)
+    desde = ahora - int(horas_atras * 3600) if horas_atras is not None else None
+    hasta = ahora + int(horas_adelante * 3600) if horas_adelante is not None else None
+    return desde, hasta
+
+
+def en_ventana(start, stop, ventana):
+    """True si el programa [start, stop) toca la ventana (desde, hasta).
+
+    Los programas con fechas ilegibles se conservan: no hay forma segura de descartarlos.
+    """
+    desde, hasta = ventana
+    if desde is not None:
+        fin = parse_xmltv_time(stop)
+        if fin is not None and fin <= desde:
+            return False
+    if hasta is not None:
+        inicio = parse_xmltv_time(start)
+        if inicio is not None and inicio >= hasta:
+            return False
+    return True
@@ -0,0 +1,209 @@
+"""Escritor XMLTV incremental compartido por los fetchers y el merger.
+
+Escribe los <channel>/<programme> uno a uno en un file handle, sin construir ni re-parsear el
+documento completo, y reproduce byte a byte los formatos que generaba cada script:
+
+- estilo 'minidom': igual que ``minidom.toprettyxml(indent="  ")`` (dish.xml). Con ``limpiar=True``
+  además quita líneas vacías y espacios finales, como el antiguo pretty_xml de epg-merger.py (mxepg.xml).
+- estilo 'etree': igual que ``ElementTree.write(..., xml_declaration=True)`` (nxt-plus.xml) y, con
+  ``indent``, igual que pasar antes por ``ET.indent`` (mvshub.xml). Los elementos de lxml se
+  convierten antes a ElementTree para que la serialización sea exactamente la de ET.
+
+Uso:
+    with open('dish.xml', 'w', encoding='utf-8') as f:
+        with XMLTVWriter(f) as writer:
+            for elem in elementos:
+                writer.write(elem)
+"""
+import xml.etree.ElementTree as ET
+
+from xml_backend import a_etree
+
+ESTILOS = ('minidom', 'etree')
+
+
+def _escape_minidom(data):
+    """Escapado de minidom._write_data (Python 3.10/3.11): también escapa comillas en texto."""
+    if '&' in data:
+        data = data.replace('&', '&amp;')
+    if '<' in data:
+        data = data.replace('<', '&lt;')
+    if '"' in data:
+        data = data.replace('"', '&quot;')
+    if '>' in data:
+        data = data.replace('>', '&gt;')
+    return data
+
+
+def _escape_attrib_etree(data):
+    """Escapado de atributos de ElementTree."""
+    if '&' in data:
+        data = data.replace('&', '&amp;')
+    if '<' in data:
+        data = data.replace('<', '&lt;')
+    if '>' in data:
+        data = data.replace('>', '&gt;')
+    if '"' in data:
+        data = data.replace('"', '&quot;')
+    if '\r' in data:
+        data = data.replace('\r', '&#13;')
+    if '\n' in data:
+        data = data.replace('\n', '&#10;')
+    if '\t' in data:
+        data = data.replace('\t', '&#09;')
+    return data
+
+
+def _normalizar_texto(text):
+    """El round-trip tostring -> parseString convertía los fin de línea \\r y \\r\\n del texto en \\n."""
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def _minidom_nodes(elem):
+    """Nodos hijos tal como los vería minidom: texto propio, y cada hijo seguido de su tail."""
+    nodos = []
+    if elem.text:
+        nodos.append(_normalizar_texto(elem.text))
+    for child in elem:
+        nodos.append(child)
+        if child.tail:
+            nodos.append(_normalizar_texto(child.tail))
+    return nodos
+
+
+def _write_minidom(partes, elem, indent, addindent='  ', newl='\n'):
+    """Réplica de minidom.Element.writexml sobre un Element de ElementTree."""
+    partes.append(indent + '<' + elem.tag)
+    for nombre, valor in elem.items():
+        partes.append(' %s="%s"' % (nombre, _escape_minidom(valor)))
+    nodos = _minidom_nodes(elem)
+    if not nodos:
+        partes.append('/>' + newl)
+        return
+    partes.append('>')
+    if len(nodos) == 1 and isinstance(nodos[0], str):
+        partes.append(_escape_minidom(nodos[0]))
+    else:
+        partes.append(newl)
+        hijo_indent = indent + addindent
+        for nodo in nodos:
+            if isinstance(nodo, str):
+                partes.append(_escape_minidom(hijo_indent + nodo + newl))
+            else:
+                _write_minidom(partes, nodo, hijo_indent, addindent, newl)
+        partes.append(indent)
+    partes.append('</%s>%s' % (elem.tag, newl))
+
+
+def _limpiar_lineas(texto):
+    """Quita líneas vacías (solo espacios) y espacios finales, línea por línea."""
+    lineas = [linea.rstrip() for linea in texto.split('\n') if linea.strip()]
+    return ''.join(linea + '\n' for linea in lineas)
+
+
+class XMLTVWriter:
+    """Escribe un documento <tv> elemento a elemento.
+
+    - fh: file handle de texto abierto por el llamador.
+    - attrib: atributos de la raíz <tv> (p. ej. generator-info-name).
+    - estilo: 'minidom' o 'etree' (ver docstring del módulo).
+    - indent: sangría por nivel; en estilo 'etree' None significa sin sangría (se respetan los tails).
+    - limpiar: solo estilo 'minidom'; filtra líneas vacías y espacios finales como pretty_xml del merger.
+
+    La etiqueta de apertura de <tv> se difiere hasta el primer elemento para poder emitir <tv/>
+    cuando no hay contenido, igual que los serializadores originales.
+    """
+
+    def __init__(self, fh, attrib=None, estilo='minidom', indent='  ', limpiar=False):
+        if estilo not in ESTILOS:
+            raise ValueError(f"Estilo desconocido: {estilo} (usa uno de {ESTILOS})")
+        self.fh = fh
+        self.attrib = dict(attrib or {})
+        self.estilo = estilo
+        self.indent = indent
+        self.limpiar = limpiar
+        self.elementos = 0
+        self._pendiente = None  # estilo 'etree' con sangría: el tail depende de si hay un siguiente
+        self._cerrado = False
+        self._escribir_declaracion()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def _emitir(self, texto):
+        if self.limpiar:
+            texto = _limpiar_lineas(texto)
+        self.fh.write(texto)
+
+    def _escribir_declaracion(self):
+        if self.estilo == 'minidom':
+            self._emitir('<?xml version="1.0" ?>\n')
+        else:
+            self.fh.write("<?xml version='1.0' encoding='utf-8'?>\n")
+
+    def _apertura_raiz(self, vacia):
+        if self.estilo == 'minidom':
+            atributos = ''.join(' %s="%s"' % (k, _escape_minidom(v)) for k, v in self.attrib.items())
+            return '<tv' + atributos + ('/>\n' if vacia else '>\n')
+        atributos = ''.join(' %s="%s"' % (k, _escape_attrib_etree(v)) for k, v in self.attrib.items())
+        return '<tv' + atributos + (' />' if vacia else '>')
+
+    def write(self, elem):
+        """Escribe un elemento de primer nivel (<channel>, <programme>, ...) con su tail."""
+        if self.elementos == 0:
+            self._emitir(self._apertura_raiz(vacia=False))
+        self.elementos += 1
+
+        if self.estilo == 'minidom':
+            partes = []
+            _write_minidom(partes, elem, self.indent)
+            if elem.tail:
+                partes.append(_escape_minidom(self.indent + _normalizar_texto(elem.tail) + '\n'))
+            self._emitir(''.join(partes))
+        elif self.indent is None:
+            self.fh.write(ET.tostring(a_etree(elem), encoding='unicode'))
+        else:
+            if self._pendiente is None:
+                self.fh.write('\n' + self.indent)  # text de la raíz tras ET.indent
+            else:
+                self._escribir_indentado(self._pendiente, '\n' + self.indent)
+            self._pendiente = a_etree(elem)
+
+    def _escribir_indentado(self, elem, tail):
+        """Equivalente a ET.indent aplicado al documento completo, para un hijo de la raíz.
+
+        También normaliza los fin de línea del texto como lo hacía el round-trip tostring -> fromstring.
+        """
+        for nodo in elem.iter():
+            if nodo.text:
+                nodo.text = _normalizar_texto(nodo.text)
+            if nodo.tail and nodo is not elem:
+                nodo.tail = _normalizar_texto(nodo.tail)
+        ET.indent(elem, space=self.indent, level=1)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = tail
+        else:
+            elem.tail = _normalizar_texto(elem.tail)
+        self.fh.write(ET.tostring(elem, encoding='unicode'))
+
+    def close(self):
+        """Cierra la raíz <tv>. Idempotente."""
+        if self._cerrado:
+            return
+        self._cerrado = True
+        if self.elementos == 0:
+            self._emitir(self._apertura_raiz(vacia=True))
+            return
+        if self._pendiente is not None:
+            self._escribir_indentado(self._pendiente, '\n')
+            self._pendiente = None
+        if self.estilo == 'minidom':
+            self._emitir('</tv>\n')
+        else:
+            self.fh.write('</tv>')